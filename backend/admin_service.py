@@ -4,36 +4,190 @@ Handles admin dashboard analytics and user management
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from models import User, Subscription, Expense, Group, PlanType, SubscriptionStatus
-from datetime import datetime, timedelta
-from typing import Dict, List
+from sqlalchemy import func, and_, or_, event
+from models import User, Subscription, Expense, Group, PlanType, SubscriptionStatus, AdminMetricsSnapshot
+from rollup_service import month_key
+from database import SessionLocal
+from sqlite_writer import run_write
+from cache import TTLCache
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import json
+import os
+import threading
+import time
+
+# (email_prefix, plan, status) -> {"total", "counted_at"}. Totals may lag new
+# signups by up to the TTL; that is the price of not counting on every page.
+USER_COUNT_TTL = int(os.environ.get("ADMIN_USER_COUNT_TTL", 300))
+user_count_cache = TTLCache(maxsize=256, ttl=USER_COUNT_TTL)
+
+METRICS_REFRESH_SECONDS = int(os.environ.get("ADMIN_METRICS_REFRESH_SECONDS", 300))
+# One day of history at the default interval
+METRICS_SNAPSHOTS_KEPT = 288
+
+# Totals kept current between snapshots: model -> (section, field) in the analytics payload
+LIVE_COUNTERS = {
+    User: ("subscription_stats", "total_users"),
+    Expense: ("feature_usage", "total_expenses"),
+    Group: ("feature_usage", "total_groups"),
+}
+PENDING_KEY = "admin_metric_deltas"
+
+
+class MetricCounters:
+    """
+    Net rows created per counted model, bucketed by commit time (100 ms
+    buckets). Reads sum the buckets after a snapshot started counting, so any
+    worker can bring any snapshot up to date. Only this process's writes are
+    seen; the next snapshot picks up everyone else's.
+    """
+    
+    BUCKETS_PER_SECOND = 10
+
+    def __init__(self, retention_seconds: int):
+        self.retention_seconds = retention_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def add(self, deltas: Dict[str, int]) -> None:
+        now = int(time.time() * self.BUCKETS_PER_SECOND)
+        oldest = now - self.retention_seconds * self.BUCKETS_PER_SECOND
+        with self._lock:
+            self._buckets.setdefault(now, Counter()).update(deltas)
+            for bucket in [b for b in self._buckets if b < oldest]:
+                del self._buckets[bucket]
+
+    def since(self, epoch: float) -> Counter:
+        # Buckets strictly after the one counting started in, so nothing is counted twice
+        start = int(epoch * self.BUCKETS_PER_SECOND)
+        total = Counter()
+        with self._lock:
+            for bucket, deltas in self._buckets.items():
+                if bucket > start:
+                    total.update(deltas)
+        return total
+
+
+metric_counters = MetricCounters(retention_seconds=METRICS_REFRESH_SECONDS * 3)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_metric_deltas(session, flush_context):
+    # new/deleted still show the pre-flush state here
+    pending = session.info.setdefault(PENDING_KEY, Counter())
+    for obj in session.new:
+        if type(obj) in LIVE_COUNTERS:
+            pending[type(obj).__name__] += 1
+    for obj in session.deleted:
+        if type(obj) in LIVE_COUNTERS:
+            pending[type(obj).__name__] -= 1
+
+
+def count_bulk_rows(db: Session, model, delta: int) -> None:
+    """
+    Count rows written by a Core statement (e.g. a bulk insert), which the
+    flush listener above never sees; published with the session's commit
+    """
+    if delta and model in LIVE_COUNTERS:
+        db.info.setdefault(PENDING_KEY, Counter())[model.__name__] += delta
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_metric_deltas(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        metric_counters.add(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_metric_deltas(session):
+    session.info.pop(PENDING_KEY, None)
 
 
 class AdminService:
     """Service for admin dashboard and analytics"""
     
     @staticmethod
-    def get_all_users(db: Session, skip: int = 0, limit: int = 100) -> List[Dict]:
-        """Get all users with subscription info"""
-        users = db.query(User).offset(skip).limit(limit).all()
-        
-        result = []
-        for user in users:
-            subscription = db.query(Subscription).filter(
-                Subscription.user_id == user.id
-            ).first()
-            
-            result.append({
-                "id": user.id,
-                "email": user.email,
-                "is_admin": user.is_admin,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "plan_type": subscription.plan_type.value if subscription else "free",
-                "subscription_status": subscription.status.value if subscription else "active"
-            })
-        
-        return result
+    def _user_filters(query, email_prefix: Optional[str], plan: Optional[PlanType],
+                      status: Optional[SubscriptionStatus]):
+        """Apply the listing filters to a query that outer-joins Subscription"""
+        if email_prefix:
+            # Range on the email index instead of LIKE, which most collations can't index
+            upper = email_prefix[:-1] + chr(ord(email_prefix[-1]) + 1)
+            query = query.filter(User.email >= email_prefix, User.email < upper)
+        # Users without a subscription row are on an active FREE plan
+        if plan is not None:
+            condition = Subscription.plan_type == plan
+            if plan == PlanType.FREE:
+                condition = or_(condition, Subscription.id.is_(None))
+            query = query.filter(condition)
+        if status is not None:
+            condition = Subscription.status == status
+            if status == SubscriptionStatus.ACTIVE:
+                condition = or_(condition, Subscription.id.is_(None))
+            query = query.filter(condition)
+        return query
+    
+    @staticmethod
+    def count_users(db: Session, email_prefix: Optional[str] = None, plan: Optional[PlanType] = None,
+                    status: Optional[SubscriptionStatus] = None) -> Dict:
+        """
+        Matching user count from a cache refreshed every USER_COUNT_TTL seconds,
+        so paging through the listing never runs COUNT(*) per page
+        """
+        key = (email_prefix or None, plan, status)
+        cached = user_count_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        query = db.query(func.count(User.id))
+        if plan is not None or status is not None:
+            query = query.outerjoin(Subscription, Subscription.user_id == User.id)
+        total = AdminService._user_filters(query, email_prefix, plan, status).scalar()
+        
+        cached = {"total": total or 0, "counted_at": datetime.utcnow().isoformat()}
+        user_count_cache.set(key, cached)
+        return cached
+    
+    @staticmethod
+    def get_users_page(db: Session, limit: int = 100, after: Optional[int] = None,
+                       email_prefix: Optional[str] = None, plan: Optional[PlanType] = None,
+                       status: Optional[SubscriptionStatus] = None) -> Dict:
+        """
+        One page of users with their subscription, in id order. Pass the
+        returned next_cursor as after for the following page.
+        """
+        query = db.query(
+            User.id, User.email, User.is_admin, User.created_at,
+            Subscription.plan_type, Subscription.status
+        ).outerjoin(Subscription, Subscription.user_id == User.id)
+        query = AdminService._user_filters(query, email_prefix, plan, status)
+        if after is not None:
+            query = query.filter(User.id > after)
+        
+        # One extra row tells us whether another page exists
+        rows = query.order_by(User.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        users = [
+            {
+                "id": user_id,
+                "email": email,
+                "is_admin": is_admin,
+                "created_at": created_at.isoformat() if created_at else None,
+                "plan_type": plan_type.value if plan_type else "free",
+                "subscription_status": sub_status.value if sub_status else "active"
+            }
+            for user_id, email, is_admin, created_at, plan_type, sub_status in rows
+        ]
+        
+        return {
+            "items": users,
+            "next_cursor": users[-1]["id"] if has_more else None
+        }
     
     @staticmethod
     def get_subscription_stats(db: Session) -> Dict:
@@ -114,11 +268,11 @@ class AdminService:
         six_months_ago = now - timedelta(days=180)
         
         monthly_expenses = db.query(
-            func.strftime('%Y-%m', Expense.date).label('month'),
+            Expense.month_key,
             func.count(Expense.id).label('count')
         ).filter(
-            Expense.date >= six_months_ago.date()
-        ).group_by('month').order_by('month').all()
+            Expense.month_key >= month_key(six_months_ago)
+        ).group_by(Expense.month_key).order_by(Expense.month_key).all()
         
         return {
             "total_expenses": total_expenses or 0,
@@ -154,3 +308,104 @@ class AdminService:
             },
             "generated_at": now.isoformat()
         }
+    
+    # ==================== METRICS SNAPSHOT ====================
+    
+    @staticmethod
+    def refresh_metrics_snapshot(db: Session) -> AdminMetricsSnapshot:
+        """Run the full analytics once and store the result as the latest snapshot"""
+        started = time.perf_counter()
+        computed_at = datetime.utcnow()
+        analytics = AdminService.get_system_analytics(db)
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        # Only the insert and prune take the write lock, not the aggregation above
+        return run_write(db, lambda session: AdminService._store_snapshot(
+            session, computed_at, duration_ms, analytics
+        ))
+    
+    @staticmethod
+    def _store_snapshot(db: Session, computed_at: datetime, duration_ms: float, analytics: Dict) -> AdminMetricsSnapshot:
+        snapshot = AdminMetricsSnapshot(
+            computed_at=computed_at,
+            duration_ms=duration_ms,
+            payload=json.dumps(analytics)
+        )
+        db.add(snapshot)
+        db.flush()
+        db.query(AdminMetricsSnapshot).filter(
+            AdminMetricsSnapshot.id <= snapshot.id - METRICS_SNAPSHOTS_KEPT
+        ).delete(synchronize_session=False)
+        db.commit()
+        return snapshot
+    
+    @staticmethod
+    def get_latest_snapshot(db: Session) -> Optional[AdminMetricsSnapshot]:
+        return db.query(AdminMetricsSnapshot).order_by(AdminMetricsSnapshot.id.desc()).first()
+    
+    @staticmethod
+    def get_metrics(db: Session) -> Dict:
+        """
+        The latest analytics snapshot (one primary-key lookup), with the cheap
+        totals advanced by the writes this process has seen since it was taken
+        """
+        snapshot = AdminService.get_latest_snapshot(db)
+        if snapshot is None:
+            snapshot = AdminService.refresh_metrics_snapshot(db)
+        metrics_refresher.ensure_started()
+        
+        analytics = json.loads(snapshot.payload)
+        snapshot_epoch = snapshot.computed_at.replace(tzinfo=timezone.utc).timestamp()
+        deltas = metric_counters.since(snapshot_epoch)
+        for model, (section, field) in LIVE_COUNTERS.items():
+            analytics[section][field] += deltas.get(model.__name__, 0)
+        
+        analytics["freshness"] = {
+            "snapshot_at": snapshot.computed_at.isoformat(),
+            "age_seconds": round(max(0.0, time.time() - snapshot_epoch), 1),
+            "refresh_interval_seconds": METRICS_REFRESH_SECONDS,
+            "compute_ms": snapshot.duration_ms
+        }
+        return analytics
+
+
+class MetricsRefresher:
+    """Daemon thread that refreshes the metrics snapshot once it is older than the interval"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.refreshes = 0
+    
+    def ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="admin-metrics", daemon=True)
+            self._thread.start()
+    
+    def refresh_if_stale(self) -> bool:
+        # Every worker runs a refresher; whichever finds the snapshot stale first refreshes it
+        db = SessionLocal()
+        try:
+            latest = AdminService.get_latest_snapshot(db)
+            if latest and datetime.utcnow() - latest.computed_at < timedelta(seconds=self.interval):
+                return False
+            AdminService.refresh_metrics_snapshot(db)
+            self.refreshes += 1
+            return True
+        finally:
+            db.close()
+    
+    def _run(self):
+        while True:
+            try:
+                self.refresh_if_stale()
+            except Exception as e:
+                print(f"⚠️  Admin metrics refresh failed: {e}")
+            time.sleep(self.interval / 4)
+
+
+metrics_refresher = MetricsRefresher(METRICS_REFRESH_SECONDS)
@@ -0,0 +1,165 @@
+"""
+Aggregate Snapshot
+Loads a user's rollups, income, budgets and balances in one pass so several
+services can be answered from memory within a single request
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from models import ExpenseRollup, Income, Budget, Asset, Liability
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Months of history loaded; every dashboard service looks back at most six
+SNAPSHOT_MONTHS = 12
+
+SESSION_KEY = "aggregate_snapshot"
+
+
+def as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class AggregateSnapshot:
+    """
+    Read-only copy of the aggregates the analytics services query.
+
+    Attach it to a session and the read helpers in RollupService,
+    IncomeService, AssetService, LiabilityService and BudgetService answer
+    from it instead of issuing their own queries. Windows that start before
+    the snapshot fall through to SQL.
+    """
+
+    def __init__(self, db: Session, user_id: int, months: int = SNAPSHOT_MONTHS):
+        self.user_id = user_id
+        self.start_date = date.today().replace(day=1) - relativedelta(months=months)
+        self.start_month = self.start_date.strftime('%Y-%m')
+
+        self.rollups = db.query(
+            ExpenseRollup.category,
+            ExpenseRollup.year_month,
+            ExpenseRollup.total,
+            ExpenseRollup.txn_count,
+            ExpenseRollup.sum_squares
+        ).filter(
+            ExpenseRollup.user_id == user_id,
+            ExpenseRollup.year_month >= self.start_month,
+            ExpenseRollup.txn_count > 0
+        ).order_by(ExpenseRollup.year_month, ExpenseRollup.category).all()
+
+        # One row per (day, category), in order of first appearance so category
+        # breakdowns keep the order the row-by-row query would give
+        self.incomes = db.query(
+            Income.date,
+            Income.category,
+            func.sum(Income.amount)
+        ).filter(
+            Income.user_id == user_id,
+            Income.date >= self.start_date
+        ).group_by(Income.date, Income.category).order_by(func.min(Income.id)).all()
+
+        self.budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
+
+        self.assets_by_category = {
+            category: float(total) for category, total in db.query(
+                Asset.category, func.sum(Asset.value)
+            ).filter(Asset.user_id == user_id).group_by(Asset.category).order_by(Asset.category)
+        }
+        self.liabilities_by_category = {
+            category: float(total) for category, total in db.query(
+                Liability.category, func.sum(Liability.amount)
+            ).filter(Liability.user_id == user_id).group_by(Liability.category).order_by(Liability.category)
+        }
+
+    # ==================== SESSION BINDING ====================
+
+    def attach(self, db: Session) -> None:
+        db.info[SESSION_KEY] = self
+
+    @staticmethod
+    def detach(db: Session) -> None:
+        db.info.pop(SESSION_KEY, None)
+
+    @staticmethod
+    def active(db: Session, user_id: int) -> Optional["AggregateSnapshot"]:
+        """The snapshot attached to db, if it belongs to user_id"""
+        snapshot = db.info.get(SESSION_KEY)
+        if snapshot is not None and snapshot.user_id == user_id:
+            return snapshot
+        return None
+
+    def covers_month(self, start_month: str) -> bool:
+        return start_month >= self.start_month
+
+    def covers_date(self, start_date) -> bool:
+        return start_date is not None and as_date(start_date) >= self.start_date
+
+    # ==================== ROLLUPS ====================
+
+    def _rollup_window(self, start_month: str, end_month: Optional[str]):
+        for row in self.rollups:
+            if row[1] >= start_month and (not end_month or row[1] <= end_month):
+                yield row
+
+    def get_total(self, start_month: str, end_month: Optional[str] = None) -> float:
+        return float(sum(total for _, _, total, _, _ in self._rollup_window(start_month, end_month)))
+
+    def get_category_totals(self, start_month: str, end_month: Optional[str] = None) -> Dict[str, Dict]:
+        totals = defaultdict(lambda: {"total": 0.0, "count": 0})
+        for category, _, total, count, _ in self._rollup_window(start_month, end_month):
+            totals[category]["total"] += float(total)
+            totals[category]["count"] += int(count)
+        return {category: totals[category] for category in sorted(totals)}
+
+    def get_monthly_totals(self, start_month: str, end_month: Optional[str] = None) -> List[Tuple[str, float]]:
+        months = defaultdict(float)
+        for _, month, total, _, _ in self._rollup_window(start_month, end_month):
+            months[month] += float(total)
+        return sorted(months.items())
+
+    def get_category_monthly_totals(self, start_month: str, end_month: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        return [
+            (category, month, float(total))
+            for category, month, total, _, _ in self._rollup_window(start_month, end_month)
+        ]
+
+    def get_amount_stats(self, start_month: str, end_month: Optional[str] = None) -> Tuple[int, float, float]:
+        count, total, sum_squares = 0, 0.0, 0.0
+        for _, _, row_total, row_count, row_squares in self._rollup_window(start_month, end_month):
+            count += int(row_count)
+            total += float(row_total)
+            sum_squares += float(row_squares)
+        if count == 0:
+            return 0, 0.0, 0.0
+        mean = total / count
+        variance = max(0.0, sum_squares / count - mean * mean)
+        return count, mean, float(np.sqrt(variance))
+
+    # ==================== INCOME ====================
+
+    def _income_window(self, start_date, end_date):
+        start_date = as_date(start_date)
+        end_date = as_date(end_date) if end_date else None
+        for income_date, category, amount in self.incomes:
+            if income_date >= start_date and (end_date is None or income_date <= end_date):
+                yield category, float(amount)
+
+    def get_total_income(self, start_date, end_date=None) -> float:
+        return float(sum(amount for _, amount in self._income_window(start_date, end_date)))
+
+    def get_income_by_category(self, start_date, end_date=None) -> List[Dict]:
+        category_totals = {}
+        for category, amount in self._income_window(start_date, end_date):
+            category_totals[category] = category_totals.get(category, 0) + amount
+        return [{"category": cat, "amount": amt} for cat, amt in category_totals.items()]
+
+    # ==================== BALANCES ====================
+
+    def get_total_assets(self) -> float:
+        return sum(self.assets_by_category.values())
+
+    def get_total_liabilities(self) -> float:
+        return sum(self.liabilities_by_category.values())
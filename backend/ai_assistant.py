@@ -2,11 +2,11 @@
 AI-powered spending assistant that analyzes user's expense data
 and provides personalized financial advice.
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from models import Expense, Budget
+from models import Budget
+from rollup_service import RollupService, month_key
 import random
 
 class AISpendingAssistant:
@@ -51,35 +51,21 @@ class AISpendingAssistant:
         now = datetime.now()
         current_month_start = now.replace(day=1)
         last_month_start = current_month_start - relativedelta(months=1)
-        last_month_end = current_month_start - timedelta(days=1)
         
         # Current month expenses by category
-        current_expenses = db.query(
-            Expense.category,
-            func.sum(Expense.amount).label('total'),
-            func.count(Expense.id).label('count')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= current_month_start
-        ).group_by(Expense.category).all()
+        current_expenses = RollupService.get_category_totals(db, user_id, month_key(current_month_start))
         
         # Last month expenses
-        last_expenses = db.query(
-            Expense.category,
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= last_month_start,
-            Expense.date <= last_month_end
-        ).group_by(Expense.category).all()
+        last_month = month_key(last_month_start)
+        last_expenses = RollupService.get_category_totals(db, user_id, last_month, last_month)
         
         # Budgets
         budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
         
         # Process data
-        current_dict = {cat: {'total': float(total), 'count': count} 
-                       for cat, total, count in current_expenses}
-        last_dict = {cat: float(total) for cat, total in last_expenses}
+        current_dict = {cat: {'total': data['total'], 'count': data['count']}
+                       for cat, data in current_expenses.items()}
+        last_dict = {cat: data['total'] for cat, data in last_expenses.items()}
         budget_dict = {b.category: b.amount for b in budgets}
         
         total_current = sum(item['total'] for item in current_dict.values())
@@ -1,6 +1,7 @@
 import re
 import os
 import pickle
+from typing import List
 
 # Try to import joblib, but don't fail if not available
 try:
@@ -69,6 +70,20 @@ class AICategorizer:
         # Fallback to keyword matching
         return cls._predict_with_keywords(note)
     
+    @classmethod
+    def predict_categories(cls, notes: List[str]) -> List[str]:
+        """Predict categories for a batch of notes with a single model call."""
+        model = cls._load_model()
+        if model is not None:
+            texts = [note for note in notes if note]
+            try:
+                predictions = iter(model.predict(texts) if texts else [])
+                return [next(predictions) if note else "Misc" for note in notes]
+            except Exception as e:
+                print(f"⚠️  ML prediction failed: {e}, falling back to keywords")
+        
+        return [cls._predict_with_keywords(note) if note else "Misc" for note in notes]
+    
     @classmethod
     def _predict_with_keywords(cls, note: str) -> str:
         """Fallback keyword-based prediction."""
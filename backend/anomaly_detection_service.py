@@ -4,9 +4,12 @@ Detects unusual spending patterns and transactions
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from models import Expense
+from rollup_service import RollupService, month_key
+from services import BudgetService
+from ledger_snapshot import get_ledger
 from datetime import datetime, timedelta
+from collections import defaultdict
 from dateutil.relativedelta import relativedelta
 from typing import Dict, List
 import numpy as np
@@ -21,42 +24,36 @@ class AnomalyDetectionService:
         Detect transactions with unusual amounts using Z-score
         """
         end_date = datetime.now()
-        start_date = end_date - relativedelta(months=months)
+        start_date = (end_date - relativedelta(months=months)).replace(day=1)
         
-        # Get all expenses
-        expenses = db.query(Expense).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date()
-        ).all()
+        # Z-scores for the whole window in one pass over the ledger columns
+        ids, _, z_scores = get_ledger(db, user_id).zscores(start_date)
         
-        if len(expenses) < 10:
+        if len(ids) < 10:
             return []
         
-        amounts = [e.amount for e in expenses]
-        mean_amount = np.mean(amounts)
-        std_amount = np.std(amounts)
-        
-        if std_amount == 0:
+        # Flag if Z-score > 2.5 (unusual); only flagged rows are read back
+        flagged = np.abs(z_scores) > 2.5
+        if not flagged.any():
             return []
         
+        flagged_z = dict(zip(ids[flagged].tolist(), z_scores[flagged].tolist()))
+        expenses = db.query(Expense).filter(Expense.id.in_(list(flagged_z))).order_by(Expense.id).all()
+        
         anomalies = []
         
         for expense in expenses:
-            # Calculate Z-score
-            z_score = (expense.amount - mean_amount) / std_amount
-            
-            # Flag if Z-score > 2.5 (unusual)
-            if abs(z_score) > 2.5:
-                anomalies.append({
-                    "id": expense.id,
-                    "amount": expense.amount,
-                    "category": expense.category,
-                    "date": expense.date.isoformat(),
-                    "note": expense.note,
-                    "z_score": round(z_score, 2),
-                    "reason": f"Amount is {abs(round(z_score, 1))}x standard deviations from average",
-                    "severity": "high" if abs(z_score) > 3 else "medium"
-                })
+            z_score = flagged_z[expense.id]
+            anomalies.append({
+                "id": expense.id,
+                "amount": expense.amount,
+                "category": expense.category,
+                "date": expense.date.isoformat(),
+                "note": expense.note,
+                "z_score": round(z_score, 2),
+                "reason": f"Amount is {abs(round(z_score, 1))}x standard deviations from average",
+                "severity": "high" if abs(z_score) > 3 else "medium"
+            })
         
         return anomalies
     
@@ -66,58 +63,41 @@ class AnomalyDetectionService:
         Detect unusual spending in specific categories
         """
         end_date = datetime.now()
-        start_date = end_date - relativedelta(months=months)
+        start_date = (end_date - relativedelta(months=months)).replace(day=1)
+        
+        # Category x month spend, with per-category stats over active months
+        ledger = get_ledger(db, user_id)
+        matrix = ledger.category_month_matrix(start_date)
+        stats = ledger.row_stats(matrix)
         
-        # Get category spending by month
-        category_monthly = db.query(
-            Expense.category,
-            func.strftime('%Y-%m', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date()
-        ).group_by(Expense.category, 'month').all()
+        # Get current month spending
+        current_month = month_key(datetime.now())
+        if current_month in matrix.months:
+            current = matrix.totals[:, matrix.months.index(current_month)]
+        else:
+            current = np.zeros(len(matrix.categories))
         
-        # Organize by category
-        category_data = {}
-        for category, month, total in category_monthly:
-            if category not in category_data:
-                category_data[category] = []
-            category_data[category].append(float(total))
+        valid = (stats["n"] >= 2) & (stats["std"] > 0)
+        z_scores = np.divide(current - stats["mean"], stats["std"], out=np.zeros_like(current), where=valid)
+        flagged = valid & (z_scores > 2)
         
         anomalies = []
-        current_month = datetime.now().strftime('%Y-%m')
         
-        for category, values in category_data.items():
-            if len(values) < 2:
-                continue
-            
-            # Get current month spending
-            current_spending = db.query(func.sum(Expense.amount)).filter(
-                Expense.user_id == user_id,
-                Expense.category == category,
-                func.strftime('%Y-%m', Expense.date) == current_month
-            ).scalar() or 0
-            
-            # Calculate statistics
-            mean_val = np.mean(values)
-            std_val = np.std(values)
-            
-            if std_val == 0:
+        for i in ledger.rollup_order(matrix):
+            if not flagged[i]:
                 continue
-            
-            z_score = (current_spending - mean_val) / std_val
-            
-            if z_score > 2:
-                percent_increase = ((current_spending - mean_val) / mean_val) * 100
-                anomalies.append({
-                    "category": category,
-                    "current_spending": round(current_spending, 2),
-                    "average_spending": round(mean_val, 2),
-                    "percent_increase": round(percent_increase, 1),
-                    "reason": f"{category} spending is {round(percent_increase, 1)}% above average",
-                    "severity": "high" if z_score > 3 else "medium"
-                })
+            category, current_spending, mean_val, z_score = (
+                matrix.categories[i], current[i], stats["mean"][i], z_scores[i]
+            )
+            percent_increase = ((current_spending - mean_val) / mean_val) * 100
+            anomalies.append({
+                "category": category,
+                "current_spending": round(current_spending, 2),
+                "average_spending": round(mean_val, 2),
+                "percent_increase": round(percent_increase, 1),
+                "reason": f"{category} spending is {round(percent_increase, 1)}% above average",
+                "severity": "high" if z_score > 3 else "medium"
+            })
         
         return anomalies
     
@@ -130,18 +110,13 @@ class AnomalyDetectionService:
         spike_start = end_date - timedelta(days=days)
         comparison_start = spike_start - timedelta(days=days*4)
         
+        ledger = get_ledger(db, user_id)
+        
         # Get recent spending
-        recent_spending = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= spike_start.date()
-        ).scalar() or 0
+        recent_spending = ledger.window_sum(spike_start)
         
         # Get comparison period spending
-        comparison_spending = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= comparison_start.date(),
-            Expense.date < spike_start.date()
-        ).scalar() or 0
+        comparison_spending = ledger.window_sum(comparison_start, spike_start - timedelta(days=1))
         
         # Calculate daily averages
         recent_daily = recent_spending / days
@@ -200,28 +175,20 @@ class AnomalyDetectionService:
         now = datetime.now()
         current_month_start = now.replace(day=1)
         last_month_start = (current_month_start - relativedelta(months=1))
-        last_month_end = current_month_start - timedelta(days=1)
-        
-        # Get category spending for both months
-        categories = db.query(Expense.category).filter(
-            Expense.user_id == user_id
-        ).distinct().all()
         
-        for (category,) in categories:
-            # Current month
-            current_spending = db.query(func.sum(Expense.amount)).filter(
-                Expense.user_id == user_id,
-                Expense.category == category,
-                Expense.date >= current_month_start.date()
-            ).scalar() or 0
-            
-            # Last month
-            last_spending = db.query(func.sum(Expense.amount)).filter(
-                Expense.user_id == user_id,
-                Expense.category == category,
-                Expense.date >= last_month_start.date(),
-                Expense.date <= last_month_end.date()
-            ).scalar() or 0
+        # One grouped category x month aggregate covers both months
+        last_month = month_key(last_month_start)
+        current_month = month_key(current_month_start)
+        current_totals, last_totals = defaultdict(float), defaultdict(float)
+        for category, month, total in RollupService.get_category_monthly_totals(db, user_id, last_month):
+            if month >= current_month:
+                current_totals[category] += total
+            elif month == last_month:
+                last_totals[category] += total
+        
+        for category in sorted(last_totals):
+            current_spending = current_totals.get(category, 0)
+            last_spending = last_totals[category]
             
             if last_spending == 0:
                 continue
@@ -242,15 +209,8 @@ class AnomalyDetectionService:
                 })
         
         # Check budget overruns
-        from models import Budget
-        budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
-        
-        for budget in budgets:
-            spent = db.query(func.sum(Expense.amount)).filter(
-                Expense.user_id == user_id,
-                Expense.category == budget.category,
-                Expense.date >= current_month_start.date()
-            ).scalar() or 0
+        for budget in BudgetService.get_all_budgets(db, user_id):
+            spent = current_totals.get(budget.category, 0)
             
             if spent > budget.amount:
                 overspend = spent - budget.amount
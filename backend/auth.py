@@ -1,14 +1,16 @@
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 import bcrypt
 import os
 import secrets
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from database import get_db
-from models import User
+from database import SessionLocal, AsyncSessionLocal
+from models import User, Subscription, PlanType
+from cache import TTLCache
 
 # Security configuration - load from environment variable for production
 _default_key = secrets.token_hex(32)
@@ -21,6 +23,20 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 security = HTTPBearer()
 
+# Authenticated principals keyed by token subject. Subscription and user changes
+# invalidate entries in this process; the TTL bounds staleness in other workers.
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = int(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+class Principal(NamedTuple):
+    """The authenticated user as seen by route handlers (immutable, safe to share across requests)"""
+    id: int
+    email: str
+    is_admin: bool
+    plan: PlanType
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -55,27 +71,80 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    """Get current authenticated user from JWT token."""
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def token_claims(user: User, plan: Optional[PlanType] = None) -> dict:
+    """Claims for a new access token. uid lets a cache miss load the user by primary key;
+    plan is informational for clients, the server always uses the current plan."""
+    return {"sub": user.email, "uid": user.id, "plan": (plan or PlanType.FREE).value}
+
+def _decode_token(token: str) -> dict:
+    """Decode a JWT and return its payload, or raise 401."""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+        if payload.get("sub") is None:
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return payload
+
+def _principal_query(payload: dict):
+    """User and plan in one round trip; tokens issued before uid existed fall back to email"""
+    query = select(User.id, User.email, User.is_admin, Subscription.plan_type).outerjoin(
+        Subscription, Subscription.user_id == User.id
+    ).where(User.email == payload["sub"])
+    if payload.get("uid") is not None:
+        query = query.where(User.id == payload["uid"])
+    return query
+
+def _principal_from_row(row) -> Principal:
+    user_id, email, is_admin, plan = row
+    return Principal(id=user_id, email=email, is_admin=bool(is_admin), plan=plan or PlanType.FREE)
+
+def _cached_principal(payload: dict) -> Optional[Principal]:
+    principal = principal_cache.get(payload["sub"])
+    # A uid mismatch means the email now belongs to a different account
+    if principal is not None and payload.get("uid") not in (None, principal.id):
+        return None
+    return principal
+
+def invalidate_principal(user_id: int):
+    """Drop cached principals for a user after their account or subscription changes."""
+    principal_cache.pop_where(lambda subject, principal: principal.id == user_id)
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """Get current authenticated user from JWT token. Cache hits touch no database connection."""
+    payload = _decode_token(credentials.credentials)
+    principal = _cached_principal(payload)
+    if principal is not None:
+        return principal
     
-    user = get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
+    with SessionLocal() as db:
+        row = db.execute(_principal_query(payload)).first()
+    if row is None:
+        raise _credentials_exception()
+    
+    principal = _principal_from_row(row)
+    principal_cache.set(payload["sub"], principal)
+    return principal
+
+async def get_current_user_async(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """get_current_user for async endpoints."""
+    payload = _decode_token(credentials.credentials)
+    principal = _cached_principal(payload)
+    if principal is not None:
+        return principal
+    
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(_principal_query(payload))).first()
+    if row is None:
+        raise _credentials_exception()
+    
+    principal = _principal_from_row(row)
+    principal_cache.set(payload["sub"], principal)
+    return principal
@@ -0,0 +1,55 @@
+"""
+Check or rebuild the group_balances ledger from expense_splits
+Run once after deploying the table, or any time to find and repair drift:
+
+    python backfill_group_balances.py             # rebuild all groups
+    python backfill_group_balances.py 7           # rebuild a single group
+    python backfill_group_balances.py --check     # report drift, change nothing
+    python backfill_group_balances.py --check 7
+"""
+
+import sys
+from database import SessionLocal, engine, Base
+from group_balance_service import GroupBalanceService
+
+# Create tables
+Base.metadata.create_all(bind=engine)
+
+def check_group_balances(group_id=None):
+    db = SessionLocal()
+
+    try:
+        mismatches = GroupBalanceService.check(db, group_id)
+        for m in mismatches:
+            print(f"  group {m['group_id']}: {m['debtor_id']} -> {m['creditor_id']} "
+                  f"stored {m['stored']}, expected {m['expected']}")
+        if mismatches:
+            print(f"❌ {len(mismatches)} balance(s) out of step; run without --check to rebuild")
+        else:
+            print("✅ Group balances match the splits table")
+        return not mismatches
+    finally:
+        db.close()
+
+def backfill_group_balances(group_id=None):
+    db = SessionLocal()
+
+    try:
+        target = f"group {group_id}" if group_id is not None else "all groups"
+        print(f"Rebuilding group balances for {target}...")
+        written = GroupBalanceService.rebuild(db, group_id)
+        print(f"✅ Wrote {written} balance rows")
+    except Exception as e:
+        print(f"❌ Error rebuilding group balances: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--check"]
+    group_id = int(args[0]) if args else None
+    if "--check" in sys.argv:
+        print("\n🔍 Checking Group Balances...\n")
+        sys.exit(0 if check_group_balances(group_id) else 1)
+    print("\n🔧 Backfilling Group Balances...\n")
+    backfill_group_balances(group_id)
@@ -0,0 +1,35 @@
+"""
+Backfill the expense and income monthly rollup tables from raw rows
+Run once after deploying the rollup table, or any time to repair drift:
+
+    python backfill_rollups.py            # all users
+    python backfill_rollups.py 42         # a single user
+"""
+
+import sys
+from database import SessionLocal, engine, Base
+from rollup_service import RollupService, IncomeRollupService
+
+# Create tables
+Base.metadata.create_all(bind=engine)
+
+def backfill_rollups(user_id=None):
+    db = SessionLocal()
+
+    try:
+        target = f"user {user_id}" if user_id is not None else "all users"
+        print(f"Rebuilding expense rollups for {target}...")
+        written = RollupService.rebuild(db, user_id)
+        print(f"✅ Wrote {written} rollup rows")
+        print(f"Rebuilding income rollups for {target}...")
+        written = IncomeRollupService.rebuild(db, user_id)
+        print(f"✅ Wrote {written} income rollup rows")
+    except Exception as e:
+        print(f"❌ Error rebuilding rollups: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("\n🔧 Backfilling Expense and Income Rollups...\n")
+    backfill_rollups(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,89 @@
+"""
+Failure check for the streaming CSV importer
+Seeds a throwaway SQLite database (request-session writes, as on PostgreSQL),
+makes one batch of a multi-batch import fail, and fails unless the summary,
+the expenses table and the expense rollups all agree afterwards:
+
+    python check_csv_import.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Never touch the configured database; writes go through the caller's session
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "csv_import_check.db")
+os.environ["SQLITE_WRITER"] = "0"
+
+from sqlalchemy import func
+from database import SessionLocal, engine, Base
+from models import User, Expense, ExpenseRollup
+from csv_import import CSVImportService
+from rollup_service import RollupService
+from sqlite_writer import run_write
+
+# Create tables
+Base.metadata.create_all(bind=engine)
+
+BATCH_SIZE = 1000
+ROW_COUNT = 2500
+FAILING_BATCH = 2
+
+
+def statement_lines(row_count: int):
+    yield "date,description,amount\n"
+    start = date(2024, 1, 1)
+    for i in range(row_count):
+        yield f"{start + timedelta(days=i // 50)},merchant {i},{10 + i % 90}.5\n"
+
+
+def main() -> int:
+    db = SessionLocal()
+    try:
+        user = User(email="import@csv.check", hashed_password="x")
+        db.add(user)
+        db.commit()
+
+        # Fail the rollup write of one batch, after its expenses were inserted
+        apply_deltas = RollupService.apply_deltas
+        calls = {"count": 0}
+
+        def failing_apply_deltas(session, user_id, deltas):
+            calls["count"] += 1
+            if calls["count"] == FAILING_BATCH:
+                raise RuntimeError("injected rollup failure")
+            return apply_deltas(session, user_id, deltas)
+
+        RollupService.apply_deltas = staticmethod(failing_apply_deltas)
+        try:
+            summary = CSVImportService.import_stream(
+                user.id, statement_lines(ROW_COUNT), lambda job: run_write(db, job), batch_size=BATCH_SIZE
+            )
+        finally:
+            RollupService.apply_deltas = staticmethod(apply_deltas)
+
+        stored = db.query(func.count(Expense.id)).filter(Expense.user_id == user.id).scalar()
+        rolled_up = db.query(func.sum(ExpenseRollup.txn_count)).filter(ExpenseRollup.user_id == user.id).scalar() or 0
+    finally:
+        db.close()
+
+    checks = {
+        "summary counts the failed batch": summary["failed"] == BATCH_SIZE,
+        "summary counts the other batches": summary["imported"] == ROW_COUNT - BATCH_SIZE,
+        "failed rows were not committed": stored == summary["imported"],
+        "rollups match stored expenses": rolled_up == stored,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    print(f"\nimported={summary['imported']} failed={summary['failed']} stored={stored} rolled_up={rolled_up}")
+
+    if not all(checks.values()):
+        print("\n❌ CSV import left the database inconsistent after a failed batch")
+        return 1
+    print("\n✅ Failed batches are rolled back and later batches still import")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
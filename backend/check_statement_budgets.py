@@ -0,0 +1,107 @@
+"""
+Statement budget check for the group, split, membership and spending-insight views
+Seeds a throwaway SQLite database with a small and a large group, runs each
+view against both and fails if any view issues more statements than its
+budget, or more statements for the large group than for the small one:
+
+    python check_statement_budgets.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Never touch the configured database
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "budget_check.db")
+os.environ["SQLITE_WRITER"] = "0"
+
+from database import SessionLocal, engine, Base, count_statements
+from models import User, Group, GroupMember, GroupRole, Expense
+from group_service import GroupService
+from split_service import SplitService, SplitType
+from anomaly_detection_service import AnomalyDetectionService
+from rollup_service import RollupService
+
+# Create tables
+Base.metadata.create_all(bind=engine)
+
+# Statements each view may issue, whatever the group's size
+BUDGETS = {
+    "GET /groups/list": (1, lambda db, ctx: [g.created_at for g in GroupService.get_user_groups(db, ctx["owner"])]),
+    "GET /groups/{id}": (3, lambda db, ctx: GroupService.get_group_details(db, ctx["group"], ctx["owner"])),
+    "GET /groups/{id}/expenses": (2, lambda db, ctx: GroupService.get_group_expenses(db, ctx["group"], ctx["owner"])),
+    "GET /groups/{id}/balances": (4, lambda db, ctx: SplitService.get_group_balances(db, ctx["group"], ctx["owner"])),
+    "GET /groups/{id}/settle-plan": (3, lambda db, ctx: SplitService.get_settle_plan(db, ctx["group"], ctx["owner"])),
+    "GET /splits/my-splits": (2, lambda db, ctx: SplitService.get_user_splits(db, ctx["owner"])),
+    "GET /insights/behavioral": (2, lambda db, ctx: AnomalyDetectionService.get_behavioral_insights(db, ctx["owner"])),
+    "GET /anomalies (category)": (1, lambda db, ctx: AnomalyDetectionService.detect_category_anomalies(db, ctx["owner"])),
+}
+
+
+def seed_group(db, name: str, member_count: int, expense_count: int) -> dict:
+    """A group whose members each pay for and split expenses across many categories"""
+    users = [User(email=f"{name}-{i}@budget.check", hashed_password="x") for i in range(member_count)]
+    db.add_all(users)
+    db.flush()
+
+    group = Group(name=name, created_by=users[0].id)
+    db.add(group)
+    db.flush()
+    db.add_all(
+        GroupMember(group_id=group.id, user_id=user.id, role=GroupRole.OWNER if i == 0 else GroupRole.MEMBER)
+        for i, user in enumerate(users)
+    )
+    db.commit()
+
+    today = date.today()
+    for i in range(expense_count):
+        payer = users[i % member_count]
+        category = f"Category {i % 40}"
+        expense_date = today - timedelta(days=i)
+        expense = Expense(amount=100.0 + i, category=category, date=expense_date, note=name,
+                          user_id=payer.id, group_id=group.id)
+        db.add(expense)
+        RollupService.record_expense(db, payer.id, category, expense_date, expense.amount)
+        db.commit()
+        SplitService.create_split(
+            db, expense.id, SplitType.EQUAL,
+            [{"user_id": user.id} for user in users], payer.id
+        )
+
+    return {"group": group.id, "owner": users[0].id}
+
+
+def main() -> int:
+    db = SessionLocal()
+    try:
+        small = seed_group(db, "small", member_count=3, expense_count=5)
+        large = seed_group(db, "large", member_count=12, expense_count=240)
+    finally:
+        db.close()
+
+    failures = 0
+    for view, (budget, run) in BUDGETS.items():
+        counts = []
+        for ctx in (small, large):
+            db = SessionLocal()
+            try:
+                with count_statements() as statements:
+                    run(db, ctx)
+                counts.append(len(statements))
+            finally:
+                db.close()
+
+        ok = max(counts) <= budget and counts[0] == counts[1]
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {view:<30} small={counts[0]} large={counts[1]} budget={budget}")
+
+    if failures:
+        print(f"\n❌ {failures} view(s) over budget or growing with group size")
+        return 1
+    print("\n✅ All views within their statement budgets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,15 +2,27 @@
 CSV Import service for bulk expense uploads.
 Supports bank statements and custom CSV formats.
 """
+import codecs
 import csv
 import io
+import itertools
+import os
 from datetime import datetime
-from typing import List, Dict, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
 from models import Expense
 from ai_categorizer import AICategorizer
+from rollup_service import RollupService, month_key
+from ledger_snapshot import stage_expense_rows
+from admin_service import count_bulk_rows
 import hashlib
 
+# Rows categorized, deduped and committed together by the streaming importer
+IMPORT_BATCH_SIZE = int(os.environ.get("CSV_IMPORT_BATCH_SIZE", 1000))
+# Per-row details kept in the import summary
+SUMMARY_SAMPLE_SIZE = 20
+
 class CSVImportService:
     """
     Service for importing expenses from CSV files.
@@ -39,17 +51,52 @@ class CSVImportService:
         parsed_rows = []
         errors = []
         
+        for _, row, error in cls.iter_rows(io.StringIO(file_content)):
+            if error:
+                errors.append(error)
+            else:
+                parsed_rows.append(row)
+        
+        cls.categorize(parsed_rows)
+        return parsed_rows, errors
+    
+    @staticmethod
+    def decode_lines(binary_lines: Iterable[bytes]) -> Iterator[str]:
+        """Decode an uploaded file line by line: UTF-8, falling back to Latin-1."""
+        for line_num, line in enumerate(binary_lines):
+            if line_num == 0 and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield line.decode('latin-1')
+    
+    @classmethod
+    def iter_rows(cls, lines: Iterable[str]) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+        """
+        Lazily parse CSV lines into uncategorized expense rows.
+        
+        Yields:
+            (row_num, parsed_row, None) for each valid row,
+            (row_num, None, error) for each bad one
+        """
+        lines = iter(lines)
+        
+        # Sniff the delimiter from roughly the first 1KB, then keep reading from there
+        head, size = [], 0
+        for line in lines:
+            head.append(line)
+            size += len(line)
+            if size >= 1024:
+                break
         try:
-            # Try to detect delimiter
             sniffer = csv.Sniffer()
-            sample = file_content[:1024]
+            sample = ''.join(head)[:1024]
             delimiter = sniffer.sniff(sample).delimiter
         except:
             delimiter = ','
         
-        # Parse CSV
-        csv_file = io.StringIO(file_content)
-        reader = csv.DictReader(csv_file, delimiter=delimiter)
+        reader = csv.DictReader(itertools.chain(head, lines), delimiter=delimiter)
         
         # Normalize column names (case-insensitive)
         if reader.fieldnames:
@@ -59,11 +106,17 @@ class CSVImportService:
             try:
                 parsed_row = cls._parse_row(row, idx)
                 if parsed_row:
-                    parsed_rows.append(parsed_row)
+                    yield idx, parsed_row, None
             except Exception as e:
-                errors.append(f"Row {idx}: {str(e)}")
-        
-        return parsed_rows, errors
+                yield idx, None, f"Row {idx}: {str(e)}"
+    
+    @staticmethod
+    def categorize(rows: List[Dict]) -> List[Dict]:
+        """Fill in each row's category with one batched prediction."""
+        categories = AICategorizer.predict_categories([row['note'] for row in rows])
+        for row, category in zip(rows, categories):
+            row['category'] = category
+        return rows
     
     @classmethod
     def _parse_row(cls, row: Dict, row_num: int) -> Dict:
@@ -98,14 +151,12 @@ class CSVImportService:
         if amount <= 0:
             raise ValueError(f"Invalid amount: {amount_str}")
         
-        # Auto-categorize using ML
-        category = AICategorizer.predict_category(description)
-        
+        # Category is filled in per batch by categorize()
         return {
             'date': date,
             'note': description[:500],  # Limit length
             'amount': amount,
-            'category': category,
+            'category': None,
             'row_num': row_num
         }
     
@@ -149,27 +200,104 @@ class CSVImportService:
         except ValueError:
             raise ValueError(f"Invalid amount format: {amount_str}")
     
+    @staticmethod
+    def fingerprint(user_id: int, date, amount: float, note: str) -> str:
+        """
+        Dedupe key for an imported transaction: user, date, amount in paise
+        and the first 50 characters of the whitespace-normalized, lowercased note.
+        """
+        note_prefix = ' '.join((note or '').lower().split())[:50]
+        key = f"{user_id}|{date.isoformat()}|{round(amount * 100)}|{note_prefix}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def _load_existing(cls, user_id: int, parsed_rows: List[Dict], db: Session) -> Tuple[set, set, set]:
+        """
+        One query over the statement's date window.
+        
+        Returns:
+            (fingerprints, day_amounts, blank_note_day_amounts) where the last
+            two hold (date, paise) keys for the legacy date + amount match
+        """
+        fingerprints, day_amounts, blank_notes = set(), set(), set()
+        if not parsed_rows:
+            return fingerprints, day_amounts, blank_notes
+        
+        dates = [row['date'] for row in parsed_rows]
+        existing = db.query(Expense.fingerprint, Expense.date, Expense.amount, Expense.note).filter(
+            Expense.user_id == user_id,
+            Expense.date >= min(dates),
+            Expense.date <= max(dates)
+        )
+        for fingerprint, date, amount, note in existing:
+            # Rows entered by hand (or before fingerprints existed) are hashed on the fly
+            fingerprints.add(fingerprint or cls.fingerprint(user_id, date, amount, note))
+            key = (date, round(amount * 100))
+            day_amounts.add(key)
+            if not note:
+                blank_notes.add(key)
+        return fingerprints, day_amounts, blank_notes
+    
+    @classmethod
+    def _insert_new(cls, db: Session, values: List[Dict]) -> List[tuple]:
+        """
+        Bulk insert, skipping rows whose fingerprint already exists.
+        
+        Returns:
+            (id, date, amount, category, fingerprint) for the rows actually written
+        """
+        if not values:
+            return []
+        
+        dialect = db.get_bind().dialect.name
+        table = Expense.__table__
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = insert(table).on_conflict_do_nothing(
+                index_elements=[table.c.user_id, table.c.fingerprint]
+            ).returning(table.c.id, table.c.date, table.c.amount, table.c.category, table.c.fingerprint)
+            written = [tuple(row) for row in db.execute(stmt, values)]
+            count_bulk_rows(db, Expense, len(written))
+            return written
+        
+        # Generic fallback: the preload already filtered duplicates
+        expenses = [Expense(**{k: v for k, v in row.items() if k != 'month_key'}) for row in values]
+        db.add_all(expenses)
+        db.flush()
+        return [(e.id, e.date, e.amount, e.category, e.fingerprint) for e in expenses]
+    
     @classmethod
     def import_expenses(
         cls, 
         user_id: int, 
         parsed_rows: List[Dict], 
-        db: Session
+        db: Session,
+        commit: bool = True
     ) -> Dict:
         """
         Import parsed expenses into database with duplicate detection.
         
+        Duplicates are found in memory against the fingerprints preloaded for
+        the statement's date window, then all new rows go out in one bulk
+        insert that skips anything a concurrent import wrote first. With
+        commit=False the caller commits (e.g. together with a checkpoint).
+        
         Returns:
             Summary dict with success/failure counts
         """
-        imported = []
+        fingerprints, day_amounts, blank_notes = cls._load_existing(user_id, parsed_rows, db)
+        
+        pending = {}
         duplicates = []
         failed = []
         
         for row in parsed_rows:
             try:
-                # Check for duplicates
-                if cls._is_duplicate(user_id, row, db):
+                fingerprint = cls.fingerprint(user_id, row['date'], row['amount'], row['note'])
+                key = (row['date'], round(row['amount'] * 100))
+                
+                # Same fingerprint, or a blank note on either side with the same date + amount
+                if fingerprint in fingerprints or key in blank_notes or (not row['note'] and key in day_amounts):
                     duplicates.append({
                         'row_num': row['row_num'],
                         'date': row['date'].isoformat(),
@@ -178,23 +306,11 @@ class CSVImportService:
                     })
                     continue
                 
-                # Create expense
-                expense = Expense(
-                    user_id=user_id,
-                    date=row['date'],
-                    amount=row['amount'],
-                    category=row['category'],
-                    note=row['note']
-                )
-                db.add(expense)
-                
-                imported.append({
-                    'row_num': row['row_num'],
-                    'date': row['date'].isoformat(),
-                    'amount': row['amount'],
-                    'category': row['category'],
-                    'note': row['note']
-                })
+                fingerprints.add(fingerprint)
+                day_amounts.add(key)
+                if not row['note']:
+                    blank_notes.add(key)
+                pending[fingerprint] = row
                 
             except Exception as e:
                 failed.append({
@@ -202,9 +318,45 @@ class CSVImportService:
                     'error': str(e)
                 })
         
-        # Commit all at once
-        if imported:
-            db.commit()
+        written = cls._insert_new(db, [
+            {
+                'user_id': user_id,
+                'date': row['date'],
+                'month_key': month_key(row['date']),
+                'amount': row['amount'],
+                'category': row['category'],
+                'note': row['note'],
+                'fingerprint': fingerprint
+            }
+            for fingerprint, row in pending.items()
+        ])
+        
+        # Anything the insert skipped was imported concurrently in the meantime
+        inserted = {fingerprint for *_, fingerprint in written}
+        imported = []
+        for fingerprint, row in pending.items():
+            record = {
+                'row_num': row['row_num'],
+                'date': row['date'].isoformat(),
+                'amount': row['amount'],
+                'note': row['note']
+            }
+            if fingerprint in inserted:
+                imported.append(dict(record, category=row['category']))
+            else:
+                duplicates.append(record)
+        duplicates.sort(key=lambda item: item['row_num'])
+        
+        # Commit all at once, together with the rollup deltas for the batch
+        if written:
+            RollupService.apply_deltas(db, user_id, RollupService.collect_deltas(
+                (category, date, amount) for _, date, amount, category, _ in written
+            ))
+            stage_expense_rows(db, user_id, sorted(
+                (expense_id, date, amount, category, None) for expense_id, date, amount, category, _ in written
+            ))
+            if commit:
+                db.commit()
         
         # Generate category summary
         category_summary = {}
@@ -224,29 +376,134 @@ class CSVImportService:
         }
     
     @classmethod
-    def _is_duplicate(cls, user_id: int, row: Dict, db: Session) -> bool:
+    def import_stream(
+        cls,
+        user_id: int,
+        lines: Iterable[str],
+        write: Callable[[Callable[[Session], Dict]], Dict],
+        batch_size: int = IMPORT_BATCH_SIZE,
+        start_row: int = 0,
+        checkpoint: Optional[Callable[[Session, int, Dict], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Dict:
         """
-        Check if expense already exists (duplicate detection).
-        Uses date, amount, and note hash for matching.
+        Import a CSV of any size in bounded memory.
+        
+        Rows are parsed lazily and handled batch_size at a time: categorized,
+        then passed to import_expenses through write (e.g. run_write), which
+        commits each batch on its own. Only counts and a capped sample of
+        per-row details are kept.
+        
+        For background jobs: rows up to start_row are skipped,
+        checkpoint(session, last_row, progress) runs in the same transaction
+        as each batch, and should_stop() is checked before every batch.
+        
+        Returns:
+            Compact summary dict ('cancelled' is set if should_stop ended it)
         """
-        # Check for exact match within 1 day
-        existing = db.query(Expense).filter(
-            Expense.user_id == user_id,
-            Expense.date == row['date'],
-            Expense.amount == row['amount']
-        ).first()
-        
-        if existing:
-            # Check if notes are similar (to avoid false positives)
-            if existing.note and row['note']:
-                # Simple similarity check
-                if existing.note.lower()[:50] == row['note'].lower()[:50]:
-                    return True
-            else:
-                # If no notes, consider it duplicate based on date+amount
-                return True
+        summary = {
+            'total_rows': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'parse_errors': 0,
+            'batches': 0,
+            'duplicate_records': [],
+            'failed_records': [],
+            'errors': [],
+            'category_summary': {}
+        }
+        # Parse errors since the last checkpoint (count plus a capped sample)
+        pending_errors = {'count': 0, 'errors': []}
+        
+        def sample(target: Dict, key: str, items: List):
+            room = SUMMARY_SAMPLE_SIZE - len(target[key])
+            if room > 0:
+                target[key].extend(items[:room])
+        
+        def progress_for(batch: List[Dict], result: Dict) -> Dict:
+            return dict(
+                result,
+                rows_parsed=len(batch) + pending_errors['count'],
+                parse_errors=pending_errors['count'],
+                errors=list(pending_errors['errors'])
+            )
+        
+        def save_checkpoint(last_row: int, progress: Dict):
+            write(lambda session: (checkpoint(session, last_row, progress), session.commit()))
+        
+        def flush(batch: List[Dict], last_row: int):
+            cls.categorize(batch)
+            
+            def job(session: Session) -> Dict:
+                result = cls.import_expenses(user_id, batch, session, commit=False)
+                if checkpoint:
+                    checkpoint(session, last_row, progress_for(batch, result))
+                session.commit()
+                return result
+            
+            try:
+                result = write(job)
+            except Exception as e:
+                # Earlier batches stay committed; this one is reported as failed
+                result = {
+                    'imported': 0,
+                    'duplicates': 0,
+                    'failed': len(batch),
+                    'duplicate_records': [],
+                    'failed_records': [{'row_num': row['row_num'], 'error': str(e)} for row in batch],
+                    'category_summary': {}
+                }
+                if checkpoint:
+                    save_checkpoint(last_row, progress_for(batch, result))
+            
+            summary['total_rows'] += len(batch)
+            summary['batches'] += 1
+            for key in ('imported', 'duplicates', 'failed'):
+                summary[key] += result[key]
+            sample(summary, 'duplicate_records', result['duplicate_records'])
+            sample(summary, 'failed_records', result['failed_records'])
+            for category, count in result['category_summary'].items():
+                summary['category_summary'][category] = summary['category_summary'].get(category, 0) + count
+            pending_errors.update(count=0, errors=[])
+        
+        batch = []
+        last_row = start_row
+        for row_num, row, error in cls.iter_rows(lines):
+            if row_num <= start_row:
+                continue
+            last_row = row_num
+            if error:
+                summary['parse_errors'] += 1
+                sample(summary, 'errors', [error])
+                pending_errors['count'] += 1
+                sample(pending_errors, 'errors', [error])
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                if should_stop and should_stop():
+                    summary['cancelled'] = True
+                    return summary
+                flush(batch, last_row)
+                batch = []
+        
+        if should_stop and should_stop():
+            summary['cancelled'] = True
+            return summary
+        if batch:
+            flush(batch, last_row)
+        elif checkpoint and pending_errors['count']:
+            # Trailing bad rows still advance the offset
+            save_checkpoint(last_row, progress_for([], {
+                'imported': 0,
+                'duplicates': 0,
+                'failed': 0,
+                'duplicate_records': [],
+                'failed_records': [],
+                'category_summary': {}
+            }))
         
-        return False
+        return summary
     
     @classmethod
     def validate_csv(cls, file_content: str) -> Dict:
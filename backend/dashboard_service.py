@@ -0,0 +1,55 @@
+"""
+Dashboard Service
+Builds the composite dashboard from one shared aggregate snapshot
+"""
+
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from aggregate_snapshot import AggregateSnapshot
+from services import AnalyticsService
+from ml_predictions import MLPredictionService
+from forecasting_service import ForecastingService
+from financial_health_service import FinancialHealthService
+from wealth_management_service import NetWorthService
+
+
+class DashboardService:
+    """Each section returns exactly what its standalone endpoint returns"""
+
+    SECTIONS = {
+        "summary": lambda db, user_id: AnalyticsService.get_summary(db, user_id),
+        "insights": lambda db, user_id: {"insights": AnalyticsService.get_insights(db, user_id)},
+        "financial_summary": lambda db, user_id: AnalyticsService.get_financial_summary(db, user_id),
+        "ml_insights": lambda db, user_id: MLPredictionService.get_spending_insights(user_id, db),
+        "health": lambda db, user_id: FinancialHealthService.get_daily_score(db, user_id),
+        "forecast": lambda db, user_id: ForecastingService.forecast_next_month(db, user_id),
+        "networth": lambda db, user_id: NetWorthService.get_net_worth_dashboard(db, user_id),
+    }
+
+    @staticmethod
+    def parse_fields(raw: Optional[str]) -> List[str]:
+        """Validate the requested sections; all of them by default, in canonical order"""
+        if not raw:
+            return list(DashboardService.SECTIONS)
+        requested = {f.strip() for f in raw.split(",") if f.strip()}
+        unknown = sorted(requested - set(DashboardService.SECTIONS))
+        if unknown:
+            raise ValueError(
+                f"Unknown dashboard field(s): {', '.join(unknown)}. "
+                f"Choose from: {', '.join(DashboardService.SECTIONS)}"
+            )
+        return [name for name in DashboardService.SECTIONS if name in requested]
+
+    @staticmethod
+    def build(db: Session, user_id: int, fields: List[str]) -> Dict:
+        """
+        Load the user's aggregates once, then run every requested section
+        against them. Only queries the snapshot can't answer (e.g. the few
+        outlier expenses the ML section lists) still go to the database.
+        """
+        snapshot = AggregateSnapshot(db, user_id)
+        snapshot.attach(db)
+        try:
+            return {name: DashboardService.SECTIONS[name](db, user_id) for name in fields}
+        finally:
+            AggregateSnapshot.detach(db)
@@ -1,7 +1,14 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from fastapi import Depends
 
 # Use DATABASE_URL env var for production (PostgreSQL on Render),
 # fall back to SQLite for local development
@@ -14,19 +21,335 @@ SQLALCHEMY_DATABASE_URL = os.environ.get(
 if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+IS_POSTGRES = SQLALCHEMY_DATABASE_URL.startswith("postgresql")
+
+# ==================== POOL PROFILES ====================
+
+# Pick with DB_PROFILE; any single value can be overridden with its DB_* env var.
+# statement_timeout_ms / analytics_statement_timeout_ms only apply on PostgreSQL (0 = off).
+POOL_PROFILES = {
+    "development": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 0,
+        "analytics_statement_timeout_ms": 0,
+    },
+    # Render free tier Postgres allows very few connections
+    "render_free": {
+        "pool_size": 5,
+        "max_overflow": 2,
+        "pool_timeout": 10,
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 15000,
+        "analytics_statement_timeout_ms": 5000,
+    },
+    "production": {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 15000,
+        "analytics_statement_timeout_ms": 5000,
+    },
+}
+
+DB_PROFILE = os.environ.get("DB_PROFILE", "production" if IS_POSTGRES else "development")
+
+
+def _load_pool_settings(profile: str) -> dict:
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE '{profile}'. Choose from: {', '.join(POOL_PROFILES)}")
+
+    settings = dict(POOL_PROFILES[profile])
+    for key, default in settings.items():
+        raw = os.environ.get(f"DB_{key.upper()}")
+        if raw is None:
+            continue
+        if isinstance(default, bool):
+            settings[key] = raw.lower() in ("1", "true", "yes", "on")
+        else:
+            settings[key] = int(raw)
+    return settings
+
+
+POOL_SETTINGS = _load_pool_settings(DB_PROFILE)
+
 # SQLite needs check_same_thread=False; PostgreSQL does not
 connect_args = {}
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
+
+def _timed_pool(pool_class):
+    """
+    pool_class whose checkouts record their wait (and timeouts) in pool_metrics.
+    Measured in the pool, so only requests that really use a connection pay for
+    one; cache hits and 304s never check one out.
+    """
+    class TimedPool(pool_class):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                connection = super().connect()
+            except PoolTimeoutError:
+                pool_metrics.incr("timeouts")
+                raise
+            pool_metrics.record_wait(time.perf_counter() - started)
+            return connection
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+engine_kwargs = {"pool_pre_ping": POOL_SETTINGS["pool_pre_ping"]}
+sync_pool_kwargs, async_pool_kwargs = {}, {}
+# In-memory SQLite uses a single shared connection, so queue sizing does not apply
+if not (SQLALCHEMY_DATABASE_URL == "sqlite://" or (IS_SQLITE and ":memory:" in SQLALCHEMY_DATABASE_URL)):
+    engine_kwargs.update(
+        pool_size=POOL_SETTINGS["pool_size"],
+        max_overflow=POOL_SETTINGS["max_overflow"],
+        pool_timeout=POOL_SETTINGS["pool_timeout"],
+        pool_recycle=POOL_SETTINGS["pool_recycle"],
+    )
+    sync_pool_kwargs = {"poolclass": _timed_pool(QueuePool)}
+    async_pool_kwargs = {"poolclass": _timed_pool(AsyncAdaptedQueuePool)}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **engine_kwargs, **sync_pool_kwargs)
+
+# ==================== SQLITE PROFILE ====================
+
+# Applied to every new SQLite connection; override any value with SQLITE_<NAME>.
+# WAL lets readers run alongside the single writer; NORMAL sync is durable in WAL mode
+# except for the last commits on power loss.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),  # ms
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -65536)),  # negative = KiB, i.e. 64 MB
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 268435456)),  # 256 MB
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ==================== ASYNC ENGINE ====================
+
+# Same database through an asyncio driver, for async endpoints.
+# Note: an in-memory SQLite database is not shared between the two engines.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{dialect}'")
+    # asyncpg takes ssl=..., not libpq's sslmode=...
+    if dialect == "postgresql":
+        rest = rest.replace("sslmode=", "ssl=")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+
+
+ASYNC_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_kwargs, **async_pool_kwargs)
+
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+
+class AsyncBackedSession(Session):
+    """Sync session class behind AsyncSessionLocal, so session events can target it"""
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+    sync_session_class=AsyncBackedSession
+)
+
 Base = declarative_base()
 
+# ==================== POOL METRICS ====================
+
+class PoolMetrics:
+    """Thread-safe counters for connection pool checkouts and wait times"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+
+    def snapshot(self) -> dict:
+        pool = engine.pool
+        async_pool = async_engine.sync_engine.pool
+        gauges = {
+            "profile": DB_PROFILE,
+            "pool_class": type(pool).__name__,
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            # QueuePool reports unused base slots as negative overflow
+            "overflow": max(0, pool.overflow()) if hasattr(pool, "overflow") else None,
+            "max_overflow": POOL_SETTINGS["max_overflow"],
+            "async_checked_out": async_pool.checkedout() if hasattr(async_pool, "checkedout") else None,
+        }
+        with self._lock:
+            gauges.update({
+                "checkouts_total": self.checkouts,
+                "checkins_total": self.checkins,
+                "connects_total": self.connects,
+                "invalidations_total": self.invalidations,
+                "checkout_timeouts_total": self.timeouts,
+                "wait_ms_avg": round(self.wait_total_ms / self.wait_count, 3) if self.wait_count else 0.0,
+                "wait_ms_max": round(self.wait_max_ms, 3),
+            })
+        return gauges
+
+
+pool_metrics = PoolMetrics()
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "checkout", lambda *args: pool_metrics.incr("checkouts"))
+    event.listen(_engine, "checkin", lambda *args: pool_metrics.incr("checkins"))
+    event.listen(_engine, "connect", lambda *args: pool_metrics.incr("connects"))
+    event.listen(_engine, "invalidate", lambda *args: pool_metrics.incr("invalidations"))
+
+
+def get_pool_metrics() -> dict:
+    return pool_metrics.snapshot()
+
+# ==================== SESSIONS ====================
+
+def _set_statement_timeout(connection, timeout_ms: int):
+    if timeout_ms and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+@event.listens_for(SessionLocal, "after_begin")
+@event.listens_for(AsyncBackedSession, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    """SET LOCAL lasts for one transaction, so reapply it every time the session begins one"""
+    _set_statement_timeout(connection, session.info.get("statement_timeout_ms"))
+
+
 def get_db():
+    # The connection is checked out on first use; the pool records the wait
     db = SessionLocal()
+    db.info["statement_timeout_ms"] = POOL_SETTINGS["statement_timeout_ms"]
     try:
         yield db
     finally:
         db.close()
+
+def get_analytics_db(db: Session = Depends(get_db)):
+    """Request session with the tighter analytics statement timeout, so slow reports
+    can't hold connections that CRUD endpoints are waiting for"""
+    timeout_ms = POOL_SETTINGS["analytics_statement_timeout_ms"]
+    db.info["statement_timeout_ms"] = timeout_ms
+    # A transaction that begins later picks the timeout up in after_begin
+    if db.in_transaction():
+        _set_statement_timeout(db.connection(), timeout_ms)
+    return db
+
+async def get_async_db():
+    db = AsyncSessionLocal()
+    db.info["statement_timeout_ms"] = POOL_SETTINGS["statement_timeout_ms"]
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def get_async_analytics_db(db: AsyncSession = Depends(get_async_db)):
+    """Async counterpart of get_analytics_db"""
+    timeout_ms = POOL_SETTINGS["analytics_statement_timeout_ms"]
+    db.info["statement_timeout_ms"] = timeout_ms
+    if db.in_transaction():
+        await db.run_sync(lambda session: _set_statement_timeout(session.connection(), timeout_ms))
+    return db
+
+@contextmanager
+def analytics_session():
+    """Short-lived session with the analytics timeout, for work that may not need the database at all
+    (e.g. a response cache miss); a connection is only checked out on first use"""
+    db = SessionLocal()
+    db.info["statement_timeout_ms"] = POOL_SETTINGS["analytics_statement_timeout_ms"]
+    try:
+        yield db
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def async_analytics_session():
+    """Async counterpart of analytics_session"""
+    db = AsyncSessionLocal()
+    db.info["statement_timeout_ms"] = POOL_SETTINGS["analytics_statement_timeout_ms"]
+    try:
+        yield db
+    finally:
+        await db.close()
+
+@contextmanager
+def count_statements():
+    """Collect the SQL of every statement run on the request engines inside the block
+    (for statement-budget checks; the serialized writer's engine is not included)"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [engine, async_engine.sync_engine]
+    for target in engines:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", record)
+
+def month_bucket(column):
+    """Return a "YYYY-MM" bucketing expression for a date column on the active dialect.
+    Prefer the stored Expense.month_key; this is for backfills and other tables."""
+    if engine.dialect.name == "postgresql":
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
@@ -0,0 +1,134 @@
+"""
+Ledger Export Service
+Streams a user's expenses, incomes, assets, liabilities and splits as NDJSON or CSV
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from models import Expense, Income, Asset, Liability, ExpenseSplit
+from database import SessionLocal
+
+# Rows fetched per round trip; on PostgreSQL this also switches to a server-side cursor
+YIELD_PER = 1000
+# Flush the output buffer once it reaches this many characters
+CHUNK_SIZE = 64 * 1024
+
+
+class ExportService:
+    """Builds column-only queries and streams them, so memory stays flat however long the history is"""
+
+    DATASETS = ["expenses", "incomes", "assets", "liabilities", "splits"]
+    FORMATS = ["ndjson", "csv"]
+
+    @staticmethod
+    def _query(db: Session, dataset: str, user_id: int):
+        # Column tuples, not ORM entities: nothing accumulates in the identity map
+        if dataset == "expenses":
+            return db.query(
+                Expense.id, Expense.date, Expense.amount, Expense.category, Expense.note, Expense.group_id
+            ).filter(Expense.user_id == user_id).order_by(Expense.id)
+        if dataset == "incomes":
+            return db.query(
+                Income.id, Income.date, Income.amount, Income.category, Income.note
+            ).filter(Income.user_id == user_id).order_by(Income.id)
+        if dataset == "assets":
+            return db.query(
+                Asset.id, Asset.date, Asset.name, Asset.value, Asset.category, Asset.note
+            ).filter(Asset.user_id == user_id).order_by(Asset.id)
+        if dataset == "liabilities":
+            return db.query(
+                Liability.id, Liability.date, Liability.name, Liability.amount, Liability.category,
+                Liability.interest_rate, Liability.note
+            ).filter(Liability.user_id == user_id).order_by(Liability.id)
+        if dataset == "splits":
+            # Splits the user owes plus splits owed to the user on expenses they paid
+            return db.query(
+                ExpenseSplit.id, ExpenseSplit.expense_id, Expense.date,
+                Expense.user_id.label("paid_by_id"), ExpenseSplit.user_id.label("owed_by_id"),
+                ExpenseSplit.amount_owed, ExpenseSplit.is_settled, ExpenseSplit.settled_at
+            ).join(Expense, ExpenseSplit.expense_id == Expense.id).filter(
+                or_(ExpenseSplit.user_id == user_id, Expense.user_id == user_id)
+            ).order_by(ExpenseSplit.id)
+        raise ValueError(f"Unknown dataset '{dataset}'")
+
+    @staticmethod
+    def parse_datasets(raw: Optional[str], fmt: str) -> List[str]:
+        """Validate the requested datasets; CSV has one header, so it takes exactly one"""
+        if fmt not in ExportService.FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Choose from: {', '.join(ExportService.FORMATS)}")
+
+        datasets = [d.strip() for d in raw.split(",") if d.strip()] if raw else list(ExportService.DATASETS)
+        unknown = [d for d in datasets if d not in ExportService.DATASETS]
+        if unknown:
+            raise ValueError(f"Unknown dataset(s): {', '.join(unknown)}")
+        if fmt == "csv" and len(datasets) != 1:
+            raise ValueError("CSV export takes a single dataset, e.g. datasets=expenses")
+        return datasets
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _lines(db: Session, user_id: int, datasets: List[str], fmt: str) -> Iterator[str]:
+        for dataset in datasets:
+            query = ExportService._query(db, dataset, user_id)
+            columns = [c["name"] for c in query.column_descriptions]
+
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+                for row in query.yield_per(YIELD_PER):
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerow([ExportService._value(v) for v in row])
+                    yield buffer.getvalue()
+            else:
+                for row in query.yield_per(YIELD_PER):
+                    record = {"type": dataset}
+                    record.update((name, ExportService._value(v)) for name, v in zip(columns, row))
+                    yield json.dumps(record) + "\n"
+
+    @staticmethod
+    def stream(user_id: int, datasets: List[str], fmt: str = "ndjson", compress: bool = False) -> Iterator[bytes]:
+        """
+        Generator for StreamingResponse. Opens its own session because it runs
+        after the endpoint has returned. The first chunk goes out as soon as it
+        exists; after that output is sent in CHUNK_SIZE pieces.
+        """
+        db = SessionLocal()
+        gzipper = zlib.compressobj(wbits=31) if compress else None
+        pending, size, first = [], 0, True
+
+        def encode(text: str) -> bytes:
+            data = text.encode("utf-8")
+            if gzipper:
+                # SYNC_FLUSH emits everything so far without ending the gzip stream
+                data = gzipper.compress(data) + gzipper.flush(zlib.Z_SYNC_FLUSH)
+            return data
+
+        try:
+            for line in ExportService._lines(db, user_id, datasets, fmt):
+                pending.append(line)
+                size += len(line)
+                if first or size >= CHUNK_SIZE:
+                    yield encode("".join(pending))
+                    pending, size, first = [], 0, False
+
+            tail = encode("".join(pending)) if pending else b""
+            if gzipper:
+                tail += gzipper.flush(zlib.Z_FINISH)
+            if tail:
+                yield tail
+        finally:
+            db.close()
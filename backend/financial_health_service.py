@@ -4,35 +4,106 @@ Calculates a 0-100 score based on multiple financial metrics
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import Expense, Income, Budget, Asset, Liability
-from datetime import datetime, timedelta
+from sqlalchemy import select, func, literal, true, union_all, Float
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Budget, Asset, Liability, ExpenseRollup, HealthScore
+from rollup_service import IncomeRollupService, month_key
+from response_cache import get_ledger_version
+from sqlite_writer import submit_write
+from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import Dict, List
+from typing import Dict, List, Tuple
+import json
 import numpy as np
 
 
 class FinancialHealthService:
     """Calculate comprehensive financial health score"""
     
+    # ==================== AGGREGATES ====================
+    
     @staticmethod
-    def calculate_savings_rate(db: Session, user_id: int, months: int = 3) -> float:
-        """Calculate average savings rate over past N months"""
-        end_date = datetime.now()
-        start_date = end_date - relativedelta(months=months)
-        
-        # Get total income
-        total_income = db.query(func.sum(Income.amount)).filter(
-            Income.user_id == user_id,
-            Income.date >= start_date.date()
-        ).scalar() or 0
-        
-        # Get total expenses
-        total_expenses = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date()
-        ).scalar() or 0
+    def load_aggregates(db: Session, user_id: int) -> Dict:
+        """
+        Everything the score needs in two queries: one row of window totals,
+        then monthly spend for the last six months plus every budget with
+        this month's spend in its category
+        """
+        now = datetime.now()
+        current_month = month_key(now)
+        savings_start = (now - relativedelta(months=3)).replace(day=1)
+        history_month = month_key(now - relativedelta(months=6))
+        
+        def rollup_window(*columns, start_month: str):
+            return select(*columns).where(
+                ExpenseRollup.user_id == user_id,
+                ExpenseRollup.year_month >= start_month,
+                ExpenseRollup.txn_count > 0
+            )
+        
+        # Savings rate (income vs. spend rollups over the same months) and balance sheet totals
+        income = IncomeRollupService.window_total(user_id, month_key(savings_start)).cte("income_window")
+        expenses = rollup_window(
+            func.coalesce(func.sum(ExpenseRollup.total), 0).label("total"),
+            start_month=month_key(savings_start)
+        ).cte("expense_window")
+        assets = select(func.coalesce(func.sum(Asset.value), 0).label("total")).where(
+            Asset.user_id == user_id
+        ).cte("asset_total")
+        liabilities = select(func.coalesce(func.sum(Liability.amount), 0).label("total")).where(
+            Liability.user_id == user_id
+        ).cte("liability_total")
+        
+        # Each CTE is a single row, so the cross join is one row too
+        totals = db.execute(
+            select(income.c.total, expenses.c.total, assets.c.total, liabilities.c.total).select_from(
+                income.join(expenses, true()).join(assets, true()).join(liabilities, true())
+            )
+        ).one()
+        
+        # Monthly totals feed both stability and growth; budgets join this month's category spend
+        current_spend = rollup_window(
+            ExpenseRollup.category,
+            func.sum(ExpenseRollup.total).label("spent"),
+            start_month=current_month
+        ).group_by(ExpenseRollup.category).cte("current_spend")
+        monthly = rollup_window(
+            literal("month").label("kind"),
+            ExpenseRollup.year_month.label("label"),
+            func.sum(ExpenseRollup.total).label("amount"),
+            literal(None, Float).label("budget"),
+            start_month=history_month
+        ).group_by(ExpenseRollup.year_month)
+        budgets = select(
+            literal("budget"),
+            Budget.category,
+            func.coalesce(current_spend.c.spent, 0),
+            Budget.amount
+        ).select_from(Budget).outerjoin(
+            current_spend, current_spend.c.category == Budget.category
+        ).where(Budget.user_id == user_id)
+        
+        monthly_totals, budget_spend = [], []
+        for kind, label, amount, budget in db.execute(union_all(monthly, budgets)).all():
+            if kind == "month":
+                monthly_totals.append((label, float(amount)))
+            else:
+                budget_spend.append((float(amount), float(budget)))
         
+        return {
+            "income": float(totals[0]),
+            "expenses": float(totals[1]),
+            "assets": float(totals[2]),
+            "liabilities": float(totals[3]),
+            "monthly_totals": [total for _, total in sorted(monthly_totals)],
+            "budgets": budget_spend,
+        }
+    
+    # ==================== METRICS ====================
+    
+    @staticmethod
+    def calculate_savings_rate(total_income: float, total_expenses: float) -> float:
+        """Savings rate over the income/expense window, clamped to 0-100"""
         if total_income == 0:
             return 0
         
@@ -40,56 +111,28 @@ class FinancialHealthService:
         return max(0, min(100, savings_rate))  # Clamp between 0-100
     
     @staticmethod
-    def calculate_budget_adherence(db: Session, user_id: int) -> float:
-        """Calculate how well user sticks to budgets"""
-        # Get current month
-        now = datetime.now()
-        month_start = now.replace(day=1)
-        
-        # Get all budgets
-        budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
-        
+    def calculate_budget_adherence(budgets: List[Tuple[float, float]]) -> float:
+        """How well the user sticks to budgets, from (spent, budget amount) pairs"""
         if not budgets:
             return 50  # Neutral score if no budgets set
         
-        adherence_scores = []
-        
-        for budget in budgets:
-            # Get spending in this category
-            spent = db.query(func.sum(Expense.amount)).filter(
-                Expense.user_id == user_id,
-                Expense.category == budget.category,
-                Expense.date >= month_start.date()
-            ).scalar() or 0
-            
-            if budget.amount == 0:
-                continue
-            
-            # Calculate adherence (100% if under budget, decreases if over)
-            adherence = min(100, (1 - (spent / budget.amount - 1)) * 100) if spent > budget.amount else 100
-            adherence_scores.append(max(0, adherence))
-        
-        return sum(adherence_scores) / len(adherence_scores) if adherence_scores else 50
+        spent = np.array([s for s, _ in budgets])
+        amount = np.array([a for _, a in budgets])
+        active = amount != 0
+        if not active.any():
+            return 50
+        
+        # 100% if under budget, decreasing as spend goes over
+        ratio = spent[active] / amount[active]
+        adherence = np.where(ratio > 1, np.minimum(100, (2 - ratio) * 100), 100)
+        return float(np.maximum(0, adherence).mean())
     
     @staticmethod
-    def calculate_expense_stability(db: Session, user_id: int, months: int = 6) -> float:
-        """Calculate expense stability (lower variance = higher score)"""
-        end_date = datetime.now()
-        start_date = end_date - relativedelta(months=months)
-        
-        # Get monthly totals
-        monthly_data = db.query(
-            func.strftime('%Y-%m', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date()
-        ).group_by('month').all()
-        
-        if len(monthly_data) < 2:
+    def calculate_expense_stability(values: List[float]) -> float:
+        """Expense stability from monthly totals (lower variance = higher score)"""
+        if len(values) < 2:
             return 50  # Neutral score
         
-        values = [float(m[1]) for m in monthly_data]
         mean_val = np.mean(values)
         
         if mean_val == 0:
@@ -105,18 +148,8 @@ class FinancialHealthService:
         return stability_score
     
     @staticmethod
-    def calculate_debt_ratio(db: Session, user_id: int) -> float:
-        """Calculate debt-to-asset ratio (lower is better)"""
-        # Get total assets
-        total_assets = db.query(func.sum(Asset.value)).filter(
-            Asset.user_id == user_id
-        ).scalar() or 0
-        
-        # Get total liabilities
-        total_liabilities = db.query(func.sum(Liability.amount)).filter(
-            Liability.user_id == user_id
-        ).scalar() or 0
-        
+    def calculate_debt_ratio(total_assets: float, total_liabilities: float) -> float:
+        """Debt-to-asset score (lower debt is better)"""
         if total_assets == 0:
             return 50 if total_liabilities == 0 else 0
         
@@ -128,24 +161,11 @@ class FinancialHealthService:
         return score
     
     @staticmethod
-    def calculate_spending_growth(db: Session, user_id: int) -> float:
-        """Calculate spending growth trend (negative growth = higher score)"""
-        end_date = datetime.now()
-        start_date = end_date - relativedelta(months=6)
-        
-        monthly_data = db.query(
-            func.strftime('%Y-%m', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date()
-        ).group_by('month').order_by('month').all()
-        
-        if len(monthly_data) < 2:
+    def calculate_spending_growth(values: List[float]) -> float:
+        """Spending growth trend from monthly totals (negative growth = higher score)"""
+        if len(values) < 2:
             return 50
         
-        values = [float(m[1]) for m in monthly_data]
-        
         # Calculate growth rate
         first_half = values[:len(values)//2]
         second_half = values[len(values)//2:]
@@ -174,12 +194,14 @@ class FinancialHealthService:
         """
         Calculate comprehensive financial health score (0-100)
         """
+        aggregates = FinancialHealthService.load_aggregates(db, user_id)
+        
         # Calculate individual metrics
-        savings_rate = FinancialHealthService.calculate_savings_rate(db, user_id)
-        budget_adherence = FinancialHealthService.calculate_budget_adherence(db, user_id)
-        expense_stability = FinancialHealthService.calculate_expense_stability(db, user_id)
-        debt_ratio = FinancialHealthService.calculate_debt_ratio(db, user_id)
-        spending_growth = FinancialHealthService.calculate_spending_growth(db, user_id)
+        savings_rate = FinancialHealthService.calculate_savings_rate(aggregates["income"], aggregates["expenses"])
+        budget_adherence = FinancialHealthService.calculate_budget_adherence(aggregates["budgets"])
+        expense_stability = FinancialHealthService.calculate_expense_stability(aggregates["monthly_totals"])
+        debt_ratio = FinancialHealthService.calculate_debt_ratio(aggregates["assets"], aggregates["liabilities"])
+        spending_growth = FinancialHealthService.calculate_spending_growth(aggregates["monthly_totals"])
         
         # Weighted average
         weights = {
@@ -270,3 +292,80 @@ class FinancialHealthService:
             },
             "insights": insights
         }
+    
+    # ==================== DAILY SCORES ====================
+    
+    @staticmethod
+    def get_daily_score(db: Session, user_id: int) -> Dict:
+        """
+        Today's persisted score when nothing in the ledger has changed since it
+        was computed; otherwise recompute and store it for the next call
+        """
+        version = get_ledger_version(user_id)
+        today = date.today()
+        stored = db.query(HealthScore.payload, HealthScore.ledger_version).filter(
+            HealthScore.user_id == user_id,
+            HealthScore.score_date == today
+        ).first()
+        if stored and stored.ledger_version == version:
+            return json.loads(stored.payload)
+        
+        result = FinancialHealthService.calculate_health_score(db, user_id)
+        submit_write(lambda session: FinancialHealthService.save_daily_score(
+            session, user_id, today, version, result
+        ))
+        return result
+    
+    @staticmethod
+    def save_daily_score(db: Session, user_id: int, score_date: date, version: int, result: Dict) -> None:
+        """Upsert the day's score row; the latest computation of the day wins"""
+        values = {
+            "score": result["score"],
+            "rating": result["rating"],
+            "payload": json.dumps(result),
+            "ledger_version": version,
+            "computed_at": datetime.utcnow()
+        }
+        dialect = db.get_bind().dialect.name
+        table = HealthScore.__table__
+        
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = insert(table).values(user_id=user_id, score_date=score_date, **values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.score_date],
+                set_=values
+            )
+            db.execute(stmt)
+        else:
+            row = db.query(HealthScore).filter(
+                HealthScore.user_id == user_id,
+                HealthScore.score_date == score_date
+            ).with_for_update().first()
+            if row:
+                for key, value in values.items():
+                    setattr(row, key, value)
+            else:
+                db.add(HealthScore(user_id=user_id, score_date=score_date, **values))
+        db.commit()
+    
+    @staticmethod
+    def get_history(db: Session, user_id: int, days: int = 30) -> List[Dict]:
+        """
+        Daily scores for the last N days, oldest first. Today's entry is always
+        current, so the history only changes when the ledger does.
+        """
+        today = date.today()
+        current = FinancialHealthService.get_daily_score(db, user_id)
+        rows = db.query(HealthScore.score_date, HealthScore.score, HealthScore.rating).filter(
+            HealthScore.user_id == user_id,
+            HealthScore.score_date >= today - timedelta(days=days - 1),
+            HealthScore.score_date < today
+        ).order_by(HealthScore.score_date).all()
+        
+        history = [
+            {"date": score_date.isoformat(), "score": score, "rating": rating}
+            for score_date, score, rating in rows
+        ]
+        history.append({"date": today.isoformat(), "score": current["score"], "rating": current["rating"]})
+        return history
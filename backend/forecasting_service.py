@@ -4,8 +4,7 @@ Predicts future spending based on historical data
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from models import Expense
+from ledger_snapshot import get_ledger
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import numpy as np
@@ -21,42 +20,25 @@ class ForecastingService:
         end_date = datetime.now()
         start_date = end_date - relativedelta(months=months)
         
-        # Query monthly totals
-        monthly_data = db.query(
-            func.strftime('%Y-%m', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date(),
-            Expense.date <= end_date.date()
-        ).group_by('month').order_by('month').all()
-        
-        return monthly_data
+        # Whole months, from the start month through the end of the current one
+        return get_ledger(db, user_id).monthly_totals(
+            start_date.replace(day=1), end_date + relativedelta(day=31)
+        )
     
     @staticmethod
-    def get_category_monthly_totals(db: Session, user_id: int, months: int = 6) -> Dict[str, List[float]]:
-        """Get monthly totals by category"""
+    def get_category_monthly_totals(db: Session, user_id: int, months: int = 6) -> Dict[str, np.ndarray]:
+        """Get monthly totals by category (months the category was active in, oldest first)"""
         end_date = datetime.now()
         start_date = end_date - relativedelta(months=months)
         
-        category_data = db.query(
-            Expense.category,
-            func.strftime('%Y-%m', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= start_date.date(),
-            Expense.date <= end_date.date()
-        ).group_by(Expense.category, 'month').order_by('month').all()
-        
-        # Organize by category
-        result = {}
-        for category, month, total in category_data:
-            if category not in result:
-                result[category] = []
-            result[category].append(float(total))
-        
-        return result
+        ledger = get_ledger(db, user_id)
+        matrix = ledger.category_month_matrix(start_date.replace(day=1), end_date + relativedelta(day=31))
+        
+        active = matrix.counts > 0
+        return {
+            matrix.categories[i]: matrix.totals[i, active[i]]
+            for i in ledger.rollup_order(matrix)
+        }
     
     @staticmethod
     def linear_regression_forecast(values: List[float]) -> Tuple[float, float, float]:
@@ -65,7 +47,7 @@ class ForecastingService:
         Returns: (prediction, lower_bound, upper_bound)
         """
         if len(values) < 2:
-            avg = sum(values) / len(values) if values else 0
+            avg = float(np.mean(values)) if len(values) else 0
             return avg, avg * 0.8, avg * 1.2
         
         n = len(values)
@@ -118,7 +100,7 @@ class ForecastingService:
         
         # Extract values
         months = [m[0] for m in monthly_data]
-        values = [float(m[1]) for m in monthly_data]
+        values = np.array([m[1] for m in monthly_data])
         
         # Make prediction
         prediction, lower, upper = ForecastingService.linear_regression_forecast(values)
@@ -169,14 +151,15 @@ class ForecastingService:
         for category, values in category_data.items():
             if len(values) >= 2:
                 prediction, lower, upper = ForecastingService.linear_regression_forecast(values)
+                average = float(values.mean())
                 
                 forecasts.append({
                     "category": category,
                     "prediction": round(prediction, 2),
                     "lower_bound": round(lower, 2),
                     "upper_bound": round(upper, 2),
-                    "historical_average": round(sum(values) / len(values), 2),
-                    "trend": "increasing" if prediction > sum(values) / len(values) else "decreasing"
+                    "historical_average": round(average, 2),
+                    "trend": "increasing" if prediction > average else "decreasing"
                 })
         
         # Sort by prediction amount
@@ -202,11 +185,11 @@ class ForecastingService:
                 "message": "Need at least 2 months of data"
             }
         
-        values = [float(m[1]) for m in monthly_data]
+        values = np.array([m[1] for m in monthly_data])
         
         # Calculate trend
-        first_half_avg = sum(values[:len(values)//2]) / (len(values)//2)
-        second_half_avg = sum(values[len(values)//2:]) / (len(values) - len(values)//2)
+        first_half_avg = float(values[:len(values)//2].mean())
+        second_half_avg = float(values[len(values)//2:].mean())
         
         if first_half_avg == 0:
             change_percent = 0
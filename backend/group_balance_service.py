@@ -0,0 +1,196 @@
+"""
+Group Balance Service
+Maintains the pairwise group_balances ledger so balance views never have to
+rescan a group's splits
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Expense, ExpenseSplit, GroupBalance
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Pairs below half a paisa are settled; float residue from +/- updates is dropped
+SETTLED_EPSILON = 0.005
+
+BalanceKey = Tuple[int, int, int]  # (group_id, debtor_id, creditor_id)
+
+
+class GroupBalanceService:
+    """Keeps group_balances in step with split writes and serves reads from it"""
+
+    # ==================== WRITE PATH ====================
+
+    @staticmethod
+    def collect_deltas(rows: Iterable[Tuple[int, int, int, float]], sign: int = 1) -> Dict[BalanceKey, float]:
+        """Fold (group_id, debtor_id, creditor_id, amount) tuples into {key: amount}"""
+        deltas = defaultdict(float)
+        for group_id, debtor_id, creditor_id, amount in rows:
+            if group_id is not None:
+                deltas[(group_id, debtor_id, creditor_id)] += sign * amount
+        return deltas
+
+    @staticmethod
+    def apply_deltas(db: Session, deltas: Dict[BalanceKey, float]) -> None:
+        """
+        Upsert balance rows in the caller's transaction, so they commit or
+        roll back together with the split write they belong to
+        """
+        dialect = db.get_bind().dialect.name
+        table = GroupBalance.__table__
+        touched_groups = set()
+
+        for (group_id, debtor_id, creditor_id), amount in deltas.items():
+            if amount == 0:
+                continue
+            touched_groups.add(group_id)
+
+            if dialect in ("sqlite", "postgresql"):
+                insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+                stmt = insert(table).values(
+                    group_id=group_id,
+                    debtor_id=debtor_id,
+                    creditor_id=creditor_id,
+                    amount=amount
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.group_id, table.c.debtor_id, table.c.creditor_id],
+                    set_={"amount": table.c.amount + stmt.excluded.amount}
+                )
+                db.execute(stmt)
+                continue
+
+            # Generic fallback for engines without ON CONFLICT support
+            balance = db.query(GroupBalance).filter(
+                GroupBalance.group_id == group_id,
+                GroupBalance.debtor_id == debtor_id,
+                GroupBalance.creditor_id == creditor_id
+            ).with_for_update().first()
+            if balance:
+                balance.amount += amount
+            else:
+                db.add(GroupBalance(
+                    group_id=group_id,
+                    debtor_id=debtor_id,
+                    creditor_id=creditor_id,
+                    amount=amount
+                ))
+
+        if touched_groups:
+            db.flush()
+            db.query(GroupBalance).filter(
+                GroupBalance.group_id.in_(touched_groups),
+                func.abs(GroupBalance.amount) < SETTLED_EPSILON
+            ).delete(synchronize_session=False)
+
+    @staticmethod
+    def remove_splits(db: Session, expense: Expense, unsettled_only: bool = True) -> None:
+        """Take an expense's open splits out of its group's balances (before deleting them)"""
+        if expense.group_id is None:
+            return
+        query = db.query(ExpenseSplit.user_id, ExpenseSplit.amount_owed).filter(
+            ExpenseSplit.expense_id == expense.id
+        )
+        if unsettled_only:
+            query = query.filter(ExpenseSplit.is_settled == False)
+        GroupBalanceService.apply_deltas(db, GroupBalanceService.collect_deltas(
+            ((expense.group_id, debtor_id, expense.user_id, amount) for debtor_id, amount in query),
+            sign=-1
+        ))
+
+    @staticmethod
+    def clear(db: Session, group_id: int) -> None:
+        db.query(GroupBalance).filter(GroupBalance.group_id == group_id).delete(synchronize_session=False)
+
+    # ==================== READ PATH ====================
+
+    @staticmethod
+    def get_matrix(db: Session, group_id: int, user_id: Optional[int] = None) -> Dict[Tuple[int, int], float]:
+        """{(debtor_id, creditor_id): amount} for a group, optionally only pairs involving user_id"""
+        query = db.query(GroupBalance.debtor_id, GroupBalance.creditor_id, GroupBalance.amount).filter(
+            GroupBalance.group_id == group_id
+        )
+        if user_id is not None:
+            query = query.filter((GroupBalance.debtor_id == user_id) | (GroupBalance.creditor_id == user_id))
+        return {
+            (debtor_id, creditor_id): round(amount, 2)
+            for debtor_id, creditor_id, amount in query
+            if abs(amount) >= SETTLED_EPSILON
+        }
+
+    # ==================== REBUILD / CHECK ====================
+
+    @staticmethod
+    def _split_totals(db: Session, group_id: Optional[int] = None) -> Dict[BalanceKey, float]:
+        """The balances recomputed from expense_splits in one grouped query"""
+        query = db.query(
+            Expense.group_id,
+            ExpenseSplit.user_id,
+            Expense.user_id,
+            func.sum(ExpenseSplit.amount_owed)
+        ).join(
+            Expense, ExpenseSplit.expense_id == Expense.id
+        ).filter(
+            Expense.group_id.isnot(None),
+            ExpenseSplit.is_settled == False
+        )
+        if group_id is not None:
+            query = query.filter(Expense.group_id == group_id)
+        rows = query.group_by(Expense.group_id, ExpenseSplit.user_id, Expense.user_id)
+        return {
+            (row_group, debtor_id, creditor_id): float(amount)
+            for row_group, debtor_id, creditor_id, amount in rows
+            if abs(amount) >= SETTLED_EPSILON
+        }
+
+    @staticmethod
+    def check(db: Session, group_id: Optional[int] = None) -> List[Dict]:
+        """Pairs where the stored ledger disagrees with the splits table"""
+        expected = GroupBalanceService._split_totals(db, group_id)
+        stored_query = db.query(
+            GroupBalance.group_id, GroupBalance.debtor_id, GroupBalance.creditor_id, GroupBalance.amount
+        )
+        if group_id is not None:
+            stored_query = stored_query.filter(GroupBalance.group_id == group_id)
+        stored = {
+            (row_group, debtor_id, creditor_id): amount
+            for row_group, debtor_id, creditor_id, amount in stored_query
+            if abs(amount) >= SETTLED_EPSILON
+        }
+
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            if abs(expected.get(key, 0.0) - stored.get(key, 0.0)) >= SETTLED_EPSILON:
+                mismatches.append({
+                    "group_id": key[0],
+                    "debtor_id": key[1],
+                    "creditor_id": key[2],
+                    "stored": round(stored.get(key, 0.0), 2),
+                    "expected": round(expected.get(key, 0.0), 2)
+                })
+        return mismatches
+
+    @staticmethod
+    def rebuild(db: Session, group_id: Optional[int] = None) -> int:
+        """
+        Recompute group_balances from expense_splits (backfill / repair).
+        Returns the number of balance rows written.
+        """
+        balance_query = db.query(GroupBalance)
+        if group_id is not None:
+            balance_query = balance_query.filter(GroupBalance.group_id == group_id)
+        balance_query.delete(synchronize_session=False)
+
+        written = 0
+        for (row_group, debtor_id, creditor_id), amount in GroupBalanceService._split_totals(db, group_id).items():
+            db.add(GroupBalance(
+                group_id=row_group,
+                debtor_id=debtor_id,
+                creditor_id=creditor_id,
+                amount=amount
+            ))
+            written += 1
+
+        db.commit()
+        return written
@@ -3,9 +3,12 @@ Group Finance Management Service
 Handles household/roommate/team finance groups
 """
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, and_
 from models import Group, GroupMember, GroupInvite, User, Expense, GroupRole, InviteStatus
+from rollup_service import RollupService
+from group_balance_service import GroupBalanceService
+from pagination import keyset_page, DEFAULT_PAGE_SIZE
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import secrets
@@ -46,17 +49,17 @@ class GroupService:
     @staticmethod
     def get_user_groups(db: Session, user_id: int) -> List[Group]:
         """Get all groups user is member of"""
-        memberships = db.query(GroupMember).filter(
+        return db.query(Group).join(
+            GroupMember, GroupMember.group_id == Group.id
+        ).filter(
             GroupMember.user_id == user_id
-        ).all()
-        
-        return [membership.group for membership in memberships]
+        ).order_by(GroupMember.id).all()
     
     @staticmethod
     def get_group_details(db: Session, group_id: int, user_id: int) -> Optional[Dict]:
         """Get detailed group information"""
-        # Check if user is member
-        membership = db.query(GroupMember).filter(
+        # Check if user is member (the group comes back in the same query)
+        membership = db.query(GroupMember).options(joinedload(GroupMember.group)).filter(
             and_(
                 GroupMember.group_id == group_id,
                 GroupMember.user_id == user_id
@@ -66,22 +69,23 @@ class GroupService:
         if not membership:
             return None
         
-        group = db.query(Group).filter(Group.id == group_id).first()
+        group = membership.group
         if not group:
             return None
         
-        # Get all members
-        members = db.query(GroupMember).filter(
+        # Get all members with their emails
+        members = db.query(GroupMember, User.email).outerjoin(
+            User, User.id == GroupMember.user_id
+        ).filter(
             GroupMember.group_id == group_id
-        ).all()
+        ).order_by(GroupMember.id).all()
         
         member_list = []
-        for member in members:
-            user = db.query(User).filter(User.id == member.user_id).first()
+        for member, email in members:
             member_list.append({
                 "id": member.id,
                 "user_id": member.user_id,
-                "email": user.email if user else "Unknown",
+                "email": email or "Unknown",
                 "role": member.role.value,
                 "joined_at": member.joined_at.isoformat()
             })
@@ -196,10 +200,11 @@ class GroupService:
         return member
     
     @staticmethod
-    def get_group_expenses(db: Session, group_id: int, user_id: int) -> List[Dict]:
-        """Get all expenses for a group"""
+    def get_group_expenses(db: Session, group_id: int, user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                           before: str = None, after: str = None) -> Dict:
+        """One newest-first page of a group's expenses, each with its payer's email"""
         # Verify membership
-        membership = db.query(GroupMember).filter(
+        membership = db.query(GroupMember.id).filter(
             and_(
                 GroupMember.group_id == group_id,
                 GroupMember.user_id == user_id
@@ -209,24 +214,24 @@ class GroupService:
         if not membership:
             raise PermissionError("Not a member of this group")
         
-        expenses = db.query(Expense).filter(
+        query = db.query(Expense).options(joinedload(Expense.owner)).filter(
             Expense.group_id == group_id
-        ).order_by(Expense.date.desc()).all()
+        )
+        page = keyset_page(query, Expense.date, Expense.id, limit, before, after)
         
-        result = []
-        for expense in expenses:
-            owner = db.query(User).filter(User.id == expense.user_id).first()
-            result.append({
+        page["items"] = [
+            {
                 "id": expense.id,
                 "amount": expense.amount,
                 "category": expense.category,
                 "date": expense.date.isoformat(),
                 "note": expense.note,
-                "paid_by": owner.email if owner else "Unknown",
+                "paid_by": expense.owner.email if expense.owner else "Unknown",
                 "paid_by_id": expense.user_id
-            })
-        
-        return result
+            }
+            for expense in page["items"]
+        ]
+        return page
     
     @staticmethod
     def remove_member(db: Session, group_id: int, member_id: int, removed_by: int) -> bool:
@@ -309,6 +314,16 @@ class GroupService:
         
         group = db.query(Group).filter(Group.id == group_id).first()
         if group:
+            # Group expenses are cascade-deleted, so take them out of each owner's rollup
+            owned_rows = {}
+            for expense in group.expenses:
+                owned_rows.setdefault(expense.user_id, []).append(
+                    (expense.category, expense.date, expense.amount)
+                )
+            for owner_id, rows in owned_rows.items():
+                RollupService.apply_deltas(db, owner_id, RollupService.collect_deltas(rows, sign=-1))
+            GroupBalanceService.clear(db, group_id)
+            
             db.delete(group)
             db.commit()
             return True
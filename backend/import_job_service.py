@@ -0,0 +1,305 @@
+"""
+Import Job Service
+Runs large CSV imports in the background with progress, cancellation and
+row-offset checkpoints, so a restarted server resumes instead of re-importing
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_
+from concurrent.futures import ThreadPoolExecutor
+from models import ImportJob, ImportStatus
+from database import SessionLocal
+from csv_import import CSVImportService, SUMMARY_SAMPLE_SIZE
+from sqlite_writer import run_write
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, List, Optional
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+IMPORT_WORKERS = int(os.environ.get("CSV_IMPORT_WORKERS", 2))
+# Where uploads are kept until their job ends; must survive a restart to resume
+IMPORT_UPLOAD_DIR = os.environ.get("CSV_IMPORT_DIR", os.path.join(tempfile.gettempdir(), "expense_imports"))
+# A running job without a checkpoint for this long is treated as abandoned
+IMPORT_STALE_SECONDS = int(os.environ.get("CSV_IMPORT_STALE_SECONDS", 120))
+# How often each process looks for queued and abandoned jobs to pick up
+IMPORT_SWEEP_SECONDS = float(os.environ.get("CSV_IMPORT_SWEEP_SECONDS", 30))
+
+FINISHED = (ImportStatus.COMPLETED, ImportStatus.FAILED, ImportStatus.CANCELLED)
+MISSING_UPLOAD_ERROR = (
+    "The uploaded file is no longer available, so the import cannot resume. "
+    "Upload it again; rows that were already imported are skipped as duplicates."
+)
+
+
+def check_upload_dir() -> bool:
+    """Warn at startup when uploads live in the temp dir, which many hosts wipe on restart"""
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    upload_dir = os.path.realpath(IMPORT_UPLOAD_DIR)
+    if os.path.commonpath([temp_dir, upload_dir]) != temp_dir:
+        return True
+    print(f"⚠️  CSV_IMPORT_DIR ({upload_dir}) is in the temp dir; background imports interrupted by a "
+          f"restart cannot resume if it is cleared. Point CSV_IMPORT_DIR at persistent storage.")
+    return False
+
+
+class ImportJobService:
+    """Import job rows: creation, progress checkpoints and status changes"""
+
+    @staticmethod
+    def store_upload(upload: BinaryIO) -> str:
+        """Copy an upload to the import directory in chunks and return its path"""
+        os.makedirs(IMPORT_UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(IMPORT_UPLOAD_DIR, f"{uuid.uuid4().hex}.csv")
+        with open(path, "wb") as target:
+            shutil.copyfileobj(upload, target)
+        return path
+
+    @staticmethod
+    def create_job(db: Session, user_id: int, filename: str, file_path: str) -> ImportJob:
+        job = ImportJob(user_id=user_id, filename=filename, file_path=file_path)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id: int, user_id: int) -> Optional[ImportJob]:
+        return db.query(ImportJob).filter(ImportJob.id == job_id, ImportJob.user_id == user_id).first()
+
+    @staticmethod
+    def request_cancel(db: Session, job_id: int, user_id: int) -> Optional[ImportJob]:
+        """
+        Cancel a job. A queued job is cancelled at once; a running one stops
+        before its next batch. Finished jobs are returned unchanged.
+        """
+        job = ImportJobService.get_job(db, job_id, user_id)
+        if not job or job.status in FINISHED:
+            return job
+
+        job.cancel_requested = True
+        if job.status == ImportStatus.QUEUED:
+            job.status = ImportStatus.CANCELLED
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def is_cancel_requested(db: Session, job_id: int) -> bool:
+        return bool(db.query(ImportJob.cancel_requested).filter(ImportJob.id == job_id).scalar())
+
+    @staticmethod
+    def claim(db: Session, job_id: int) -> bool:
+        """
+        Mark a queued (or abandoned running) job as running. The conditional
+        update lets only one worker, in one process, pick a job up.
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+        claimed = db.query(ImportJob).filter(
+            ImportJob.id == job_id,
+            or_(
+                ImportJob.status == ImportStatus.QUEUED,
+                and_(ImportJob.status == ImportStatus.RUNNING, ImportJob.updated_at < stale_before)
+            )
+        ).update({
+            ImportJob.status: ImportStatus.RUNNING,
+            ImportJob.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    @staticmethod
+    def checkpoint(db: Session, job_id: int, last_row: int, progress: Dict) -> None:
+        """
+        Record one batch's progress in the caller's transaction, which also
+        holds the batch's expenses, so offset and rows commit together
+        """
+        job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+        job.row_offset = last_row
+        job.rows_parsed += progress['rows_parsed']
+        job.imported += progress['imported']
+        job.duplicates += progress['duplicates']
+        job.failed += progress['failed']
+        job.parse_errors += progress['parse_errors']
+        job.batches += 1
+        job.updated_at = datetime.utcnow()
+
+        details = ImportJobService._details(job)
+        for key in ('duplicate_records', 'failed_records', 'errors'):
+            room = SUMMARY_SAMPLE_SIZE - len(details[key])
+            if room > 0:
+                details[key].extend(progress[key][:room])
+        for category, count in progress['category_summary'].items():
+            details['category_summary'][category] = details['category_summary'].get(category, 0) + count
+        job.details = json.dumps(details)
+
+    @staticmethod
+    def finish(db: Session, job_id: int, status: ImportStatus, error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        db.query(ImportJob).filter(ImportJob.id == job_id).update({
+            ImportJob.status: status,
+            ImportJob.error: error,
+            ImportJob.updated_at: now,
+            ImportJob.finished_at: now
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def pending_job_ids(db: Session) -> List[int]:
+        """Queued jobs and running jobs left behind by a stopped process"""
+        stale_before = datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+        rows = db.query(ImportJob.id).filter(or_(
+            ImportJob.status == ImportStatus.QUEUED,
+            and_(ImportJob.status == ImportStatus.RUNNING, ImportJob.updated_at < stale_before)
+        )).order_by(ImportJob.id).all()
+        return [job_id for job_id, in rows]
+
+    @staticmethod
+    def _details(job: ImportJob) -> Dict:
+        if job.details:
+            return json.loads(job.details)
+        return {'duplicate_records': [], 'failed_records': [], 'errors': [], 'category_summary': {}}
+
+    @staticmethod
+    def to_dict(job: ImportJob) -> Dict:
+        return {
+            "id": job.id,
+            "filename": job.filename,
+            "status": job.status.value,
+            "cancel_requested": job.cancel_requested,
+            "row_offset": job.row_offset,
+            "rows_parsed": job.rows_parsed,
+            "imported": job.imported,
+            "duplicates": job.duplicates,
+            "failed": job.failed,
+            "parse_errors": job.parse_errors,
+            "batches": job.batches,
+            "error": job.error,
+            "created_at": job.created_at.isoformat(),
+            "updated_at": job.updated_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            **ImportJobService._details(job)
+        }
+
+
+class ImportWorkerPool:
+    """
+    In-process thread pool that runs import jobs, plus a daemon thread that
+    periodically sweeps for queued jobs and running jobs whose process died
+    """
+
+    def __init__(self, workers: int, sweep_interval: float):
+        self.workers = workers
+        self.sweep_interval = sweep_interval
+        self._executor = None
+        self._sweeper = None
+        self._start_lock = threading.Lock()
+        # Jobs queued or running in this process, so a sweep never queues them twice
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self.sweeps = 0
+
+    def _ensure_started(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._start_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="csv-import")
+        return self._executor
+
+    def ensure_sweeping(self):
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        with self._start_lock:
+            if self._sweeper and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep, name="csv-import-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def submit(self, job_id: int):
+        with self._pending_lock:
+            if job_id in self._pending:
+                return None
+            self._pending.add(job_id)
+        future = self._ensure_started().submit(self.run_job, job_id)
+        future.add_done_callback(lambda _: self._discard(job_id))
+        return future
+
+    def _discard(self, job_id: int):
+        with self._pending_lock:
+            self._pending.discard(job_id)
+
+    def resume_pending(self) -> List[int]:
+        """Queue every unfinished job not already queued here; returns the ids queued"""
+        db = SessionLocal()
+        try:
+            job_ids = ImportJobService.pending_job_ids(db)
+        finally:
+            db.close()
+        return [job_id for job_id in job_ids if self.submit(job_id) is not None]
+
+    def _sweep(self):
+        # The first pass runs at startup; later ones catch jobs abandoned by a
+        # process that stopped shortly before this one started
+        while True:
+            try:
+                self.resume_pending()
+                self.sweeps += 1
+            except Exception as e:
+                print(f"⚠️  Import job sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def run_job(self, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            if not run_write(db, lambda session: ImportJobService.claim(session, job_id)):
+                return
+            job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+            user_id, file_path, start_row = job.user_id, job.file_path, job.row_offset
+            db.rollback()
+
+            def should_stop() -> bool:
+                # A short session of its own, so the flag is never read from an old snapshot
+                with SessionLocal() as check:
+                    return ImportJobService.is_cancel_requested(check, job_id)
+
+            error = None
+            try:
+                if should_stop():
+                    status = ImportStatus.CANCELLED
+                elif not os.path.exists(file_path):
+                    print(f"⚠️  Import job {job_id}: upload {file_path} is missing; is CSV_IMPORT_DIR persistent?")
+                    status, error = ImportStatus.FAILED, MISSING_UPLOAD_ERROR
+                else:
+                    with open(file_path, "rb") as upload:
+                        summary = CSVImportService.import_stream(
+                            user_id,
+                            CSVImportService.decode_lines(upload),
+                            lambda write_job: run_write(db, write_job),
+                            start_row=start_row,
+                            checkpoint=lambda session, last_row, progress: ImportJobService.checkpoint(
+                                session, job_id, last_row, progress
+                            ),
+                            should_stop=should_stop
+                        )
+                    status = ImportStatus.CANCELLED if summary.get('cancelled') else ImportStatus.COMPLETED
+            except Exception as e:
+                db.rollback()
+                status, error = ImportStatus.FAILED, str(e)
+
+            # A session of its own, so a broken import session can't leave the job RUNNING
+            with SessionLocal() as finish_db:
+                run_write(finish_db, lambda session: ImportJobService.finish(session, job_id, status, error))
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            print(f"⚠️  Import job {job_id} failed: {e}")
+        finally:
+            db.close()
+
+
+import_workers = ImportWorkerPool(IMPORT_WORKERS, IMPORT_SWEEP_SECONDS)
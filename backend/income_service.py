@@ -3,9 +3,14 @@ Income Service
 Handles income tracking and management
 """
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from models import Income
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+from pagination import keyset_page, DEFAULT_PAGE_SIZE
+from response_cache import mark_ledger_changed
+from aggregate_snapshot import AggregateSnapshot, as_date
+from rollup_service import IncomeRollupService, month_key
 
 class IncomeService:
     """Service for managing income entries"""
@@ -33,6 +38,24 @@ class IncomeService:
         """Get all incomes for a user"""
         return db.query(Income).filter(Income.user_id == user_id).order_by(Income.date.desc()).all()
     
+    @classmethod
+    def get_incomes_page(cls, db: Session, user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                         before: str = None, after: str = None, start_date=None, end_date=None,
+                         category: str = None, min_amount: float = None, max_amount: float = None):
+        """One newest-first page of incomes, filtered in SQL"""
+        query = db.query(Income).filter(Income.user_id == user_id)
+        if start_date:
+            query = query.filter(Income.date >= start_date)
+        if end_date:
+            query = query.filter(Income.date <= end_date)
+        if category:
+            query = query.filter(Income.category == category)
+        if min_amount is not None:
+            query = query.filter(Income.amount >= min_amount)
+        if max_amount is not None:
+            query = query.filter(Income.amount <= max_amount)
+        return keyset_page(query, Income.date, Income.id, limit, before, after)
+    
     @classmethod
     def create_income(cls, db: Session, amount: float, category: str, date, note: str, user_id: int):
         """Create a new income entry"""
@@ -44,6 +67,8 @@ class IncomeService:
             user_id=user_id
         )
         db.add(income)
+        IncomeRollupService.apply_change(db, user_id, new=(category, date, amount))
+        mark_ledger_changed(db, user_id)
         db.commit()
         db.refresh(income)
         return income
@@ -53,10 +78,16 @@ class IncomeService:
         """Update an existing income entry"""
         income = db.query(Income).filter(Income.id == income_id, Income.user_id == user_id).first()
         if income:
+            IncomeRollupService.apply_change(
+                db, user_id,
+                old=(income.category, income.date, income.amount),
+                new=(category, date, amount)
+            )
             income.amount = amount
             income.category = category
             income.date = date
             income.note = note
+            mark_ledger_changed(db, user_id)
             db.commit()
             db.refresh(income)
         return income
@@ -66,44 +97,65 @@ class IncomeService:
         """Delete an income entry"""
         income = db.query(Income).filter(Income.id == income_id, Income.user_id == user_id).first()
         if income:
+            IncomeRollupService.apply_change(db, user_id, old=(income.category, income.date, income.amount))
             db.delete(income)
+            mark_ledger_changed(db, user_id)
             db.commit()
             return True
         return False
     
+    @staticmethod
+    def _month_window(start_date, end_date):
+        """(start_month, end_month) when the window is whole months, else None"""
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        if start_date and start_date.day != 1:
+            return None
+        if end_date and (end_date + timedelta(days=1)).day != 1:
+            return None
+        return (
+            month_key(start_date) if start_date else None,
+            month_key(end_date) if end_date else None
+        )
+    
     @classmethod
     def get_total_income(cls, db: Session, user_id: int, start_date=None, end_date=None):
         """Get total income for a period"""
-        query = db.query(Income).filter(Income.user_id == user_id)
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot and snapshot.covers_date(start_date):
+            return snapshot.get_total_income(start_date, end_date)
+        
+        # Whole-month windows come straight from the monthly rollup
+        months = cls._month_window(start_date, end_date)
+        if months:
+            return IncomeRollupService.get_total(db, user_id, *months)
+        
+        query = db.query(func.sum(Income.amount)).filter(Income.user_id == user_id)
         
         if start_date:
-            query = query.filter(Income.date >= start_date)
+            query = query.filter(Income.date >= as_date(start_date))
         if end_date:
-            query = query.filter(Income.date <= end_date)
+            query = query.filter(Income.date <= as_date(end_date))
         
-        incomes = query.all()
-        return sum(income.amount for income in incomes)
+        return float(query.scalar() or 0)
     
     @classmethod
     def get_income_by_category(cls, db: Session, user_id: int, start_date=None, end_date=None):
         """Get income breakdown by category"""
-        query = db.query(Income).filter(Income.user_id == user_id)
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot and snapshot.covers_date(start_date):
+            return snapshot.get_income_by_category(start_date, end_date)
+        
+        query = db.query(Income.category, func.sum(Income.amount)).filter(Income.user_id == user_id)
         
         if start_date:
-            query = query.filter(Income.date >= start_date)
+            query = query.filter(Income.date >= as_date(start_date))
         if end_date:
-            query = query.filter(Income.date <= end_date)
-        
-        incomes = query.all()
+            query = query.filter(Income.date <= as_date(end_date))
         
-        category_totals = {}
-        for income in incomes:
-            if income.category in category_totals:
-                category_totals[income.category] += income.amount
-            else:
-                category_totals[income.category] = income.amount
+        # Categories in order of first entry, as the breakdown has always listed them
+        rows = query.group_by(Income.category).order_by(func.min(Income.id)).all()
         
         return [
             {"category": cat, "amount": amt}
-            for cat, amt in category_totals.items()
+            for cat, amt in rows
         ]
@@ -0,0 +1,382 @@
+"""
+Columnar Ledger Snapshots
+Per-user expense history held as NumPy arrays for vectorized analytics.
+
+A snapshot is loaded once per user and kept in an LRU bounded by bytes. It
+is tagged with the user's ledger version: when a commit only appended
+expenses, the new rows are appended in place and the tag moves forward;
+any other expense change (update, delete, unknown writer) drops it and the
+next read reloads. Non-expense writes just move the tag.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Expense
+from response_cache import get_ledger_version, on_ledger_commit
+from aggregate_snapshot import as_date
+
+LEDGER_CACHE_BYTES = int(os.environ.get("LEDGER_CACHE_BYTES", 64 * 1024 * 1024))
+
+STAGED_KEY = "ledger_staged"
+
+# group_ids value for expenses outside any group
+NO_GROUP = -1
+
+CategoryMonthMatrix = namedtuple("CategoryMonthMatrix", ["categories", "months", "totals", "counts"])
+
+
+def _day(value) -> int:
+    return int(np.datetime64(as_date(value), "D").astype(np.int64))
+
+
+def _month_label(month_index: int) -> str:
+    return f"{1970 + month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+
+class LedgerSnapshot:
+    """
+    Expense columns for one user, in id order:
+    ids, days (days since 1970-01-01), months (months since 1970-01),
+    amounts, category codes and group ids (NO_GROUP for personal expenses).
+    """
+
+    _DTYPES = {"ids": np.int64, "days": np.int32, "months": np.int32,
+               "amounts": np.float64, "codes": np.int16, "group_ids": np.int64}
+
+    def __init__(self, user_id: int, version: int, capacity: int = 64):
+        self.user_id = user_id
+        self.version = version
+        self.categories: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._columns = {name: np.empty(capacity, dtype) for name, dtype in self._DTYPES.items()}
+        self._size = 0
+        self.max_id = 0
+
+    @classmethod
+    def load(cls, db: Session, user_id: int, version: int) -> "LedgerSnapshot":
+        rows = db.query(
+            Expense.id, Expense.date, Expense.amount, Expense.category, Expense.group_id
+        ).filter(Expense.user_id == user_id).order_by(Expense.id).all()
+        snapshot = cls(user_id, version, capacity=max(64, len(rows)))
+        snapshot.append(rows)
+        return snapshot
+
+    # ==================== WRITES ====================
+
+    def _code(self, category: str) -> int:
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def append(self, rows: Iterable[Tuple[int, date, float, str, Optional[int]]]) -> int:
+        """
+        Append (id, date, amount, category, group_id) rows. Rows at or below
+        max_id are already present (loaded after they committed) and skipped.
+        Slots below the current size never change, so concurrent readers that
+        sliced the columns earlier stay consistent.
+        """
+        rows = [row for row in rows if row[0] > self.max_id]
+        if not rows:
+            return 0
+
+        needed = self._size + len(rows)
+        columns = self._columns
+        if needed > len(columns["ids"]):
+            capacity = max(needed, 2 * len(columns["ids"]))
+            grown = {}
+            for name, column in columns.items():
+                grown[name] = np.empty(capacity, column.dtype)
+                grown[name][:self._size] = column[:self._size]
+            columns = grown
+
+        start, stop = self._size, needed
+        days = np.array([as_date(row[1]) for row in rows], dtype="datetime64[D]")
+        columns["ids"][start:stop] = [row[0] for row in rows]
+        columns["days"][start:stop] = days.astype(np.int64)
+        columns["months"][start:stop] = days.astype("datetime64[M]").astype(np.int64)
+        columns["amounts"][start:stop] = [row[2] for row in rows]
+        columns["codes"][start:stop] = [self._code(row[3]) for row in rows]
+        columns["group_ids"][start:stop] = [NO_GROUP if row[4] is None else row[4] for row in rows]
+
+        self._columns = columns
+        self._size = stop
+        self.max_id = max(self.max_id, max(row[0] for row in rows))
+        return len(rows)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns.values()) + sum(len(c) + 64 for c in self.categories)
+
+    def __len__(self) -> int:
+        return self._size
+
+    # ==================== COLUMNS ====================
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Read-only views of every column, all cut at the same length"""
+        size, columns = self._size, self._columns
+        return {name: column[:size] for name, column in columns.items()}
+
+    def mask(self, start=None, end=None, category: Optional[str] = None,
+             group_id: Optional[int] = None, columns: Optional[Dict] = None) -> np.ndarray:
+        """Boolean row mask for start <= date <= end (either bound optional)"""
+        columns = columns or self.columns()
+        selected = np.ones(len(columns["ids"]), dtype=bool)
+        if start is not None:
+            selected &= columns["days"] >= _day(start)
+        if end is not None:
+            selected &= columns["days"] <= _day(end)
+        if category is not None:
+            code = self._codes.get(category)
+            if code is None:
+                return np.zeros_like(selected)
+            selected &= columns["codes"] == code
+        if group_id is not None:
+            selected &= columns["group_ids"] == group_id
+        return selected
+
+    # ==================== VECTORIZED QUERIES ====================
+
+    def window_sum(self, start=None, end=None) -> float:
+        columns = self.columns()
+        return float(columns["amounts"][self.mask(start, end, columns=columns)].sum())
+
+    def amount_stats(self, start=None, end=None) -> Tuple[int, float, float]:
+        """(count, mean, population std) of amounts in the window"""
+        columns = self.columns()
+        amounts = columns["amounts"][self.mask(start, end, columns=columns)]
+        if len(amounts) == 0:
+            return 0, 0.0, 0.0
+        return len(amounts), float(amounts.mean()), float(amounts.std())
+
+    def zscores(self, start=None, end=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(ids, amounts, z) for every expense in the window, against the window's own mean/std"""
+        columns = self.columns()
+        selected = self.mask(start, end, columns=columns)
+        ids, amounts = columns["ids"][selected], columns["amounts"][selected]
+        std = amounts.std() if len(amounts) else 0.0
+        if std == 0:
+            return ids, amounts, np.zeros_like(amounts)
+        return ids, amounts, (amounts - amounts.mean()) / std
+
+    def category_month_matrix(self, start=None, end=None) -> CategoryMonthMatrix:
+        """
+        Spend grouped by category x month. Only categories and months with at
+        least one expense in the window appear; categories are in code order,
+        months ascending as "YYYY-MM".
+        """
+        columns = self.columns()
+        selected = self.mask(start, end, columns=columns)
+        months, month_idx = np.unique(columns["months"][selected], return_inverse=True)
+        codes, code_idx = np.unique(columns["codes"][selected], return_inverse=True)
+
+        cells = code_idx * len(months) + month_idx
+        shape = (len(codes), len(months))
+        totals = np.bincount(cells, weights=columns["amounts"][selected], minlength=shape[0] * shape[1]).reshape(shape)
+        counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+        return CategoryMonthMatrix(
+            [self.categories[code] for code in codes],
+            [_month_label(int(m)) for m in months],
+            totals,
+            counts
+        )
+
+    def monthly_totals(self, start=None, end=None) -> List[Tuple[str, float]]:
+        """[(month, total)] ascending, months without expenses omitted"""
+        matrix = self.category_month_matrix(start, end)
+        return list(zip(matrix.months, matrix.totals.sum(axis=0).tolist()))
+
+    def category_totals(self, start=None, end=None) -> Dict[str, Dict]:
+        """{category: {"total", "count"}} sorted by category name"""
+        matrix = self.category_month_matrix(start, end)
+        totals, counts = matrix.totals.sum(axis=1), matrix.counts.sum(axis=1)
+        order = np.argsort(matrix.categories, kind="stable") if matrix.categories else []
+        return {
+            matrix.categories[i]: {"total": float(totals[i]), "count": int(counts[i])}
+            for i in order
+        }
+
+    @staticmethod
+    def row_stats(matrix: CategoryMonthMatrix) -> Dict[str, np.ndarray]:
+        """
+        Per-category statistics over the months each category was active in:
+        n (active months), mean, std (population), last (latest active month's
+        total) and first (index of the first active month).
+        """
+        active = matrix.counts > 0
+        n = active.sum(axis=1)
+        safe_n = np.maximum(n, 1)
+        mean = np.where(active, matrix.totals, 0).sum(axis=1) / safe_n
+        deviations = np.where(active, matrix.totals - mean[:, None], 0)
+        std = np.sqrt((deviations ** 2).sum(axis=1) / safe_n)
+        last_col = active.shape[1] - 1 - np.argmax(active[:, ::-1], axis=1) if active.size else np.zeros(0, int)
+        first_col = np.argmax(active, axis=1) if active.size else np.zeros(0, int)
+        last = matrix.totals[np.arange(len(n)), last_col] if active.size else np.zeros(0)
+        return {"n": n, "mean": mean, "std": std, "last": last, "first": first_col}
+
+    def rollup_order(self, matrix: CategoryMonthMatrix) -> np.ndarray:
+        """Category row order matching rollup reads: by first active month, then name"""
+        if not matrix.categories:
+            return np.zeros(0, dtype=int)
+        first = self.row_stats(matrix)["first"]
+        return np.lexsort((np.array(matrix.categories), first))
+
+
+class LedgerCache:
+    """user_id -> (LedgerSnapshot, bytes), least recently used evicted first once over max_bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+        self.drops = 0
+        self.evictions = 0
+
+    def get(self, db: Session, user_id: int) -> LedgerSnapshot:
+        """The user's snapshot at the current ledger version, loading it on a miss"""
+        version = get_ledger_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0].version == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Version is read before loading: a write racing the load is either in
+        # the rows (and skipped by max_id when its append arrives) or retags us
+        snapshot = LedgerSnapshot.load(db, user_id, version)
+        with self._lock:
+            self._store(user_id, snapshot)
+        return snapshot
+
+    def _store(self, user_id: int, snapshot: LedgerSnapshot):
+        self._discard(user_id)
+        size = snapshot.nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[user_id] = (snapshot, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _discard(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def advance(self, user_id: int, version: int, staged: Optional[Dict]):
+        """Bring a cached snapshot to version, or drop it when the change can't be applied"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            snapshot = entry[0]
+            applicable = snapshot.version == version - 1 and (
+                staged is None or (not staged["reload"] and len(staged["rows"]) == staged["expected"])
+            )
+            if not applicable:
+                self._discard(user_id)
+                self.drops += 1
+                return
+            if staged and staged["rows"]:
+                snapshot.append(staged["rows"])
+                self.appends += 1
+                self._store(user_id, snapshot)
+            snapshot.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "incremental_appends": self.appends,
+                "drops": self.drops,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+ledger_cache = LedgerCache(LEDGER_CACHE_BYTES)
+
+
+def get_ledger(db: Session, user_id: int) -> LedgerSnapshot:
+    return ledger_cache.get(db, user_id)
+
+
+# ==================== WRITE STAGING ====================
+
+def _staged_entry(db: Session, user_id: int) -> Dict:
+    return db.info.setdefault(STAGED_KEY, {}).setdefault(
+        user_id, {"expected": 0, "rows": [], "reload": False}
+    )
+
+
+def note_expense_writes(db: Session, user_id: int, appended: int = 0, reload: bool = False):
+    """
+    Called by RollupService for every expense write: appended is how many
+    rows it added, reload marks changes to existing rows
+    """
+    entry = _staged_entry(db, user_id)
+    entry["expected"] += appended
+    entry["reload"] = entry["reload"] or reload
+
+
+def stage_expenses(db: Session, expenses: Iterable[Expense]):
+    """Stage new, already flushed expenses so cached snapshots can append them after commit"""
+    for expense in expenses:
+        stage_expense_rows(db, expense.user_id, [
+            (expense.id, expense.date, expense.amount, expense.category, expense.group_id)
+        ])
+
+
+def stage_expense_rows(db: Session, user_id: int, rows: Iterable[tuple]):
+    """Same as stage_expenses for rows inserted through Core: (id, date, amount, category, group_id)"""
+    _staged_entry(db, user_id)["rows"].extend(rows)
+
+
+def move_staged(source: dict, target: dict):
+    """Merge one session's staged writes into target (the SQLite writer's batch)"""
+    for user_id, entry in source.pop(STAGED_KEY, {}).items():
+        merged = target.setdefault(STAGED_KEY, {}).setdefault(
+            user_id, {"expected": 0, "rows": [], "reload": False}
+        )
+        merged["expected"] += entry["expected"]
+        merged["rows"].extend(entry["rows"])
+        merged["reload"] = merged["reload"] or entry["reload"]
+
+
+@on_ledger_commit
+def _advance_after_commit(user_id: int, version: int, info: dict):
+    ledger_cache.advance(user_id, version, info.get(STAGED_KEY, {}).pop(user_id, None))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged(session):
+    # Runs after the response cache's after_commit listener has consumed the staging
+    session.info.pop(STAGED_KEY, None)
@@ -1,33 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from pydantic import BaseModel
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 from typing import Optional
+from contextlib import asynccontextmanager
 import os
 
-from database import engine, get_db, Base
-from models import User, Expense, Budget, Income
+from database import engine, get_db, get_analytics_db, get_async_db, get_pool_metrics, Base
+from models import User, Expense, Budget, Income, PlanType
 from services import ExpenseService, BudgetService, AnalyticsService
 from income_service import IncomeService
 from ai_categorizer import AICategorizer
 from ai_assistant import AISpendingAssistant
 from ml_predictions import MLPredictionService
 from csv_import import CSVImportService
+from import_job_service import ImportJobService, import_workers, check_upload_dir
+from rollup_service import RollupService, IncomeRollupService
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from response_cache import cached_json, cached_json_async, etag_guard, get_cache_stats
+from sqlite_writer import run_write, run_write_async
+from ledger_snapshot import stage_expenses
 from sms_parser import SMSTransactionParser
 from auth import (
     get_password_hash, 
     authenticate_user, 
     create_access_token, 
     get_current_user,
-    get_user_by_email
+    get_current_user_async,
+    get_user_by_email,
+    token_claims,
+    Principal
 )
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Smart Expense Tracker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pick up CSV imports that were queued or running when the server stopped,
+    # then keep sweeping for jobs abandoned by other processes
+    check_upload_dir()
+    import_workers.ensure_sweeping()
+    yield
+
+app = FastAPI(title="Smart Expense Tracker API", lifespan=lifespan)
 
 # CORS - allow all origins so any Vercel preview/prod URL works
 app.add_middleware(
@@ -36,8 +56,18 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
+@app.exception_handler(PoolTimeoutError)
+def pool_timeout_handler(request, exc):
+    # Pool exhausted: shed load instead of surfacing a 500
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "2"}
+    )
+
 # Pydantic models
 class UserSignup(BaseModel):
     email: str
@@ -101,17 +131,21 @@ def signup(user_data: UserSignup, db: Session = Depends(get_db)):
     
     # Create new user
     hashed_password = get_password_hash(user_data.password)
-    new_user = User(email=user_data.email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    # Create FREE subscription for new user
     from subscription_service import SubscriptionService
-    SubscriptionService.create_subscription(db, new_user.id)
+
+    def create_user(session: Session) -> User:
+        user = User(email=user_data.email, hashed_password=hashed_password)
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        # Create FREE subscription for new user
+        SubscriptionService.create_subscription(session, user.id)
+        return user
+
+    new_user = run_write(db, create_user)
     
     # Create token
-    access_token = create_access_token(data={"sub": new_user.email})
+    access_token = create_access_token(data=token_claims(new_user, PlanType.FREE))
     
     return {
         "access_token": access_token,
@@ -128,7 +162,9 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect email or password"
         )
     
-    access_token = create_access_token(data={"sub": user.email})
+    from subscription_service import SubscriptionService
+    subscription = SubscriptionService.get_subscription(db, user.id)
+    access_token = create_access_token(data=token_claims(user, subscription.plan_type if subscription else None))
     
     return {
         "access_token": access_token,
@@ -137,7 +173,7 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
     }
 
 @app.get("/auth/me")
-def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: Principal = Depends(get_current_user)):
     return {"id": current_user.id, "email": current_user.email}
 
 # Protected Routes
@@ -145,9 +181,40 @@ def get_me(current_user: User = Depends(get_current_user)):
 def root():
     return {"message": "Smart Expense Tracker API"}
 
+def set_page_headers(response: Response, page: dict):
+    """Expose keyset cursors as headers so list endpoints keep returning a plain array"""
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    if page["prev_cursor"]:
+        response.headers["X-Prev-Cursor"] = page["prev_cursor"]
+
 @app.get("/expenses")
-def get_expenses(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    expenses = ExpenseService.get_all_expenses(db, current_user.id)
+async def get_expenses(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    group_id: Optional[int] = None,
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("expenses", get_current_user_async, vary_on_query=True)),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Newest-first page of expenses. Pass X-Next-Cursor as `before` for older rows,
+    X-Prev-Cursor as `after` for newer ones."""
+    try:
+        page = await db.run_sync(lambda session: ExpenseService.get_expenses_page(
+            session, current_user.id, limit, before, after, start_date, end_date,
+            category, min_amount, max_amount, group_id
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, page)
+    expenses = page["items"]
     return [
         {
             "id": e.id,
@@ -159,10 +226,20 @@ def get_expenses(current_user: User = Depends(get_current_user), db: Session = D
         for e in expenses
     ]
 
+@app.get("/expenses/summary")
+def get_expenses_summary(
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("expenses-summary")),
+    db: Session = Depends(get_db)
+):
+    """Count and total of all expenses, from the rollups; /expenses only returns one page"""
+    count, total = RollupService.get_overall(db, current_user.id)
+    return {"count": count, "total": round(total, 2)}
+
 @app.post("/expenses")
 def create_expense(
     expense: ExpenseCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Auto-categorize if category not provided
@@ -172,9 +249,9 @@ def create_expense(
     elif not category:
         category = "Misc"
     
-    new_expense = ExpenseService.create_expense(
-        db, expense.amount, category, expense.date, expense.note, current_user.id
-    )
+    new_expense = run_write(db, lambda session: ExpenseService.create_expense(
+        session, expense.amount, category, expense.date, expense.note, current_user.id
+    ))
     return {
         "id": new_expense.id,
         "amount": new_expense.amount,
@@ -187,12 +264,12 @@ def create_expense(
 def update_expense(
     expense_id: int,
     expense: ExpenseUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    updated = ExpenseService.update_expense(
-        db, expense_id, expense.amount, expense.category, expense.date, expense.note, current_user.id
-    )
+    updated = run_write(db, lambda session: ExpenseService.update_expense(
+        session, expense_id, expense.amount, expense.category, expense.date, expense.note, current_user.id
+    ))
     if not updated:
         raise HTTPException(status_code=404, detail="Expense not found")
     return {
@@ -206,10 +283,10 @@ def update_expense(
 @app.delete("/expenses/{expense_id}")
 def delete_expense(
     expense_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    success = ExpenseService.delete_expense(db, expense_id, current_user.id)
+    success = run_write(db, lambda session: ExpenseService.delete_expense(session, expense_id, current_user.id))
     if not success:
         raise HTTPException(status_code=404, detail="Expense not found")
     return {"message": "Expense deleted"}
@@ -224,31 +301,73 @@ def get_categories():
     return {"categories": AICategorizer.get_categories()}
 
 @app.get("/budgets")
-def get_budgets(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_budgets(
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("budgets")),
+    db: Session = Depends(get_db)
+):
     budgets = BudgetService.get_all_budgets(db, current_user.id)
     return [{"id": b.id, "category": b.category, "amount": b.amount} for b in budgets]
 
 @app.post("/budgets")
 def set_budget(
     budget: BudgetCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    new_budget = BudgetService.set_budget(db, budget.category, budget.amount, current_user.id)
+    new_budget = run_write(db, lambda session: BudgetService.set_budget(
+        session, budget.category, budget.amount, current_user.id
+    ))
     return {"id": new_budget.id, "category": new_budget.category, "amount": new_budget.amount}
 
 @app.get("/analytics/summary")
-def get_summary(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return AnalyticsService.get_summary(db, current_user.id)
+async def get_summary(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("analytics/summary", get_current_user_async))
+):
+    return await cached_json_async(
+        "analytics/summary", current_user.id,
+        lambda session: AnalyticsService.get_summary(session, current_user.id),
+        etag=etag
+    )
 
 @app.get("/analytics/insights")
-def get_insights(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return {"insights": AnalyticsService.get_insights(db, current_user.id)}
+async def get_insights(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("analytics/insights", get_current_user_async))
+):
+    return await cached_json_async(
+        "analytics/insights", current_user.id,
+        lambda session: {"insights": AnalyticsService.get_insights(session, current_user.id)},
+        etag=etag
+    )
 
 # Income Routes
 @app.get("/incomes")
-def get_incomes(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    incomes = IncomeService.get_all_incomes(db, current_user.id)
+def get_incomes(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("incomes", vary_on_query=True)),
+    db: Session = Depends(get_db)
+):
+    """Newest-first page of incomes, paginated like /expenses"""
+    try:
+        page = IncomeService.get_incomes_page(
+            db, current_user.id, limit, before, after, start_date, end_date,
+            category, min_amount, max_amount
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, page)
+    incomes = page["items"]
     return [
         {
             "id": i.id,
@@ -260,15 +379,25 @@ def get_incomes(current_user: User = Depends(get_current_user), db: Session = De
         for i in incomes
     ]
 
+@app.get("/incomes/summary")
+def get_incomes_summary(
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("incomes-summary")),
+    db: Session = Depends(get_db)
+):
+    """Count and total of all incomes, from the rollups; /incomes only returns one page"""
+    count, total = IncomeRollupService.get_overall(db, current_user.id)
+    return {"count": count, "total": round(total, 2)}
+
 @app.post("/incomes")
 def create_income(
     income: IncomeCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    new_income = IncomeService.create_income(
-        db, income.amount, income.category, income.date, income.note, current_user.id
-    )
+    new_income = run_write(db, lambda session: IncomeService.create_income(
+        session, income.amount, income.category, income.date, income.note, current_user.id
+    ))
     return {
         "id": new_income.id,
         "amount": new_income.amount,
@@ -281,12 +410,12 @@ def create_income(
 def update_income(
     income_id: int,
     income: IncomeUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    updated = IncomeService.update_income(
-        db, income_id, income.amount, income.category, income.date, income.note, current_user.id
-    )
+    updated = run_write(db, lambda session: IncomeService.update_income(
+        session, income_id, income.amount, income.category, income.date, income.note, current_user.id
+    ))
     if not updated:
         raise HTTPException(status_code=404, detail="Income not found")
     return {
@@ -300,10 +429,10 @@ def update_income(
 @app.delete("/incomes/{income_id}")
 def delete_income(
     income_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    success = IncomeService.delete_income(db, income_id, current_user.id)
+    success = run_write(db, lambda session: IncomeService.delete_income(session, income_id, current_user.id))
     if not success:
         raise HTTPException(status_code=404, detail="Income not found")
     return {"message": "Income deleted"}
@@ -313,42 +442,22 @@ def get_income_categories():
     return {"categories": IncomeService.get_categories()}
 
 @app.get("/analytics/financial-summary")
-def get_financial_summary(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_financial_summary(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("analytics/financial-summary", get_current_user_async))
 ):
     """Get complete financial summary with income and expenses"""
-    now = datetime.now()
-    current_month_start = now.replace(day=1)
-    
-    # Get current month income and expenses
-    total_income = IncomeService.get_total_income(db, current_user.id, current_month_start)
-    total_expenses_result = db.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id,
-        Expense.date >= current_month_start
-    ).scalar()
-    total_expenses = float(total_expenses_result) if total_expenses_result else 0
-    
-    net_balance = total_income - total_expenses
-    savings_rate = (net_balance / total_income * 100) if total_income > 0 else 0
-    
-    # Get income breakdown
-    income_breakdown = IncomeService.get_income_by_category(db, current_user.id, current_month_start)
-    
-    return {
-        "total_income": total_income,
-        "total_expenses": total_expenses,
-        "net_balance": net_balance,
-        "savings_rate": round(savings_rate, 2),
-        "month": now.strftime('%B %Y'),
-        "income_breakdown": income_breakdown
-    }
+    return await cached_json_async(
+        "analytics/financial-summary", current_user.id,
+        lambda session: AnalyticsService.get_financial_summary(session, current_user.id),
+        etag=etag
+    )
 
 # AI Chat Routes
 @app.post("/ai/chat")
 def chat_with_ai(
     chat: ChatMessage,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """AI-powered spending assistant endpoint."""
@@ -367,8 +476,9 @@ def get_chat_suggestions():
 # ML Prediction Routes
 @app.get("/ml/predict-next-month")
 def predict_next_month(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("ml/predict-next-month")),
+    db: Session = Depends(get_analytics_db)
 ):
     """Predict next month's spending using ML."""
     prediction = MLPredictionService.predict_next_month(current_user.id, db)
@@ -376,8 +486,9 @@ def predict_next_month(
 
 @app.get("/ml/anomalies")
 def detect_anomalies(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("ml/anomalies")),
+    db: Session = Depends(get_analytics_db)
 ):
     """Detect spending anomalies and unusual patterns."""
     anomalies = MLPredictionService.detect_anomalies(current_user.id, db)
@@ -385,8 +496,9 @@ def detect_anomalies(
 
 @app.get("/ml/insights")
 def get_ml_insights(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("ml/insights")),
+    db: Session = Depends(get_analytics_db)
 ):
     """Get comprehensive ML-based insights."""
     insights = MLPredictionService.get_spending_insights(current_user.id, db)
@@ -394,45 +506,46 @@ def get_ml_insights(
 
 # CSV Import Routes
 @app.post("/expenses/import-csv")
-async def import_csv(
+def import_csv(
+    response: Response,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    background: bool = Query(False, description="Queue the import as a job and return its id"),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Import expenses from CSV file."""
+    """Import expenses from CSV file, streamed and committed in batches."""
     # Validate file type
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
     
-    # Read file content
-    content = await file.read()
-    try:
-        file_content = content.decode('utf-8')
-    except UnicodeDecodeError:
-        # Try with different encoding
-        try:
-            file_content = content.decode('latin-1')
-        except:
-            raise HTTPException(status_code=400, detail="Unable to decode file. Please ensure it's a valid CSV")
+    if background:
+        file_path = ImportJobService.store_upload(file.file)
+        job = run_write(db, lambda session: ImportJobService.create_job(
+            session, current_user.id, file.filename, file_path
+        ))
+        import_workers.submit(job.id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return ImportJobService.to_dict(job)
     
-    # Parse CSV
-    parsed_rows, errors = CSVImportService.parse_csv(file_content)
+    # The upload is spooled to disk; read it line by line instead of all at once
+    result = CSVImportService.import_stream(
+        current_user.id,
+        CSVImportService.decode_lines(file.file),
+        lambda job: run_write(db, job)
+    )
     
-    if not parsed_rows:
+    if not result['total_rows']:
         raise HTTPException(
             status_code=400, 
-            detail=f"No valid rows found. Errors: {', '.join(errors[:3])}"
+            detail=f"No valid rows found. Errors: {', '.join(result['errors'][:3])}"
         )
     
-    # Import expenses
-    result = CSVImportService.import_expenses(current_user.id, parsed_rows, db)
-    
     return result
 
 @app.post("/expenses/validate-csv")
 async def validate_csv(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Validate CSV format and return preview."""
     if not file.filename.endswith('.csv'):
@@ -451,11 +564,38 @@ async def validate_csv(
     return validation
 
 
+# ==================== IMPORT JOB ROUTES ====================
+
+@app.get("/imports/{job_id}")
+def get_import_job(
+    job_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Progress of a background CSV import"""
+    job = ImportJobService.get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return ImportJobService.to_dict(job)
+
+@app.post("/imports/{job_id}/cancel")
+def cancel_import_job(
+    job_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a background CSV import; batches already committed are kept"""
+    job = run_write(db, lambda session: ImportJobService.request_cancel(session, job_id, current_user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return ImportJobService.to_dict(job)
+
+
 # SMS Webhook Routes
 @app.post("/sms/webhook")
 async def sms_webhook(
     sms: SMSWebhook,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -474,33 +614,43 @@ async def sms_webhook(
     # Auto-categorize using ML
     category = AICategorizer.predict_category(parsed['note'])
     
-    # Check for duplicates (same amount, date, and merchant)
-    existing = db.query(Expense).filter(
-        Expense.user_id == current_user.id,
-        Expense.date == parsed['date'],
-        Expense.amount == parsed['amount'],
-        Expense.note.contains(parsed['merchant'])
-    ).first()
+    def save(session: Session):
+        # Duplicate check and insert run in the same write so two deliveries
+        # of one SMS can't both pass the check
+        existing = session.query(Expense).filter(
+            Expense.user_id == current_user.id,
+            Expense.date == parsed['date'],
+            Expense.amount == parsed['amount'],
+            Expense.note.contains(parsed['merchant'])
+        ).first()
+        if existing:
+            return existing, False
+
+        new_expense = Expense(
+            user_id=current_user.id,
+            date=parsed['date'],
+            amount=parsed['amount'],
+            category=category,
+            note=parsed['note']
+        )
+        session.add(new_expense)
+        RollupService.record_expense(session, current_user.id, category, parsed['date'], parsed['amount'])
+        session.flush()
+        stage_expenses(session, [new_expense])
+        session.commit()
+        session.refresh(new_expense)
+        return new_expense, True
+
+    # Check for duplicates (same amount, date, and merchant) and create expense
+    new_expense, created = await run_write_async(db, save)
     
-    if existing:
+    if not created:
         return {
             "status": "duplicate",
             "message": "Transaction already exists",
-            "expense_id": existing.id
+            "expense_id": new_expense.id
         }
     
-    # Create expense
-    new_expense = Expense(
-        user_id=current_user.id,
-        date=parsed['date'],
-        amount=parsed['amount'],
-        category=category,
-        note=parsed['note']
-    )
-    db.add(new_expense)
-    db.commit()
-    db.refresh(new_expense)
-    
     return {
         "status": "success",
         "message": "Expense created from SMS",
@@ -597,84 +747,129 @@ class GoalUpdate(BaseModel):
 # ==================== FORECASTING ENDPOINTS ====================
 
 @app.get("/forecast/next-month")
-def forecast_next_month(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def forecast_next_month(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("forecast/next-month", get_current_user_async))
 ):
     """Forecast total spending for next month"""
-    return ForecastingService.forecast_next_month(db, current_user.id)
+    return await cached_json_async(
+        "forecast/next-month", current_user.id,
+        lambda session: ForecastingService.forecast_next_month(session, current_user.id),
+        etag=etag
+    )
 
 @app.get("/forecast/by-category")
-def forecast_by_category(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def forecast_by_category(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("forecast/by-category", get_current_user_async))
 ):
     """Forecast spending by category for next month"""
-    return ForecastingService.forecast_by_category(db, current_user.id)
+    return await cached_json_async(
+        "forecast/by-category", current_user.id,
+        lambda session: ForecastingService.forecast_by_category(session, current_user.id),
+        etag=etag
+    )
 
 @app.get("/forecast/trend")
-def get_spending_trend(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_spending_trend(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("forecast/trend", get_current_user_async))
 ):
     """Get spending trend analysis"""
-    return ForecastingService.get_spending_trend(db, current_user.id)
+    return await cached_json_async(
+        "forecast/trend", current_user.id,
+        lambda session: ForecastingService.get_spending_trend(session, current_user.id),
+        etag=etag
+    )
 
 
 # ==================== FINANCIAL HEALTH ENDPOINTS ====================
 
 @app.get("/health/score")
 def get_financial_health_score(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("health/score", get_current_user))
 ):
     """Get comprehensive financial health score (0-100)"""
-    return FinancialHealthService.calculate_health_score(db, current_user.id)
+    return cached_json(
+        "health/score", current_user.id,
+        lambda db: FinancialHealthService.get_daily_score(db, current_user.id),
+        etag=etag
+    )
+
+@app.get("/health/history")
+def get_financial_health_history(
+    days: int = Query(30, ge=1, le=365),
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("health/history", get_current_user, vary_on_query=True))
+):
+    """Daily financial health scores for the last N days, oldest first"""
+    return cached_json(
+        f"health/history:{days}", current_user.id,
+        lambda db: FinancialHealthService.get_history(db, current_user.id, days),
+        etag=etag
+    )
 
 
 # ==================== ANOMALY DETECTION ENDPOINTS ====================
 
 @app.get("/anomalies/all")
 def get_all_anomalies(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("anomalies/all", get_current_user))
 ):
     """Get all detected anomalies"""
-    return AnomalyDetectionService.get_all_anomalies(db, current_user.id)
+    return cached_json(
+        "anomalies/all", current_user.id,
+        lambda db: AnomalyDetectionService.get_all_anomalies(db, current_user.id),
+        etag=etag
+    )
 
 @app.get("/anomalies/transactions")
 def get_transaction_anomalies(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("anomalies/transactions", get_current_user))
 ):
     """Get unusual transactions"""
-    return AnomalyDetectionService.detect_amount_anomalies(db, current_user.id)
+    return cached_json(
+        "anomalies/transactions", current_user.id,
+        lambda db: AnomalyDetectionService.detect_amount_anomalies(db, current_user.id),
+        etag=etag
+    )
 
 @app.get("/insights/behavioral")
 def get_behavioral_insights(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("insights/behavioral", get_current_user))
 ):
     """Get behavioral spending insights"""
-    return {"insights": AnomalyDetectionService.get_behavioral_insights(db, current_user.id)}
+    return cached_json(
+        "insights/behavioral", current_user.id,
+        lambda db: {"insights": AnomalyDetectionService.get_behavioral_insights(db, current_user.id)},
+        etag=etag
+    )
 
 
 # ==================== NET WORTH DASHBOARD ENDPOINTS ====================
 
 @app.get("/networth/dashboard")
-def get_networth_dashboard(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_networth_dashboard(
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("networth/dashboard", get_current_user_async))
 ):
     """Get comprehensive net worth dashboard"""
-    return NetWorthService.get_net_worth_dashboard(db, current_user.id)
+    return await cached_json_async(
+        "networth/dashboard", current_user.id,
+        lambda session: NetWorthService.get_net_worth_dashboard(session, current_user.id),
+        etag=etag
+    )
 
 
 # ==================== ASSET ENDPOINTS ====================
 
 @app.get("/assets")
 def get_assets(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all assets"""
@@ -694,13 +889,13 @@ def get_assets(
 @app.post("/assets")
 def create_asset(
     asset: AssetCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create new asset"""
-    new_asset = AssetService.create_asset(
-        db, asset.name, asset.value, asset.category, asset.date, asset.note, current_user.id
-    )
+    new_asset = run_write(db, lambda session: AssetService.create_asset(
+        session, asset.name, asset.value, asset.category, asset.date, asset.note, current_user.id
+    ))
     return {
         "id": new_asset.id,
         "name": new_asset.name,
@@ -714,13 +909,13 @@ def create_asset(
 def update_asset(
     asset_id: int,
     asset: AssetUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update asset"""
-    updated = AssetService.update_asset(
-        db, asset_id, asset.name, asset.value, asset.category, asset.date, asset.note, current_user.id
-    )
+    updated = run_write(db, lambda session: AssetService.update_asset(
+        session, asset_id, asset.name, asset.value, asset.category, asset.date, asset.note, current_user.id
+    ))
     if not updated:
         raise HTTPException(status_code=404, detail="Asset not found")
     return {
@@ -735,11 +930,11 @@ def update_asset(
 @app.delete("/assets/{asset_id}")
 def delete_asset(
     asset_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete asset"""
-    success = AssetService.delete_asset(db, asset_id, current_user.id)
+    success = run_write(db, lambda session: AssetService.delete_asset(session, asset_id, current_user.id))
     if not success:
         raise HTTPException(status_code=404, detail="Asset not found")
     return {"message": "Asset deleted"}
@@ -749,7 +944,7 @@ def delete_asset(
 
 @app.get("/liabilities")
 def get_liabilities(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all liabilities"""
@@ -770,14 +965,14 @@ def get_liabilities(
 @app.post("/liabilities")
 def create_liability(
     liability: LiabilityCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create new liability"""
-    new_liability = LiabilityService.create_liability(
-        db, liability.name, liability.amount, liability.category,
+    new_liability = run_write(db, lambda session: LiabilityService.create_liability(
+        session, liability.name, liability.amount, liability.category,
         liability.interest_rate, liability.date, liability.note, current_user.id
-    )
+    ))
     return {
         "id": new_liability.id,
         "name": new_liability.name,
@@ -792,14 +987,14 @@ def create_liability(
 def update_liability(
     liability_id: int,
     liability: LiabilityUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update liability"""
-    updated = LiabilityService.update_liability(
-        db, liability_id, liability.name, liability.amount, liability.category,
+    updated = run_write(db, lambda session: LiabilityService.update_liability(
+        session, liability_id, liability.name, liability.amount, liability.category,
         liability.interest_rate, liability.date, liability.note, current_user.id
-    )
+    ))
     if not updated:
         raise HTTPException(status_code=404, detail="Liability not found")
     return {
@@ -815,11 +1010,11 @@ def update_liability(
 @app.delete("/liabilities/{liability_id}")
 def delete_liability(
     liability_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete liability"""
-    success = LiabilityService.delete_liability(db, liability_id, current_user.id)
+    success = run_write(db, lambda session: LiabilityService.delete_liability(session, liability_id, current_user.id))
     if not success:
         raise HTTPException(status_code=404, detail="Liability not found")
     return {"message": "Liability deleted"}
@@ -829,7 +1024,8 @@ def delete_liability(
 
 @app.get("/goals")
 def get_goals(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
+    etag: str = Depends(etag_guard("goals")),
     db: Session = Depends(get_db)
 ):
     """Get all financial goals with progress"""
@@ -838,27 +1034,27 @@ def get_goals(
 @app.post("/goals")
 def create_goal(
     goal: GoalCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create new financial goal"""
-    new_goal = GoalService.create_goal(
-        db, goal.name, goal.target_amount, goal.deadline, goal.category, current_user.id
-    )
+    new_goal = run_write(db, lambda session: GoalService.create_goal(
+        session, goal.name, goal.target_amount, goal.deadline, goal.category, current_user.id
+    ))
     return GoalService.get_goal_progress(db, new_goal.id, current_user.id)
 
 @app.put("/goals/{goal_id}")
 def update_goal(
     goal_id: int,
     goal: GoalUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update financial goal"""
-    updated = GoalService.update_goal(
-        db, goal_id, goal.name, goal.target_amount, goal.current_amount,
+    updated = run_write(db, lambda session: GoalService.update_goal(
+        session, goal_id, goal.name, goal.target_amount, goal.current_amount,
         goal.deadline, goal.category, goal.status, current_user.id
-    )
+    ))
     if not updated:
         raise HTTPException(status_code=404, detail="Goal not found")
     return GoalService.get_goal_progress(db, goal_id, current_user.id)
@@ -866,11 +1062,11 @@ def update_goal(
 @app.delete("/goals/{goal_id}")
 def delete_goal(
     goal_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete financial goal"""
-    success = GoalService.delete_goal(db, goal_id, current_user.id)
+    success = run_write(db, lambda session: GoalService.delete_goal(session, goal_id, current_user.id))
     if not success:
         raise HTTPException(status_code=404, detail="Goal not found")
     return {"message": "Goal deleted"}
@@ -878,7 +1074,7 @@ def delete_goal(
 @app.get("/goals/{goal_id}/progress")
 def get_goal_progress(
     goal_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get detailed progress for a specific goal"""
@@ -888,14 +1084,79 @@ def get_goal_progress(
     return progress
 
 
+# ==================== DASHBOARD ENDPOINT ====================
+
+from dashboard_service import DashboardService
+
+@app.get("/dashboard")
+async def get_dashboard(
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user_async),
+    etag: str = Depends(etag_guard("dashboard", get_current_user_async, vary_on_query=True))
+):
+    """
+    Several dashboard widgets in one round trip.
+    fields: comma-separated subset of summary, insights, financial_summary,
+    ml_insights, health, forecast, networth (all by default). Each section
+    matches the response of its standalone endpoint.
+    """
+    try:
+        sections = DashboardService.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await cached_json_async(
+        f"dashboard:{','.join(sections)}", current_user.id,
+        lambda session: DashboardService.build(session, current_user.id, sections),
+        etag=etag
+    )
+
+
+# ==================== EXPORT ENDPOINTS ====================
+
+from fastapi.responses import StreamingResponse
+from export_service import ExportService
+
+@app.get("/export")
+def export_ledger(
+    fmt: str = Query("ndjson", alias="format"),
+    datasets: Optional[str] = None,
+    gzip: bool = False,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Stream the user's full ledger.
+    format=ndjson (default, one JSON object per line with a "type" field) or csv.
+    datasets: comma-separated subset of expenses, incomes, assets, liabilities, splits
+    (all by default; CSV takes exactly one). gzip=true compresses the stream.
+    """
+    try:
+        selected = ExportService.parse_datasets(datasets, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    extension = "csv" if fmt == "csv" else "ndjson"
+    filename = f"{'-'.join(selected) if len(selected) == 1 else 'ledger'}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}{".gz" if gzip else ""}"'}
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if gzip:
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        ExportService.stream(current_user.id, selected, fmt, gzip),
+        media_type=media_type,
+        headers=headers
+    )
+
+
 # ==================== SAAS FEATURES ====================
 
 from group_service import GroupService
 from split_service import SplitService, SplitType
-from subscription_service import SubscriptionService, get_subscription_or_create
+from subscription_service import SubscriptionService, PlanAccess, get_plan_access, get_subscription_or_create, run_plan_write
 from admin_service import AdminService
 from payment_service import PaymentService
-from models import GroupRole, InviteStatus
+from models import GroupRole, InviteStatus, SubscriptionStatus
 
 # Pydantic models for SaaS features
 class GroupCreate(BaseModel):
@@ -928,14 +1189,17 @@ class WebhookPayload(BaseModel):
 @app.post("/groups/create")
 def create_group(
     group: GroupCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
+    plan: PlanAccess = Depends(get_plan_access),
     db: Session = Depends(get_db)
 ):
     """Create a new finance group (PRO feature)"""
     # Check PRO access
-    SubscriptionService.require_pro(db, current_user.id, "group finance")
+    plan.require_pro("group finance")
     
-    new_group = GroupService.create_group(db, group.name, group.description, current_user.id)
+    new_group = run_write(db, lambda session: GroupService.create_group(
+        session, group.name, group.description, current_user.id
+    ))
     return {
         "id": new_group.id,
         "name": new_group.name,
@@ -944,12 +1208,12 @@ def create_group(
     }
 
 @app.get("/groups/list")
-def list_groups(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def list_groups(
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all groups user is member of"""
-    groups = GroupService.get_user_groups(db, current_user.id)
+    groups = await db.run_sync(lambda session: GroupService.get_user_groups(session, current_user.id))
     return {
         "groups": [
             {
@@ -963,13 +1227,13 @@ def list_groups(
     }
 
 @app.get("/groups/{group_id}")
-def get_group(
+async def get_group(
     group_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get group details"""
-    group = GroupService.get_group_details(db, group_id, current_user.id)
+    group = await db.run_sync(lambda session: GroupService.get_group_details(session, group_id, current_user.id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found or access denied")
     return group
@@ -978,12 +1242,14 @@ def get_group(
 def invite_to_group(
     group_id: int,
     invite: GroupInviteCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Invite member to group"""
     try:
-        invitation = GroupService.invite_member(db, group_id, invite.email, current_user.id)
+        invitation = run_write(db, lambda session: GroupService.invite_member(
+            session, group_id, invite.email, current_user.id
+        ))
         return {
             "id": invitation.id,
             "email": invitation.email,
@@ -997,12 +1263,12 @@ def invite_to_group(
 @app.post("/groups/join")
 def join_group(
     invite: InviteAccept,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Accept group invitation"""
     try:
-        member = GroupService.accept_invite(db, invite.token, current_user.id)
+        member = run_write(db, lambda session: GroupService.accept_invite(session, invite.token, current_user.id))
         return {
             "message": "Successfully joined group",
             "group_id": member.group_id,
@@ -1012,27 +1278,36 @@ def join_group(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/groups/{group_id}/expenses")
-def get_group_expenses(
+async def get_group_expenses(
     group_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all expenses for a group"""
+    """Newest-first page of a group's expenses, paginated like /expenses"""
     try:
-        expenses = GroupService.get_group_expenses(db, group_id, current_user.id)
-        return {"expenses": expenses}
+        page = await db.run_sync(lambda session: GroupService.get_group_expenses(
+            session, group_id, current_user.id, limit, before, after
+        ))
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, page)
+    return {"expenses": page["items"]}
 
 @app.delete("/groups/{group_id}")
 def delete_group(
     group_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete group (owner only)"""
     try:
-        success = GroupService.delete_group(db, group_id, current_user.id)
+        success = run_write(db, lambda session: GroupService.delete_group(session, group_id, current_user.id))
         if not success:
             raise HTTPException(status_code=404, detail="Group not found")
         return {"message": "Group deleted successfully"}
@@ -1043,12 +1318,14 @@ def delete_group(
 def remove_member(
     group_id: int,
     member_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Remove member from group"""
     try:
-        success = GroupService.remove_member(db, group_id, member_id, current_user.id)
+        success = run_write(db, lambda session: GroupService.remove_member(
+            session, group_id, member_id, current_user.id
+        ))
         if not success:
             raise HTTPException(status_code=404, detail="Member not found")
         return {"message": "Member removed successfully"}
@@ -1060,13 +1337,15 @@ def update_member_role(
     group_id: int,
     member_id: int,
     role_update: MemberRoleUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update member role"""
     try:
         role = GroupRole(role_update.role)
-        member = GroupService.update_member_role(db, group_id, member_id, role, current_user.id)
+        member = run_write(db, lambda session: GroupService.update_member_role(
+            session, group_id, member_id, role, current_user.id
+        ))
         return {
             "message": "Role updated successfully",
             "member_id": member.id,
@@ -1082,15 +1361,15 @@ def update_member_role(
 def split_expense(
     expense_id: int,
     split_data: SplitCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create expense split"""
     try:
         split_type = SplitType(split_data.split_type)
-        splits = SplitService.create_split(
-            db, expense_id, split_type, split_data.splits, current_user.id
-        )
+        splits = run_write(db, lambda session: SplitService.create_split(
+            session, expense_id, split_type, split_data.splits, current_user.id
+        ))
         return {
             "message": "Expense split created",
             "splits": [
@@ -1109,12 +1388,12 @@ def split_expense(
 @app.post("/splits/{split_id}/settle")
 def settle_split(
     split_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Mark split as settled"""
     try:
-        split = SplitService.settle_split(db, split_id, current_user.id)
+        split = run_write(db, lambda session: SplitService.settle_split(session, split_id, current_user.id))
         return {
             "message": "Split settled successfully",
             "split_id": split.id,
@@ -1124,21 +1403,33 @@ def settle_split(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/groups/{group_id}/balances")
-def get_group_balances(
+async def get_group_balances(
     group_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all balances in a group"""
     try:
-        balances = SplitService.get_group_balances(db, group_id, current_user.id)
+        balances = await db.run_sync(lambda session: SplitService.get_group_balances(session, group_id, current_user.id))
         return {"balances": balances}
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
+@app.get("/groups/{group_id}/settle-plan")
+async def get_group_settle_plan(
+    group_id: int,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Fewest transfers that settle every open split in the group"""
+    try:
+        return await db.run_sync(lambda session: SplitService.get_settle_plan(session, group_id, current_user.id))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
 @app.get("/splits/my-splits")
 def get_my_splits(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all splits for current user"""
@@ -1151,7 +1442,7 @@ def get_my_splits(
 @app.post("/subscribe")
 def subscribe_to_pro(
     upgrade: SubscriptionUpgrade,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Upgrade to PRO plan"""
@@ -1161,7 +1452,7 @@ def subscribe_to_pro(
 
 @app.get("/subscription/status")
 def get_subscription_status(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get subscription status"""
@@ -1170,12 +1461,12 @@ def get_subscription_status(
 
 @app.post("/subscription/cancel")
 def cancel_subscription(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Cancel PRO subscription"""
     try:
-        result = PaymentService.cancel_subscription_external(db, current_user.id)
+        result = run_plan_write(db, lambda session: PaymentService.cancel_subscription_external(session, current_user.id))
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1186,19 +1477,21 @@ def get_payment_methods():
     return PaymentService.get_payment_methods()
 
 @app.post("/webhook/payment")
-async def payment_webhook(
+def payment_webhook(
     payload: WebhookPayload,
     signature: str = "",
     db: Session = Depends(get_db)
 ):
     """Handle payment provider webhooks"""
-    result = PaymentService.handle_webhook(db, payload.dict(), signature)
+    result = run_plan_write(db, lambda session: PaymentService.handle_webhook(
+        session, payload.dict(), signature
+    ))
     return result
 
 
 # ==================== ADMIN ENDPOINTS ====================
 
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_user)):
     """Middleware to require admin access"""
     if not current_user.is_admin:
         raise HTTPException(
@@ -1209,56 +1502,95 @@ def require_admin(current_user: User = Depends(get_current_user)):
 
 @app.get("/admin/users")
 def get_all_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(require_admin),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    email: Optional[str] = Query(None, min_length=1, description="Email prefix (case-sensitive)"),
+    plan: Optional[PlanType] = None,
+    subscription_status: Optional[SubscriptionStatus] = Query(None, alias="status"),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    """Get all users (admin only)"""
-    users = AdminService.get_all_users(db, skip, limit)
-    return {"users": users, "total": len(users)}
+    """
+    Users with their subscription, in id order (admin only). Pass next_cursor
+    as after for the next page. total is the full match count, refreshed every
+    few minutes rather than counted per page.
+    """
+    page = AdminService.get_users_page(db, limit, after, email, plan, subscription_status)
+    count = AdminService.count_users(db, email, plan, subscription_status)
+    return {
+        "users": page["items"],
+        "next_cursor": page["next_cursor"],
+        "total": count["total"],
+        "total_counted_at": count["counted_at"]
+    }
 
 @app.get("/admin/subscriptions")
 def get_subscription_stats(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_analytics_db)
 ):
-    """Get subscription statistics (admin only)"""
-    stats = AdminService.get_subscription_stats(db)
-    return stats
+    """Get subscription statistics (admin only), from the latest metrics snapshot"""
+    metrics = AdminService.get_metrics(db)
+    return {**metrics["subscription_stats"], "freshness": metrics["freshness"]}
 
 @app.get("/admin/revenue")
 def get_revenue_stats(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_analytics_db)
 ):
-    """Get revenue statistics (admin only)"""
-    stats = AdminService.get_revenue_stats(db)
-    return stats
+    """Get revenue statistics (admin only), from the latest metrics snapshot"""
+    metrics = AdminService.get_metrics(db)
+    return {**metrics["revenue_stats"], "freshness": metrics["freshness"]}
 
 @app.get("/admin/analytics")
 def get_system_analytics(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_analytics_db)
 ):
-    """Get comprehensive system analytics (admin only)"""
-    analytics = AdminService.get_system_analytics(db)
-    return analytics
+    """
+    Get comprehensive system analytics (admin only). Served from a snapshot
+    refreshed in the background; see "freshness" for its age.
+    """
+    return AdminService.get_metrics(db)
 
 @app.get("/admin/stats")
 def get_admin_stats(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_analytics_db)
 ):
     """Get quick admin dashboard stats"""
-    subscription_stats = AdminService.get_subscription_stats(db)
-    revenue_stats = AdminService.get_revenue_stats(db)
-    feature_usage = AdminService.get_feature_usage(db)
+    metrics = AdminService.get_metrics(db)
+    subscription_stats = metrics["subscription_stats"]
+    revenue_stats = metrics["revenue_stats"]
+    feature_usage = metrics["feature_usage"]
     
     return {
         "total_users": subscription_stats["total_users"],
         "pro_users": subscription_stats["pro_users"],
         "monthly_revenue": revenue_stats["monthly_revenue"],
         "total_expenses": feature_usage["total_expenses"],
-        "total_groups": feature_usage["total_groups"]
+        "total_groups": feature_usage["total_groups"],
+        "freshness": metrics["freshness"]
+    }
+
+@app.get("/admin/db/pool")
+def get_db_pool_metrics(
+    current_user: Principal = Depends(require_admin)
+):
+    """Connection pool gauges and checkout wait times (admin only)"""
+    return get_pool_metrics()
+
+@app.get("/admin/cache/stats")
+def get_cache_metrics(
+    current_user: Principal = Depends(require_admin)
+):
+    """Hit/miss counters for the response, principal, plan and ledger caches (admin only)"""
+    from auth import principal_cache
+    from subscription_service import plan_cache
+    from ledger_snapshot import ledger_cache
+    return {
+        "responses": get_cache_stats(),
+        "principals": principal_cache.stats(),
+        "plans": plan_cache.stats(),
+        "ledgers": ledger_cache.stats()
     }
@@ -1,61 +1,231 @@
 """
-Database migration script to add new SaaS columns
+Versioned database migrations
+Each step runs once and is recorded in the schema_migrations table.
+Works against SQLite (local) and PostgreSQL (Render), including a live
+PostgreSQL database: indexes there are built CONCURRENTLY.
+
+Usage:
+    python migrate_database.py
 """
 
-import sqlite3
+from datetime import datetime
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, inspect, text, func, update
+from database import Base, engine, month_bucket
+import models  # noqa: F401  (registers all tables on Base.metadata)
 
-def migrate_database():
-    conn = sqlite3.connect('expenses.db')
-    cursor = conn.cursor()
-    
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    """Register a migration step"""
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+# ==================== HELPERS ====================
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def _add_column_if_missing(table: str, column: str, ddl_type: str):
+    columns = {c["name"] for c in inspect(engine).get_columns(table)}
+    if column in columns:
+        print(f"⚠️  {table}.{column} already exists")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+    print(f"✅ Added {table}.{column}")
+
+
+def _drop_invalid_postgres_index(conn, name: str):
+    """A failed CONCURRENTLY build leaves an INVALID index behind; drop it so it can be rebuilt"""
+    valid = conn.execute(text(
+        "SELECT i.indisvalid FROM pg_class c "
+        "JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name"
+    ), {"name": name}).scalar()
+    if valid is False:
+        print(f"⚠️  Dropping invalid index {name} left by an earlier failed build")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _create_model_indexes(*index_names: str):
+    """Create indexes declared in models.py without blocking writes"""
+    indexes = {
+        index.name: index
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    }
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in index_names:
+            index = indexes[name]
+            columns = ", ".join(column.name for column in index.columns)
+
+            unique = "UNIQUE " if index.unique else ""
+
+            if _is_postgres():
+                _drop_invalid_postgres_index(conn, name)
+                ddl = f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {index.table.name} ({columns})"
+            else:
+                ddl = f"CREATE {unique}INDEX IF NOT EXISTS {name} ON {index.table.name} ({columns})"
+
+            conn.execute(text(ddl))
+            print(f"✅ Index {name} on {index.table.name} ({columns})")
+
+
+# ==================== MIGRATIONS ====================
+
+@migration(1, "saas_columns")
+def add_saas_columns():
+    """Columns added for SaaS features on databases created before them"""
+    _add_column_if_missing("users", "is_admin", "BOOLEAN DEFAULT FALSE")
+    _add_column_if_missing("users", "created_at", "TIMESTAMP")
+    _add_column_if_missing("expenses", "group_id", "INTEGER REFERENCES groups(id)")
+
+
+@migration(2, "hot_path_indexes")
+def add_hot_path_indexes():
+    """Composite indexes for the expense, split and membership hot paths"""
+    _create_model_indexes(
+        "ix_expenses_user_date",
+        "ix_expenses_user_category_date",
+        "ix_expenses_group_date",
+        "ix_expense_splits_expense",
+        "ix_expense_splits_user_settled",
+        "ix_group_members_group_user",
+    )
+
+
+@migration(3, "expense_month_key")
+def add_expense_month_key(batch_size: int = 10000):
+    """Stored month bucket on expenses so month grouping is portable and index-backed"""
+    _add_column_if_missing("expenses", "month_key", "VARCHAR(7)")
+
+    # Backfill in id ranges so a live database never holds one long row lock
+    expenses = models.Expense.__table__
+    with engine.connect() as conn:
+        max_id = conn.execute(func.max(expenses.c.id).select()).scalar() or 0
+
+    for start in range(0, max_id + 1, batch_size):
+        with engine.begin() as conn:
+            conn.execute(
+                update(expenses)
+                .where(expenses.c.id >= start, expenses.c.id < start + batch_size, expenses.c.month_key.is_(None))
+                .values(month_key=month_bucket(expenses.c.date))
+            )
+    print(f"✅ Backfilled expenses.month_key up to id {max_id}")
+
+    _create_model_indexes(
+        "ix_expenses_user_month",
+        "ix_expenses_month",
+        "ix_expense_rollups_user_month",
+    )
+
+
+
+@migration(4, "group_balances")
+def backfill_group_balances():
+    """Seed the pairwise group_balances ledger from existing unsettled splits"""
+    from database import SessionLocal
+    from group_balance_service import GroupBalanceService
+
+    db = SessionLocal()
     try:
-        # Add is_admin column to users table
-        print("Adding is_admin column to users table...")
-        cursor.execute("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0")
-        print("✅ Added is_admin column")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("⚠️  is_admin column already exists")
-        else:
-            print(f"❌ Error adding is_admin: {e}")
-    
+        written = GroupBalanceService.rebuild(db)
+    finally:
+        db.close()
+    print(f"✅ Wrote {written} group balance rows")
+
+
+@migration(5, "income_rollups")
+def add_income_rollups():
+    """Index incomes by owner + date and seed income_monthly_rollups from existing rows"""
+    from database import SessionLocal
+    from rollup_service import IncomeRollupService
+
+    _create_model_indexes(
+        "ix_incomes_user_date",
+        "ix_income_rollups_user_month",
+    )
+
+    db = SessionLocal()
     try:
-        # Add created_at column to users table
-        print("Adding created_at column to users table...")
-        cursor.execute("ALTER TABLE users ADD COLUMN created_at DATETIME")
-        print("✅ Added created_at column")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("⚠️  created_at column already exists")
-        else:
-            print(f"❌ Error adding created_at: {e}")
-    
+        written = IncomeRollupService.rebuild(db)
+    finally:
+        db.close()
+    print(f"✅ Wrote {written} income rollup rows")
+
+
+@migration(6, "expense_fingerprints")
+def add_expense_fingerprints():
+    """Import fingerprint on expenses with a unique index, so CSV dedupe is one bulk insert"""
+    # Existing rows stay NULL: the importer fingerprints them on the fly when it preloads a window
+    _add_column_if_missing("expenses", "fingerprint", "VARCHAR(40)")
+    _create_model_indexes("ux_expenses_user_fingerprint")
+
+
+@migration(7, "expense_rollups")
+def backfill_expense_rollups():
+    """Seed expense_monthly_rollups from existing expenses; analytics read spend only from it"""
+    from database import SessionLocal
+    from rollup_service import RollupService
+
+    db = SessionLocal()
     try:
-        # Add group_id column to expenses table
-        print("Adding group_id column to expenses table...")
-        cursor.execute("ALTER TABLE expenses ADD COLUMN group_id INTEGER")
-        print("✅ Added group_id column")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("⚠️  group_id column already exists")
-        else:
-            print(f"❌ Error adding group_id: {e}")
-    
-    conn.commit()
-    conn.close()
-    
+        written = RollupService.rebuild(db)
+    finally:
+        db.close()
+    print(f"✅ Wrote {written} expense rollup rows")
+
+# ==================== RUNNER ====================
+
+def get_applied_versions() -> set:
+    migration_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(schema_migrations.select())}
+
+
+def migrate_database():
+    # New tables first (no-op for existing ones), then pending steps in order
+    Base.metadata.create_all(bind=engine)
+    applied = get_applied_versions()
+
+    pending = [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] not in applied]
+    if not pending:
+        print("✅ Database schema is up to date")
+        return
+
+    for version, name, step in pending:
+        print(f"\n➡️  Applying migration {version:03d}_{name}...")
+        step()
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                name=name,
+                applied_at=datetime.utcnow()
+            ))
+
     print("\n" + "="*60)
-    print("✅ Database migration completed!")
+    print(f"✅ Applied {len(pending)} migration(s)")
     print("="*60)
-    print("\nNow creating new SaaS tables...")
-    
-    # Create new tables using SQLAlchemy
-    from database import Base, engine
-    Base.metadata.create_all(bind=engine)
-    
-    print("✅ All SaaS tables created!")
-    print("\nYou can now run: python create_test_users.py")
+
 
 if __name__ == "__main__":
-    print("\n🔧 Migrating Database for SaaS Features...\n")
+    print("\n🔧 Migrating Database...\n")
     migrate_database()
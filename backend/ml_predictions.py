@@ -5,10 +5,9 @@ Uses scikit-learn for regression and statistical methods for anomalies.
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
 from models import Expense
+from ledger_snapshot import get_ledger
 import numpy as np
-from collections import defaultdict
 
 class MLPredictionService:
     """
@@ -24,16 +23,9 @@ class MLPredictionService:
         """
         # Get historical monthly spending (last 6 months)
         now = datetime.now()
-        six_months_ago = now - relativedelta(months=6)
+        six_months_ago = (now - relativedelta(months=6)).replace(day=1)
         
-        monthly_data = db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= six_months_ago
-        ).group_by('year', 'month').order_by('year', 'month').all()
+        monthly_data = get_ledger(db, user_id).monthly_totals(six_months_ago)
         
         if len(monthly_data) < 2:
             return {
@@ -44,8 +36,8 @@ class MLPredictionService:
             }
         
         # Prepare data for prediction
-        amounts = [float(total) for _, _, total in monthly_data]
-        months = list(range(len(amounts)))
+        amounts = np.array([total for _, total in monthly_data])
+        months = np.arange(len(amounts))
         
         # Simple linear regression
         prediction, trend = cls._simple_linear_regression(months, amounts)
@@ -80,10 +72,10 @@ class MLPredictionService:
             "message": f"Based on {len(amounts)} months of data",
             "historical_data": [
                 {
-                    "month": datetime(int(year), int(month), 1).strftime('%b %Y'),
-                    "amount": float(total)
+                    "month": datetime.strptime(month, '%Y-%m').strftime('%b %Y'),
+                    "amount": total
                 }
-                for year, month, total in monthly_data
+                for month, total in monthly_data
             ],
             "category_predictions": category_predictions
         }
@@ -91,13 +83,14 @@ class MLPredictionService:
     @classmethod
     def _simple_linear_regression(cls, x, y):
         """Simple linear regression implementation."""
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
         n = len(x)
-        x_mean = np.mean(x)
-        y_mean = np.mean(y)
+        x_mean = x.mean()
+        y_mean = y.mean()
         
         # Calculate slope
-        numerator = sum((x[i] - x_mean) * (y[i] - y_mean) for i in range(n))
-        denominator = sum((x[i] - x_mean) ** 2 for i in range(n))
+        numerator = np.dot(x - x_mean, y - y_mean)
+        denominator = np.dot(x - x_mean, x - x_mean)
         
         if denominator == 0:
             return y_mean, 0
@@ -115,22 +108,16 @@ class MLPredictionService:
     def _predict_category_spending(cls, user_id: int, db: Session) -> list:
         """Predict spending for each category next month."""
         now = datetime.now()
-        three_months_ago = now - relativedelta(months=3)
-        
-        # Get category averages for last 3 months
-        category_data = db.query(
-            Expense.category,
-            func.avg(Expense.amount).label('avg_amount'),
-            func.count(Expense.id).label('count')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= three_months_ago
-        ).group_by(Expense.category).all()
+        # Days after the same date three months ago: exactly three months, matching the / 3 below
+        three_months_ago = (now - relativedelta(months=3)).date() + timedelta(days=1)
+        
+        # Get category totals for last 3 months
+        category_data = get_ledger(db, user_id).category_totals(three_months_ago)
         
         predictions = []
-        for category, avg_amount, count in category_data:
+        for category, data in category_data.items():
             # Estimate monthly spending for category
-            monthly_estimate = float(avg_amount) * (count / 3)
+            monthly_estimate = data["total"] / 3
             predictions.append({
                 "category": category,
                 "predicted_amount": round(monthly_estimate, 2)
@@ -148,57 +135,44 @@ class MLPredictionService:
         current_month_start = now.replace(day=1)
         six_months_ago = current_month_start - relativedelta(months=6)
         
-        # Get historical data by category
-        historical_data = db.query(
-            Expense.category,
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= six_months_ago
-        ).group_by(Expense.category, 'year', 'month').all()
-        
-        # Organize by category
-        category_history = defaultdict(list)
-        for category, year, month, total in historical_data:
-            category_history[category].append(float(total))
+        # Category x month history; statistics for every category at once
+        ledger = get_ledger(db, user_id)
+        matrix = ledger.category_month_matrix(six_months_ago)
+        stats = ledger.row_stats(matrix)
+        
+        # Z-score of each category's most recent month against its history
+        valid = (stats["n"] >= 3) & (stats["std"] > 0)
+        z_scores = np.divide(stats["last"] - stats["mean"], stats["std"],
+                             out=np.zeros(len(matrix.categories)), where=valid)
         
         # Detect anomalies
         anomalies = []
         warnings = []
         
-        for category, amounts in category_history.items():
-            if len(amounts) < 3:
+        for i in ledger.rollup_order(matrix):
+            if not valid[i]:
                 continue
             
-            # Calculate statistics
-            mean = np.mean(amounts)
-            std = np.std(amounts)
-            current = amounts[-1]  # Most recent month
+            category, mean, current, z_score = matrix.categories[i], stats["mean"][i], stats["last"][i], z_scores[i]
             
-            # Z-score method for anomaly detection
-            if std > 0:
-                z_score = (current - mean) / std
-                
-                if z_score > 2:  # More than 2 standard deviations
-                    severity = "high" if z_score > 3 else "medium"
-                    anomalies.append({
-                        "category": category,
-                        "current_amount": round(current, 2),
-                        "average_amount": round(mean, 2),
-                        "deviation": round((current - mean), 2),
-                        "percentage_increase": round(((current - mean) / mean) * 100, 1),
-                        "severity": severity,
-                        "message": f"Unusual spike in {category} spending"
-                    })
-                elif z_score > 1.5:
-                    warnings.append({
-                        "category": category,
-                        "current_amount": round(current, 2),
-                        "average_amount": round(mean, 2),
-                        "message": f"{category} spending is above normal"
-                    })
+            if z_score > 2:  # More than 2 standard deviations
+                severity = "high" if z_score > 3 else "medium"
+                anomalies.append({
+                    "category": category,
+                    "current_amount": round(current, 2),
+                    "average_amount": round(mean, 2),
+                    "deviation": round((current - mean), 2),
+                    "percentage_increase": round(((current - mean) / mean) * 100, 1),
+                    "severity": severity,
+                    "message": f"Unusual spike in {category} spending"
+                })
+            elif z_score > 1.5:
+                warnings.append({
+                    "category": category,
+                    "current_amount": round(current, 2),
+                    "average_amount": round(mean, 2),
+                    "message": f"{category} spending is above normal"
+                })
         
         # Detect unusual transaction patterns
         unusual_transactions = cls._detect_unusual_transactions(user_id, db)
@@ -220,33 +194,26 @@ class MLPredictionService:
         now = datetime.now()
         current_month_start = now.replace(day=1)
         
-        # Get current month transactions
-        current_expenses = db.query(Expense).filter(
-            Expense.user_id == user_id,
-            Expense.date >= current_month_start
-        ).all()
+        # Current month z-scores from the ledger columns; only outliers are loaded
+        ids, amounts, z_scores = get_ledger(db, user_id).zscores(current_month_start)
+        outliers = ids[z_scores > 2.5].tolist()
         
-        if not current_expenses:
+        if not outliers:
             return []
         
-        # Calculate statistics
-        amounts = [e.amount for e in current_expenses]
-        mean = np.mean(amounts)
-        std = np.std(amounts)
+        mean = amounts.mean()
+        current_expenses = db.query(Expense).filter(Expense.id.in_(outliers)).all()
         
         unusual = []
         for expense in current_expenses:
-            if std > 0:
-                z_score = (expense.amount - mean) / std
-                if z_score > 2.5:  # Significantly larger than average
-                    unusual.append({
-                        "id": expense.id,
-                        "amount": expense.amount,
-                        "category": expense.category,
-                        "date": expense.date.isoformat(),
-                        "note": expense.note,
-                        "deviation_from_average": round(expense.amount - mean, 2)
-                    })
+            unusual.append({
+                "id": expense.id,
+                "amount": expense.amount,
+                "category": expense.category,
+                "date": expense.date.isoformat(),
+                "note": expense.note,
+                "deviation_from_average": round(expense.amount - mean, 2)
+            })
         
         return sorted(unusual, key=lambda x: x['amount'], reverse=True)[:5]
     
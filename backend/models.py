@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, DateTime, Enum as SQLEnum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, ForeignKey, Boolean, DateTime, UniqueConstraint, Index, Enum as SQLEnum
+from sqlalchemy.orm import relationship, validates
 from database import Base
 from datetime import datetime
 import enum
@@ -24,6 +24,13 @@ class SubscriptionStatus(str, enum.Enum):
     CANCELLED = "cancelled"
     EXPIRED = "expired"
 
+class ImportStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -49,6 +56,17 @@ class User(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (
+        # Hot paths filter by owner + date range, often by category; group views by group + date
+        Index("ix_expenses_user_date", "user_id", "date"),
+        Index("ix_expenses_user_category_date", "user_id", "category", "date"),
+        Index("ix_expenses_group_date", "group_id", "date"),
+        # Month bucketing without per-row date functions; amount makes per-user sums index-only
+        Index("ix_expenses_user_month", "user_id", "month_key", "amount"),
+        Index("ix_expenses_month", "month_key"),
+        # Import dedupe; only imported rows carry a fingerprint, so manual entries may repeat
+        Index("ux_expenses_user_fingerprint", "user_id", "fingerprint", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Float, nullable=False)
@@ -57,10 +75,18 @@ class Expense(Base):
     note = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)  # SaaS: Optional group
+    month_key = Column(String(7), nullable=True)  # "YYYY-MM", derived from date
+    fingerprint = Column(String(40), nullable=True)  # Hash of user, date, amount and note prefix (imports)
     
     owner = relationship("User", back_populates="expenses")
     group = relationship("Group", back_populates="expenses")
     splits = relationship("ExpenseSplit", back_populates="expense", cascade="all, delete-orphan")
+    
+    @validates("date")
+    def _sync_month_key(self, key, value):
+        """Keep the stored month bucket in step with the date"""
+        self.month_key = value.strftime('%Y-%m') if value else None
+        return value
 
 class Budget(Base):
     __tablename__ = "budgets"
@@ -75,6 +101,10 @@ class Budget(Base):
 
 class Income(Base):
     __tablename__ = "incomes"
+    __table_args__ = (
+        # Window totals and breakdowns filter by owner + date range
+        Index("ix_incomes_user_date", "user_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Float, nullable=False)
@@ -168,6 +198,9 @@ class Group(Base):
 class GroupMember(Base):
     """Group membership with roles"""
     __tablename__ = "group_members"
+    __table_args__ = (
+        Index("ix_group_members_group_user", "group_id", "user_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
@@ -198,6 +231,10 @@ class GroupInvite(Base):
 class ExpenseSplit(Base):
     """Expense splitting for group expenses"""
     __tablename__ = "expense_splits"
+    __table_args__ = (
+        Index("ix_expense_splits_expense", "expense_id"),
+        Index("ix_expense_splits_user_settled", "user_id", "is_settled"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     expense_id = Column(Integer, ForeignKey("expenses.id"), nullable=False)
@@ -208,3 +245,108 @@ class ExpenseSplit(Base):
     
     expense = relationship("Expense", back_populates="splits")
     user = relationship("User", back_populates="splits_owed")
+
+
+
+class GroupBalance(Base):
+    """Unsettled amount each debtor owes each creditor in a group, maintained on every split write"""
+    __tablename__ = "group_balances"
+    __table_args__ = (
+        UniqueConstraint("group_id", "debtor_id", "creditor_id", name="uq_group_balance_pair"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    debtor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    creditor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Float, default=0.0, nullable=False)
+
+# ==================== ANALYTICS ROLLUPS ====================
+
+class ExpenseRollup(Base):
+    """Per-user, per-category monthly spend aggregates maintained on every expense write"""
+    __tablename__ = "expense_monthly_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "category", "year_month", name="uq_expense_rollup_key"),
+        Index("ix_expense_rollups_user_month", "user_id", "year_month"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    category = Column(String, nullable=False)
+    year_month = Column(String(7), nullable=False)  # "YYYY-MM"
+    total = Column(Float, default=0.0, nullable=False)
+    txn_count = Column(Integer, default=0, nullable=False)
+    sum_squares = Column(Float, default=0.0, nullable=False)  # For variance without rescanning rows
+
+
+class IncomeRollup(Base):
+    """Per-user, per-category monthly income aggregates maintained on every income write"""
+    __tablename__ = "income_monthly_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "category", "year_month", name="uq_income_rollup_key"),
+        Index("ix_income_rollups_user_month", "user_id", "year_month"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    category = Column(String, nullable=False)
+    year_month = Column(String(7), nullable=False)  # "YYYY-MM"
+    total = Column(Float, default=0.0, nullable=False)
+    txn_count = Column(Integer, default=0, nullable=False)
+
+
+class HealthScore(Base):
+    """One financial health score per user per day, so /health/score is a lookup"""
+    __tablename__ = "financial_health_scores"
+    __table_args__ = (
+        UniqueConstraint("user_id", "score_date", name="uq_health_score_day"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    score_date = Column(Date, nullable=False)
+    score = Column(Float, nullable=False)
+    rating = Column(String, nullable=False)
+    payload = Column(String, nullable=False)  # Full score response as JSON
+    ledger_version = Column(BigInteger, nullable=False)  # Ledger version the score was computed from
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class AdminMetricsSnapshot(Base):
+    """Periodic copy of the global admin analytics, so admin pages never run full-table counts"""
+    __tablename__ = "admin_metrics_snapshot"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # When counting started
+    duration_ms = Column(Float, nullable=False)
+    payload = Column(String, nullable=False)  # get_system_analytics response as JSON
+
+
+# ==================== IMPORT JOBS ====================
+
+class ImportJob(Base):
+    """Background CSV import: progress counters plus a row-offset checkpoint to resume from"""
+    __tablename__ = "import_jobs"
+    __table_args__ = (
+        Index("ix_import_jobs_status_updated", "status", "updated_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)  # Spooled copy of the upload, removed when the job ends
+    status = Column(SQLEnum(ImportStatus), default=ImportStatus.QUEUED, nullable=False)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    row_offset = Column(Integer, default=0, nullable=False)  # Last CSV row committed; resume skips up to here
+    rows_parsed = Column(Integer, default=0, nullable=False)
+    imported = Column(Integer, default=0, nullable=False)
+    duplicates = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    parse_errors = Column(Integer, default=0, nullable=False)
+    batches = Column(Integer, default=0, nullable=False)
+    details = Column(String, nullable=True)  # Capped per-row samples and category summary as JSON
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # Heartbeat, advanced by every checkpoint
+    finished_at = Column(DateTime, nullable=True)
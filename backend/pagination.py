@@ -0,0 +1,79 @@
+"""
+Keyset Pagination
+Opaque (date, id) cursors for newest-first listings, so each page is one
+index range scan no matter how deep into the history it is
+"""
+
+import base64
+from datetime import date
+from typing import Dict, Optional, Tuple
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(row_date: date, row_id: int) -> str:
+    raw = f"{row_date.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        row_date, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return date.fromisoformat(row_date), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_page(query, date_column, id_column, limit: int = DEFAULT_PAGE_SIZE,
+                before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+    """
+    Return one newest-first page of query.
+
+    before: rows older than the cursor (next page)
+    after:  rows newer than the cursor (previous page)
+
+    Returns {"items", "next_cursor", "prev_cursor"}; a cursor is None when
+    there is nothing further in that direction.
+    """
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if after:
+        cursor_date, cursor_id = decode_cursor(after)
+        query = query.filter(or_(
+            date_column > cursor_date,
+            and_(date_column == cursor_date, id_column > cursor_id)
+        )).order_by(date_column.asc(), id_column.asc())
+    else:
+        if before:
+            cursor_date, cursor_id = decode_cursor(before)
+            query = query.filter(or_(
+                date_column < cursor_date,
+                and_(date_column == cursor_date, id_column < cursor_id)
+            ))
+        query = query.order_by(date_column.desc(), id_column.desc())
+
+    # One extra row tells us whether another page exists
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, date_column.key), getattr(row, id_column.key))
+
+    # Coming from a cursor means rows exist on the other side of it
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or after:
+            next_cursor = cursor_for(rows[-1])
+        if (has_more and after) or before:
+            prev_cursor = cursor_for(rows[0])
+
+    return {"items": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
@@ -0,0 +1,419 @@
+"""
+Versioned Response Cache
+Caches rendered analytics responses per (endpoint, user_id, ledger_version).
+
+Every write that can change a user's analytics marks the session with
+mark_ledger_changed(); the user's ledger version is bumped once the
+transaction has really committed, which retires all of their cached
+responses at once without deleting anything. Versions live in the cache
+backend too, so checking one costs no database query.
+
+Backends (RESPONSE_CACHE_BACKEND):
+    memory  in-process LRU bounded by RESPONSE_CACHE_MAX_BYTES (default)
+    redis   any server speaking the Redis protocol at REDIS_URL; use this
+            when running more than one worker so writes invalidate everywhere
+    none    no response caching (versions are still tracked)
+"""
+
+import hashlib
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Iterable, List, Optional
+from urllib.parse import urlparse
+from fastapi import Depends, HTTPException, Request
+from fastapi import Response as InjectedResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import SessionLocal, analytics_session, async_analytics_session
+from auth import Principal, get_current_user
+
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+
+
+def _version_seed() -> int:
+    # Wall-clock milliseconds: a restarted or flushed store never reissues an old version
+    return int(time.time() * 1000)
+
+
+class CacheMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "sets": self.sets,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ==================== BACKENDS ====================
+
+class MemoryCacheBackend:
+    """LRU of response bodies, evicted by total size; versions are kept separately and never evicted"""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.metrics = CacheMetrics()
+        self._entries = OrderedDict()  # key -> (expires_at, body)
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, body: bytes, ttl: int):
+        size = len(key) + len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.metrics.incr("evictions")
+        self.metrics.incr("sets")
+
+    def _remove(self, key: str):
+        _, body = self._entries.pop(key)
+        self._bytes -= len(key) + len(body)
+
+    def get_version(self, key: str) -> int:
+        with self._lock:
+            return self._versions.setdefault(key, _version_seed())
+
+    def incr_version(self, key: str) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, _version_seed()) + 1
+            return self._versions[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            usage = {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+        return {"backend": self.name, **usage, **self.metrics.snapshot()}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisCacheBackend:
+    """
+    Minimal Redis protocol (RESP2) client: GET, SET, INCR and friends over one
+    socket per thread. Works with Redis, Valkey, KeyDB or a local stand-in.
+    Any connection problem is counted and treated as a cache miss, so an
+    unavailable cache slows requests down but never fails them.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.metrics = CacheMetrics()
+        self._local = threading.local()
+
+    # ---- protocol ----
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        conn = (sock, sock.makefile("rb"))
+        self._local.conn = conn
+        if self.password:
+            self._send(conn, "AUTH", self.password)
+        if self.db:
+            self._send(conn, "SELECT", self.db)
+        return conn
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length == -1 else [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        sock.sendall(self._encode(*args))
+        return self._read_reply(reader)
+
+    def execute(self, *args):
+        conn = getattr(self._local, "conn", None)
+        try:
+            return self._send(conn or self._connect(), *args)
+        except (OSError, ConnectionError):
+            # Stale pooled socket: reconnect once before giving up
+            self._close()
+            if conn is None:
+                raise
+            return self._send(self._connect(), *args)
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def _safe(self, default, *args):
+        try:
+            return self.execute(*args)
+        except (OSError, ConnectionError, RedisError):
+            self._close()
+            self.metrics.incr("errors")
+            return default
+
+    # ---- backend interface ----
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._safe(None, "GET", key)
+
+    def set(self, key: str, body: bytes, ttl: int):
+        if self._safe(None, "SET", key, body, "EX", ttl) is not None:
+            self.metrics.incr("sets")
+
+    def get_version(self, key: str) -> int:
+        value = self._safe(None, "GET", key)
+        if value is None:
+            self._safe(None, "SET", key, _version_seed(), "NX")
+            value = self._safe(None, "GET", key)
+        # Unreachable server: a fresh seed per call means every lookup misses
+        return int(value) if value is not None else _version_seed()
+
+    def incr_version(self, key: str) -> int:
+        self._safe(None, "SET", key, _version_seed(), "NX")
+        value = self._safe(None, "INCR", key)
+        return int(value) if value is not None else _version_seed()
+
+    def stats(self) -> dict:
+        info = {"backend": self.name, "host": self.host, "port": self.port, "db": self.db}
+        info["reachable"] = self._safe(None, "PING") == "PONG"
+        return {**info, **self.metrics.snapshot()}
+
+
+def _create_backend():
+    kind = os.environ.get("RESPONSE_CACHE_BACKEND", "redis" if os.environ.get("REDIS_URL") else "memory")
+    if kind == "redis":
+        return RedisCacheBackend(
+            os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+            timeout=float(os.environ.get("REDIS_SOCKET_TIMEOUT", 0.5))
+        )
+    if kind == "memory":
+        return MemoryCacheBackend(int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
+    if kind == "none":
+        return MemoryCacheBackend(0)
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND '{kind}'. Choose from: memory, redis, none")
+
+
+backend = _create_backend()
+
+
+# ==================== LEDGER VERSIONS ====================
+
+def get_ledger_version(user_id: int) -> int:
+    return backend.get_version(f"ledger:{user_id}")
+
+
+def bump_ledger_version(user_id: int) -> int:
+    return backend.incr_version(f"ledger:{user_id}")
+
+
+# hook(user_id, new_version, info) runs after each committed bump; info is the
+# committing session's info dict, so other caches can pick up what they staged
+ledger_commit_hooks: List[Callable[[int, int, dict], None]] = []
+
+
+def on_ledger_commit(hook: Callable[[int, int, dict], None]):
+    ledger_commit_hooks.append(hook)
+    return hook
+
+
+def commit_ledger_changes(user_ids: Iterable[int], info: dict):
+    """Bump each user's version and notify the hooks; call only after a successful commit"""
+    for user_id in user_ids:
+        version = bump_ledger_version(user_id)
+        for hook in ledger_commit_hooks:
+            hook(user_id, version, info)
+
+
+def mark_ledger_changed(db: Session, user_id: int):
+    """Record that this transaction changes user_id's ledger; the version is bumped after commit"""
+    db.info.setdefault("ledger_changed", set()).add(user_id)
+
+
+def pop_ledger_changes(db: Session) -> set:
+    return db.info.pop("ledger_changed", set())
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_after_commit(session):
+    # Bumping before commit would let a concurrent reader cache pre-commit data under the new version
+    commit_ledger_changes(pop_ledger_changes(session), session.info)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_after_rollback(session):
+    pop_ledger_changes(session)
+
+
+# ==================== ETAGS ====================
+
+# Browsers store the response and revalidate it on every use with If-None-Match
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+
+def ledger_etag(endpoint: str, user_id: int, variant: str = "") -> str:
+    """Strong ETag from the ledger version; variant distinguishes query strings of one endpoint"""
+    raw = f"{endpoint}|{user_id}|{get_ledger_version(user_id)}|{date.today().isoformat()}|{variant}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:24] + '"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def etag_guard(endpoint: str, user_dependency: Callable = get_current_user, vary_on_query: bool = False):
+    """
+    Dependency factory. Declare it before the endpoint's session dependency:
+    when If-None-Match still matches, it answers 304 before a session is
+    opened or any query runs. Otherwise it returns the ETag and sets it on
+    the response.
+    """
+    def guard(
+        request: Request,
+        response: InjectedResponse,
+        current_user: Principal = Depends(user_dependency)
+    ) -> str:
+        variant = "&".join(sorted(request.url.query.split("&"))) if vary_on_query else ""
+        etag = ledger_etag(endpoint, current_user.id, variant)
+        headers = {"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL}
+        if _matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return etag
+    return guard
+
+
+# ==================== RESPONSES ====================
+
+def _key(endpoint: str, user_id: int) -> str:
+    # The day is part of the key because month windows and "days left" move with the calendar
+    return f"resp:{endpoint}:{user_id}:{get_ledger_version(user_id)}:{date.today().isoformat()}"
+
+
+def _render(result: Any) -> bytes:
+    return JSONResponse(content=jsonable_encoder(result)).body
+
+
+def _respond(body: bytes, status: str, etag: Optional[str]) -> Response:
+    headers = {"X-Cache": status}
+    if etag:
+        headers.update({"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def cached_json(endpoint: str, user_id: int, compute: Callable[[Session], Any], etag: Optional[str] = None) -> Response:
+    """
+    Serve endpoint's JSON for user_id from the cache. Only a miss opens a
+    session and runs compute(db), so hits cost no database work at all.
+    Pass the etag from etag_guard so the returned Response carries it.
+    """
+    key = _key(endpoint, user_id)
+    body = backend.get(key)
+    if body is not None:
+        backend.metrics.incr("hits")
+        return _respond(body, "HIT", etag)
+
+    backend.metrics.incr("misses")
+    with analytics_session() as db:
+        body = _render(compute(db))
+    backend.set(key, body, RESPONSE_CACHE_TTL)
+    return _respond(body, "MISS", etag)
+
+
+async def cached_json_async(endpoint: str, user_id: int, compute: Callable[[Session], Any],
+                            etag: Optional[str] = None) -> Response:
+    """cached_json for async endpoints; compute still receives a sync Session (via run_sync)"""
+    key = _key(endpoint, user_id)
+    body = backend.get(key)
+    if body is not None:
+        backend.metrics.incr("hits")
+        return _respond(body, "HIT", etag)
+
+    backend.metrics.incr("misses")
+    async with async_analytics_session() as db:
+        result = await db.run_sync(compute)
+    body = _render(result)
+    backend.set(key, body, RESPONSE_CACHE_TTL)
+    return _respond(body, "MISS", etag)
+
+
+def get_cache_stats() -> dict:
+    return backend.stats()
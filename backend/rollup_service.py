@@ -0,0 +1,350 @@
+"""
+Rollup Service
+Maintains per-user, per-category monthly spend and income aggregates so
+analytics never have to rescan the raw expenses and incomes tables
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Expense, ExpenseRollup, Income, IncomeRollup
+from response_cache import mark_ledger_changed
+from database import month_bucket
+from aggregate_snapshot import AggregateSnapshot
+from ledger_snapshot import note_expense_writes
+from datetime import date
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+
+def month_key(value) -> str:
+    """Return the "YYYY-MM" rollup bucket for a date or datetime"""
+    return value.strftime('%Y-%m')
+
+
+def upsert_rollup(db: Session, model, user_id: int, category: str, year_month: str, increments: Dict[str, float]) -> None:
+    """Add increments to one (user, category, month) rollup row, creating it if missing"""
+    dialect = db.get_bind().dialect.name
+    table = model.__table__
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table).values(user_id=user_id, category=category, year_month=year_month, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.category, table.c.year_month],
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        db.execute(stmt)
+        return
+
+    # Generic fallback for engines without ON CONFLICT support
+    rollup = db.query(model).filter(
+        model.user_id == user_id,
+        model.category == category,
+        model.year_month == year_month
+    ).with_for_update().first()
+    if rollup:
+        for name, value in increments.items():
+            setattr(rollup, name, getattr(rollup, name) + value)
+    else:
+        db.add(model(user_id=user_id, category=category, year_month=year_month, **increments))
+
+
+class RollupService:
+    """Keeps expense_monthly_rollups in step with expense writes and serves reads from it"""
+
+    # ==================== WRITE PATH ====================
+
+    @staticmethod
+    def collect_deltas(rows: Iterable[Tuple[str, date, float]], sign: int = 1) -> Dict[Tuple[str, str], List[float]]:
+        """Fold (category, date, amount) tuples into {(category, month): [total, count, sum_squares]}"""
+        deltas = defaultdict(lambda: [0.0, 0, 0.0])
+        for category, expense_date, amount in rows:
+            delta = deltas[(category, month_key(expense_date))]
+            delta[0] += sign * amount
+            delta[1] += sign
+            delta[2] += sign * amount * amount
+        return deltas
+
+    @staticmethod
+    def apply_deltas(db: Session, user_id: int, deltas: Dict[Tuple[str, str], List[float]]) -> None:
+        """
+        Upsert rollup rows in the caller's transaction.
+        The caller commits together with the expense write it belongs to.
+        Every expense write passes through here, so it also marks the user's
+        ledger as changed for the response cache and tells the ledger snapshot
+        cache how many rows were appended (removals force a reload).
+        """
+        mark_ledger_changed(db, user_id)
+        counts = [count for _, count, _ in deltas.values()]
+        note_expense_writes(
+            db, user_id,
+            appended=sum(count for count in counts if count > 0),
+            reload=any(count < 0 for count in counts)
+        )
+        for (category, year_month), (total, count, sum_squares) in deltas.items():
+            if count == 0 and total == 0:
+                continue
+            upsert_rollup(db, ExpenseRollup, user_id, category, year_month, {
+                "total": total,
+                "txn_count": count,
+                "sum_squares": sum_squares
+            })
+
+    @staticmethod
+    def record_expense(db: Session, user_id: int, category: str, expense_date: date, amount: float) -> None:
+        """Add a single new expense to the rollup"""
+        RollupService.apply_deltas(
+            db, user_id, RollupService.collect_deltas([(category, expense_date, amount)])
+        )
+
+    @staticmethod
+    def remove_expense(db: Session, user_id: int, category: str, expense_date: date, amount: float) -> None:
+        """Take a single deleted expense back out of the rollup"""
+        RollupService.apply_deltas(
+            db, user_id, RollupService.collect_deltas([(category, expense_date, amount)], sign=-1)
+        )
+
+    @staticmethod
+    def replace_expense(db: Session, user_id: int, old: Tuple[str, date, float], new: Tuple[str, date, float]) -> None:
+        """Move an updated expense from its old bucket to its new one"""
+        # Changes an existing row, which a snapshot can't append
+        note_expense_writes(db, user_id, reload=True)
+        deltas = RollupService.collect_deltas([old], sign=-1)
+        for key, (total, count, sum_squares) in RollupService.collect_deltas([new]).items():
+            delta = deltas[key]
+            delta[0] += total
+            delta[1] += count
+            delta[2] += sum_squares
+        RollupService.apply_deltas(db, user_id, deltas)
+
+    @staticmethod
+    def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+        """
+        Recompute rollups from the raw expenses table (backfill / repair).
+        Aggregation happens in SQL on the stored month_key, so only one row
+        per bucket crosses the wire. Returns the number of rollup rows written.
+        """
+        rollup_query = db.query(ExpenseRollup)
+        bucket_query = db.query(
+            Expense.user_id,
+            Expense.category,
+            Expense.month_key,
+            func.sum(Expense.amount),
+            func.count(Expense.id),
+            func.sum(Expense.amount * Expense.amount)
+        )
+        if user_id is not None:
+            rollup_query = rollup_query.filter(ExpenseRollup.user_id == user_id)
+            bucket_query = bucket_query.filter(Expense.user_id == user_id)
+
+        rollup_query.delete(synchronize_session=False)
+
+        written = 0
+        buckets = bucket_query.group_by(Expense.user_id, Expense.category, Expense.month_key)
+        for owner_id, category, year_month, total, count, sum_squares in buckets:
+            db.add(ExpenseRollup(
+                user_id=owner_id,
+                category=category,
+                year_month=year_month,
+                total=total,
+                txn_count=count,
+                sum_squares=sum_squares
+            ))
+            written += 1
+
+        db.commit()
+        return written
+
+    # ==================== READ PATH ====================
+
+    @staticmethod
+    def _snapshot(db: Session, user_id: int, start_month: str) -> Optional[AggregateSnapshot]:
+        """The request's AggregateSnapshot when one is attached and covers the window"""
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot is not None and snapshot.covers_month(start_month):
+            return snapshot
+        return None
+
+    @staticmethod
+    def _window(query, user_id: int, start_month: str, end_month: Optional[str]):
+        query = query.filter(
+            ExpenseRollup.user_id == user_id,
+            ExpenseRollup.year_month >= start_month,
+            ExpenseRollup.txn_count > 0
+        )
+        if end_month:
+            query = query.filter(ExpenseRollup.year_month <= end_month)
+        return query
+
+    @staticmethod
+    def get_total(db: Session, user_id: int, start_month: str, end_month: Optional[str] = None) -> float:
+        """Total spend across all categories for a month window"""
+        snapshot = RollupService._snapshot(db, user_id, start_month)
+        if snapshot:
+            return snapshot.get_total(start_month, end_month)
+        query = db.query(func.sum(ExpenseRollup.total))
+        total = RollupService._window(query, user_id, start_month, end_month).scalar()
+        return float(total) if total else 0.0
+
+    @staticmethod
+    def get_category_totals(db: Session, user_id: int, start_month: str, end_month: Optional[str] = None) -> Dict[str, Dict]:
+        """{category: {"total", "count"}} for a month window"""
+        snapshot = RollupService._snapshot(db, user_id, start_month)
+        if snapshot:
+            return snapshot.get_category_totals(start_month, end_month)
+        query = db.query(
+            ExpenseRollup.category,
+            func.sum(ExpenseRollup.total),
+            func.sum(ExpenseRollup.txn_count)
+        )
+        rows = RollupService._window(query, user_id, start_month, end_month).group_by(ExpenseRollup.category).all()
+        return {category: {"total": float(total), "count": int(count)} for category, total, count in rows}
+
+    @staticmethod
+    def get_monthly_totals(db: Session, user_id: int, start_month: str, end_month: Optional[str] = None) -> List[Tuple[str, float]]:
+        """[(month, total)] ordered by month"""
+        snapshot = RollupService._snapshot(db, user_id, start_month)
+        if snapshot:
+            return snapshot.get_monthly_totals(start_month, end_month)
+        query = db.query(ExpenseRollup.year_month, func.sum(ExpenseRollup.total))
+        rows = RollupService._window(query, user_id, start_month, end_month).group_by(
+            ExpenseRollup.year_month
+        ).order_by(ExpenseRollup.year_month).all()
+        return [(month, float(total)) for month, total in rows]
+
+    @staticmethod
+    def get_category_monthly_totals(db: Session, user_id: int, start_month: str, end_month: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        """[(category, month, total)] ordered by month"""
+        snapshot = RollupService._snapshot(db, user_id, start_month)
+        if snapshot:
+            return snapshot.get_category_monthly_totals(start_month, end_month)
+        query = db.query(ExpenseRollup.category, ExpenseRollup.year_month, ExpenseRollup.total)
+        rows = RollupService._window(query, user_id, start_month, end_month).order_by(
+            ExpenseRollup.year_month, ExpenseRollup.category
+        ).all()
+        return [(category, month, float(total)) for category, month, total in rows]
+
+    @staticmethod
+    def get_amount_stats(db: Session, user_id: int, start_month: str, end_month: Optional[str] = None) -> Tuple[int, float, float]:
+        """
+        (count, mean, population std) of individual expense amounts in a month window,
+        derived from the stored sums so no expense rows are read
+        """
+        snapshot = RollupService._snapshot(db, user_id, start_month)
+        if snapshot:
+            return snapshot.get_amount_stats(start_month, end_month)
+        query = db.query(
+            func.sum(ExpenseRollup.txn_count),
+            func.sum(ExpenseRollup.total),
+            func.sum(ExpenseRollup.sum_squares)
+        )
+        count, total, sum_squares = RollupService._window(query, user_id, start_month, end_month).one()
+        count = int(count or 0)
+        if count == 0:
+            return 0, 0.0, 0.0
+        mean = float(total) / count
+        variance = max(0.0, float(sum_squares) / count - mean * mean)
+        return count, mean, float(np.sqrt(variance))
+
+    @staticmethod
+    def get_overall(db: Session, user_id: int) -> Tuple[int, float]:
+        """(count, total) of every expense the user has, for lists that load one page at a time"""
+        count, total = db.query(
+            func.sum(ExpenseRollup.txn_count),
+            func.sum(ExpenseRollup.total)
+        ).filter(ExpenseRollup.user_id == user_id).one()
+        return int(count or 0), float(total or 0.0)
+
+
+class IncomeRollupService:
+    """Keeps income_monthly_rollups in step with income writes and serves month-window totals from it"""
+
+    # ==================== WRITE PATH ====================
+
+    @staticmethod
+    def apply_change(db: Session, user_id: int, old: Optional[Tuple[str, date, float]] = None,
+                     new: Optional[Tuple[str, date, float]] = None) -> None:
+        """
+        Move one income's (category, date, amount) out of its old bucket and
+        into its new one, in the caller's transaction. Pass only new for a
+        create and only old for a delete.
+        """
+        deltas = defaultdict(lambda: [0.0, 0])
+        for row, sign in ((old, -1), (new, 1)):
+            if row is None:
+                continue
+            category, income_date, amount = row
+            delta = deltas[(category, month_key(income_date))]
+            delta[0] += sign * amount
+            delta[1] += sign
+
+        for (category, year_month), (total, count) in deltas.items():
+            if count == 0 and total == 0:
+                continue
+            upsert_rollup(db, IncomeRollup, user_id, category, year_month, {
+                "total": total,
+                "txn_count": count
+            })
+
+    @staticmethod
+    def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+        """Recompute income rollups from the raw incomes table. Returns the number of rows written."""
+        rollup_query = db.query(IncomeRollup)
+        year_month = month_bucket(Income.date)
+        bucket_query = db.query(
+            Income.user_id,
+            Income.category,
+            year_month,
+            func.sum(Income.amount),
+            func.count(Income.id)
+        )
+        if user_id is not None:
+            rollup_query = rollup_query.filter(IncomeRollup.user_id == user_id)
+            bucket_query = bucket_query.filter(Income.user_id == user_id)
+
+        rollup_query.delete(synchronize_session=False)
+
+        written = 0
+        for owner_id, category, month, total, count in bucket_query.group_by(Income.user_id, Income.category, year_month):
+            db.add(IncomeRollup(
+                user_id=owner_id,
+                category=category,
+                year_month=month,
+                total=total,
+                txn_count=count
+            ))
+            written += 1
+
+        db.commit()
+        return written
+
+    # ==================== READ PATH ====================
+
+    @staticmethod
+    def window_total(user_id: int, start_month: Optional[str] = None, end_month: Optional[str] = None):
+        """SELECT of the income total for a month window, for use as a query or CTE"""
+        query = select(func.coalesce(func.sum(IncomeRollup.total), 0).label("total")).where(
+            IncomeRollup.user_id == user_id,
+            IncomeRollup.txn_count > 0
+        )
+        if start_month:
+            query = query.where(IncomeRollup.year_month >= start_month)
+        if end_month:
+            query = query.where(IncomeRollup.year_month <= end_month)
+        return query
+
+    @staticmethod
+    def get_total(db: Session, user_id: int, start_month: Optional[str] = None, end_month: Optional[str] = None) -> float:
+        """Total income across all categories for a month window"""
+        return float(db.execute(IncomeRollupService.window_total(user_id, start_month, end_month)).scalar())
+
+    @staticmethod
+    def get_overall(db: Session, user_id: int) -> Tuple[int, float]:
+        """(count, total) of every income the user has, for lists that load one page at a time"""
+        count, total = db.query(
+            func.sum(IncomeRollup.txn_count),
+            func.sum(IncomeRollup.total)
+        ).filter(IncomeRollup.user_id == user_id).one()
+        return int(count or 0), float(total or 0.0)
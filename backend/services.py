@@ -1,9 +1,15 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from models import Expense, Budget
 from ai_categorizer import AICategorizer
+from rollup_service import RollupService, month_key
+from group_balance_service import GroupBalanceService
+from response_cache import mark_ledger_changed
+from pagination import keyset_page, DEFAULT_PAGE_SIZE
+from aggregate_snapshot import AggregateSnapshot
+from ledger_snapshot import stage_expenses
+from income_service import IncomeService
 
 class ExpenseService:
     
@@ -11,10 +17,34 @@ class ExpenseService:
     def get_all_expenses(db: Session, user_id: int):
         return db.query(Expense).filter(Expense.user_id == user_id).order_by(Expense.date.desc()).all()
     
+    @staticmethod
+    def get_expenses_page(db: Session, user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                          before: str = None, after: str = None, start_date=None, end_date=None,
+                          category: str = None, min_amount: float = None, max_amount: float = None,
+                          group_id: int = None):
+        """One newest-first page of expenses; filters are applied in SQL on the (user_id, ...) indexes"""
+        query = db.query(Expense).filter(Expense.user_id == user_id)
+        if start_date:
+            query = query.filter(Expense.date >= start_date)
+        if end_date:
+            query = query.filter(Expense.date <= end_date)
+        if category:
+            query = query.filter(Expense.category == category)
+        if min_amount is not None:
+            query = query.filter(Expense.amount >= min_amount)
+        if max_amount is not None:
+            query = query.filter(Expense.amount <= max_amount)
+        if group_id is not None:
+            query = query.filter(Expense.group_id == group_id)
+        return keyset_page(query, Expense.date, Expense.id, limit, before, after)
+    
     @staticmethod
     def create_expense(db: Session, amount: float, category: str, date, note: str, user_id: int):
         expense = Expense(amount=amount, category=category, date=date, note=note, user_id=user_id)
         db.add(expense)
+        RollupService.record_expense(db, user_id, category, date, amount)
+        db.flush()
+        stage_expenses(db, [expense])
         db.commit()
         db.refresh(expense)
         return expense
@@ -23,6 +53,11 @@ class ExpenseService:
     def update_expense(db: Session, expense_id: int, amount: float, category: str, date, note: str, user_id: int):
         expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user_id).first()
         if expense:
+            RollupService.replace_expense(
+                db, user_id,
+                old=(expense.category, expense.date, expense.amount),
+                new=(category, date, amount)
+            )
             expense.amount = amount
             expense.category = category
             expense.date = date
@@ -35,6 +70,9 @@ class ExpenseService:
     def delete_expense(db: Session, expense_id: int, user_id: int):
         expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == user_id).first()
         if expense:
+            RollupService.remove_expense(db, user_id, expense.category, expense.date, expense.amount)
+            # Its splits are cascade-deleted, so take them out of the group balances
+            GroupBalanceService.remove_splits(db, expense)
             db.delete(expense)
             db.commit()
             return True
@@ -44,6 +82,9 @@ class BudgetService:
     
     @staticmethod
     def get_all_budgets(db: Session, user_id: int):
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot:
+            return snapshot.budgets
         return db.query(Budget).filter(Budget.user_id == user_id).all()
     
     @staticmethod
@@ -54,6 +95,7 @@ class BudgetService:
         else:
             budget = Budget(category=category, amount=amount, user_id=user_id)
             db.add(budget)
+        mark_ledger_changed(db, user_id)
         db.commit()
         db.refresh(budget)
         return budget
@@ -67,37 +109,23 @@ class AnalyticsService:
         current_month_start = now.replace(day=1)
         
         # Category-wise spending for current month
-        category_spending = db.query(
-            Expense.category,
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= current_month_start
-        ).group_by(Expense.category).all()
-        
-        category_data = [{"category": cat, "amount": float(total)} for cat, total in category_spending]
+        category_totals = RollupService.get_category_totals(db, user_id, month_key(current_month_start))
+        category_data = [{"category": cat, "amount": data["total"]} for cat, data in category_totals.items()]
         
         # Monthly trend for last 6 months
         six_months_ago = current_month_start - relativedelta(months=5)
-        monthly_spending = db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= six_months_ago
-        ).group_by('year', 'month').order_by('year', 'month').all()
+        monthly_spending = RollupService.get_monthly_totals(db, user_id, month_key(six_months_ago))
         
         monthly_data = []
-        for year, month, total in monthly_spending:
-            month_name = datetime(int(year), int(month), 1).strftime('%b %Y')
-            monthly_data.append({"month": month_name, "amount": float(total)})
+        for month, total in monthly_spending:
+            month_name = datetime.strptime(month, '%Y-%m').strftime('%b %Y')
+            monthly_data.append({"month": month_name, "amount": total})
         
         # Total spending current month
         total_current_month = sum(item['amount'] for item in category_data)
         
         # Budget alerts
-        budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
+        budgets = BudgetService.get_all_budgets(db, user_id)
         budget_alerts = []
         for budget in budgets:
             spent = next((item['amount'] for item in category_data if item['category'] == budget.category), 0)
@@ -116,35 +144,47 @@ class AnalyticsService:
             "budget_alerts": budget_alerts
         }
     
+    @staticmethod
+    def get_financial_summary(db: Session, user_id: int):
+        """Current month income vs. expenses with the income breakdown."""
+        now = datetime.now()
+        current_month_start = now.replace(day=1)
+        
+        # Get current month income and expenses
+        total_income = IncomeService.get_total_income(db, user_id, current_month_start)
+        total_expenses = RollupService.get_total(db, user_id, month_key(current_month_start))
+        
+        net_balance = total_income - total_expenses
+        savings_rate = (net_balance / total_income * 100) if total_income > 0 else 0
+        
+        # Get income breakdown
+        income_breakdown = IncomeService.get_income_by_category(db, user_id, current_month_start)
+        
+        return {
+            "total_income": total_income,
+            "total_expenses": total_expenses,
+            "net_balance": net_balance,
+            "savings_rate": round(savings_rate, 2),
+            "month": now.strftime('%B %Y'),
+            "income_breakdown": income_breakdown
+        }
+    
     @staticmethod
     def get_insights(db: Session, user_id: int):
         """Generate AI-powered spending insights."""
         now = datetime.now()
         current_month_start = now.replace(day=1)
         last_month_start = (current_month_start - relativedelta(months=1))
-        last_month_end = current_month_start - timedelta(days=1)
         
         # Current month spending by category
-        current_spending = db.query(
-            Expense.category,
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= current_month_start
-        ).group_by(Expense.category).all()
+        current_spending = RollupService.get_category_totals(db, user_id, month_key(current_month_start))
         
         # Last month spending by category
-        last_spending = db.query(
-            Expense.category,
-            func.sum(Expense.amount).label('total')
-        ).filter(
-            Expense.user_id == user_id,
-            Expense.date >= last_month_start,
-            Expense.date <= last_month_end
-        ).group_by(Expense.category).all()
-        
-        current_dict = {cat: float(total) for cat, total in current_spending}
-        last_dict = {cat: float(total) for cat, total in last_spending}
+        last_month = month_key(last_month_start)
+        last_spending = RollupService.get_category_totals(db, user_id, last_month, last_month)
+        
+        current_dict = {cat: data["total"] for cat, data in current_spending.items()}
+        last_dict = {cat: data["total"] for cat, data in last_spending.items()}
         
         insights = []
         
@@ -170,7 +210,7 @@ class AnalyticsService:
                     })
         
         # Budget-based insights
-        budgets = db.query(Budget).filter(Budget.user_id == user_id).all()
+        budgets = BudgetService.get_all_budgets(db, user_id)
         for budget in budgets:
             spent = current_dict.get(budget.category, 0)
             if spent > budget.amount:
@@ -4,11 +4,17 @@ Handles expense splitting logic and settlement tracking
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import and_, or_
 from models import ExpenseSplit, Expense, User, GroupMember
+from group_balance_service import GroupBalanceService
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from collections import defaultdict
 from enum import Enum
+import heapq
+
+# Larger groups fall back to one greedy pass (at most n-1 transfers)
+EXACT_SETTLE_LIMIT = 12
 
 
 class SplitType(str, Enum):
@@ -47,7 +53,8 @@ class SplitService:
             else:
                 raise PermissionError("Not authorized to split this expense")
         
-        # Delete existing splits
+        # Delete existing splits (and their share of the group balances)
+        GroupBalanceService.remove_splits(db, expense)
         db.query(ExpenseSplit).filter(ExpenseSplit.expense_id == expense_id).delete()
         
         # Calculate amounts based on split type
@@ -96,6 +103,9 @@ class SplitService:
                     db.add(split_record)
                     split_records.append(split_record)
         
+        GroupBalanceService.apply_deltas(db, GroupBalanceService.collect_deltas(
+            (expense.group_id, record.user_id, expense.user_id, record.amount_owed) for record in split_records
+        ))
         db.commit()
         for record in split_records:
             db.refresh(record)
@@ -114,6 +124,10 @@ class SplitService:
         if split.user_id != user_id and expense.user_id != user_id:
             raise PermissionError("Not authorized to settle this split")
         
+        if not split.is_settled:
+            GroupBalanceService.apply_deltas(db, GroupBalanceService.collect_deltas(
+                [(expense.group_id, split.user_id, expense.user_id, split.amount_owed)], sign=-1
+            ))
         split.is_settled = True
         split.settled_at = datetime.utcnow()
         db.commit()
@@ -122,10 +136,8 @@ class SplitService:
         return split
     
     @staticmethod
-    def get_user_balances(db: Session, group_id: int, user_id: int) -> Dict:
-        """Get balance summary for user in a group"""
-        # Verify membership
-        membership = db.query(GroupMember).filter(
+    def _require_membership(db: Session, group_id: int, user_id: int) -> None:
+        membership = db.query(GroupMember.id).filter(
             and_(
                 GroupMember.group_id == group_id,
                 GroupMember.user_id == user_id
@@ -134,57 +146,37 @@ class SplitService:
         
         if not membership:
             raise PermissionError("Not a member of this group")
-        
-        # Get all group expenses
-        group_expenses = db.query(Expense).filter(Expense.group_id == group_id).all()
-        expense_ids = [e.id for e in group_expenses]
-        
-        # Amount user owes to others
-        owes = db.query(
-            Expense.user_id,
-            func.sum(ExpenseSplit.amount_owed).label('total')
-        ).join(
-            Expense, ExpenseSplit.expense_id == Expense.id
-        ).filter(
-            and_(
-                ExpenseSplit.user_id == user_id,
-                ExpenseSplit.is_settled == False,
-                Expense.id.in_(expense_ids)
-            )
-        ).group_by(Expense.user_id).all()
-        
-        # Amount others owe to user
-        owed = db.query(
-            ExpenseSplit.user_id,
-            func.sum(ExpenseSplit.amount_owed).label('total')
-        ).join(
-            Expense, ExpenseSplit.expense_id == Expense.id
-        ).filter(
-            and_(
-                Expense.user_id == user_id,
-                ExpenseSplit.is_settled == False,
-                Expense.id.in_(expense_ids)
-            )
-        ).group_by(ExpenseSplit.user_id).all()
-        
-        # Format results
-        owes_list = []
-        for creditor_id, amount in owes:
-            creditor = db.query(User).filter(User.id == creditor_id).first()
-            owes_list.append({
-                "user_id": creditor_id,
-                "email": creditor.email if creditor else "Unknown",
-                "amount": float(amount)
-            })
-        
-        owed_list = []
-        for debtor_id, amount in owed:
-            debtor = db.query(User).filter(User.id == debtor_id).first()
-            owed_list.append({
-                "user_id": debtor_id,
-                "email": debtor.email if debtor else "Unknown",
-                "amount": float(amount)
-            })
+    
+    @staticmethod
+    def get_balance_matrix(db: Session, group_id: int, user_id: Optional[int] = None) -> Dict[Tuple[int, int], float]:
+        """
+        Unsettled amounts in a group as {(debtor_id, creditor_id): amount}, read
+        from the group_balances ledger. Pass user_id to keep only the pairs that
+        user is part of.
+        """
+        return GroupBalanceService.get_matrix(db, group_id, user_id)
+    
+    @staticmethod
+    def _emails(db: Session, user_ids) -> Dict[int, str]:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+        return dict(db.query(User.id, User.email).filter(User.id.in_(user_ids)).all())
+    
+    @staticmethod
+    def _balance_summary(group_id: int, user_id: int, matrix: Dict[Tuple[int, int], float],
+                         emails: Dict[int, str]) -> Dict:
+        """One member's view of the matrix, in the get_user_balances format"""
+        owes_list = [
+            {"user_id": creditor_id, "email": emails.get(creditor_id, "Unknown"), "amount": amount}
+            for (debtor_id, creditor_id), amount in sorted(matrix.items(), key=lambda item: item[0][1])
+            if debtor_id == user_id
+        ]
+        owed_list = [
+            {"user_id": debtor_id, "email": emails.get(debtor_id, "Unknown"), "amount": amount}
+            for (debtor_id, creditor_id), amount in sorted(matrix.items())
+            if creditor_id == user_id
+        ]
         
         total_owes = sum(item['amount'] for item in owes_list)
         total_owed = sum(item['amount'] for item in owed_list)
@@ -200,88 +192,191 @@ class SplitService:
             "net_balance": round(net_balance, 2)
         }
     
+    @staticmethod
+    def get_user_balances(db: Session, group_id: int, user_id: int) -> Dict:
+        """Get balance summary for user in a group"""
+        SplitService._require_membership(db, group_id, user_id)
+        
+        matrix = SplitService.get_balance_matrix(db, group_id, user_id)
+        emails = SplitService._emails(db, [uid for pair in matrix for uid in pair])
+        return SplitService._balance_summary(group_id, user_id, matrix, emails)
+    
     @staticmethod
     def get_group_balances(db: Session, group_id: int, user_id: int) -> List[Dict]:
         """Get all balances in a group"""
-        # Verify membership
-        membership = db.query(GroupMember).filter(
-            and_(
-                GroupMember.group_id == group_id,
-                GroupMember.user_id == user_id
-            )
-        ).first()
+        SplitService._require_membership(db, group_id, user_id)
         
-        if not membership:
-            raise PermissionError("Not a member of this group")
+        # Members with their emails, then every pairwise balance at once
+        members = db.query(GroupMember.user_id, User.email).outerjoin(
+            User, User.id == GroupMember.user_id
+        ).filter(GroupMember.group_id == group_id).order_by(GroupMember.id).all()
+        matrix = SplitService.get_balance_matrix(db, group_id)
         
-        # Get all members
-        members = db.query(GroupMember).filter(GroupMember.group_id == group_id).all()
+        emails = {member_id: email for member_id, email in members if email}
+        # Counterparties who have since left the group
+        emails.update(SplitService._emails(db, {uid for pair in matrix for uid in pair} - set(emails)))
         
         balances = []
-        for member in members:
-            try:
-                balance = SplitService.get_user_balances(db, group_id, member.user_id)
-                user = db.query(User).filter(User.id == member.user_id).first()
-                balance['email'] = user.email if user else "Unknown"
-                balances.append(balance)
-            except:
-                continue
+        for member_id, email in members:
+            balance = SplitService._balance_summary(group_id, member_id, matrix, emails)
+            balance['email'] = email or "Unknown"
+            balances.append(balance)
         
         return balances
     
+    @staticmethod
+    def get_settle_plan(db: Session, group_id: int, user_id: int) -> Dict:
+        """
+        Fewest transfers that clear every unsettled split in the group.
+        Only each member's net position matters, so debts can be rerouted
+        (if A owes B and B owes C, A can pay C directly).
+        """
+        SplitService._require_membership(db, group_id, user_id)
+        
+        matrix = SplitService.get_balance_matrix(db, group_id)
+        
+        # Net position in paise: positive = is owed money, negative = owes
+        net = defaultdict(int)
+        for (debtor_id, creditor_id), amount in matrix.items():
+            cents = int(round(amount * 100))
+            net[debtor_id] -= cents
+            net[creditor_id] += cents
+        balances = {uid: cents for uid, cents in sorted(net.items()) if cents != 0}
+        
+        transfers = [
+            (debtor_id, creditor_id, cents)
+            for group in SplitService._zero_sum_groups(balances)
+            for debtor_id, creditor_id, cents in SplitService._settle_greedy(group)
+        ]
+        emails = SplitService._emails(db, balances)
+        
+        return {
+            "group_id": group_id,
+            "transfers": [
+                {
+                    "from_user_id": debtor_id,
+                    "from_email": emails.get(debtor_id, "Unknown"),
+                    "to_user_id": creditor_id,
+                    "to_email": emails.get(creditor_id, "Unknown"),
+                    "amount": cents / 100
+                }
+                for debtor_id, creditor_id, cents in transfers
+            ],
+            "transfer_count": len(transfers),
+            "outstanding_debts": sum(1 for (debtor_id, creditor_id) in matrix if debtor_id != creditor_id),
+            "total_amount": sum(cents for _, _, cents in transfers) / 100
+        }
+    
+    @staticmethod
+    def _zero_sum_groups(balances: Dict[int, int]) -> List[Dict[int, int]]:
+        """
+        Split non-zero balances into the most subsets that each sum to zero.
+        A subset of k people settles in k-1 transfers, so more subsets means
+        fewer transfers. Exact (subset DP) up to EXACT_SETTLE_LIMIT people;
+        beyond that everyone is settled as one group.
+        """
+        people = list(balances)
+        n = len(people)
+        if n == 0:
+            return []
+        if n > EXACT_SETTLE_LIMIT:
+            return [balances]
+        
+        full = (1 << n) - 1
+        totals = [0] * (full + 1)
+        for mask in range(1, full + 1):
+            low = mask & -mask
+            totals[mask] = totals[mask ^ low] + balances[people[low.bit_length() - 1]]
+        
+        # best[mask] = most zero-sum subsets mask can be split into; removing one
+        # person at a time, every zero-sum mask on the way closes a subset
+        best = [0] * (full + 1)
+        for mask in range(1, full + 1):
+            best[mask] = max(best[mask ^ (1 << i)] for i in range(n) if mask >> i & 1) + (totals[mask] == 0)
+        
+        groups, current, mask = [], {}, full
+        while mask:
+            target = best[mask] - (totals[mask] == 0)
+            i = next(i for i in range(n) if mask >> i & 1 and best[mask ^ (1 << i)] == target)
+            current[people[i]] = balances[people[i]]
+            mask ^= 1 << i
+            if totals[mask] == 0:
+                groups.append(current)
+                current = {}
+        return groups
+    
+    @staticmethod
+    def _settle_greedy(balances: Dict[int, int]) -> List[Tuple[int, int, int]]:
+        """Largest debtor pays largest creditor until everyone is square"""
+        creditors = [(-cents, uid) for uid, cents in balances.items() if cents > 0]
+        debtors = [(cents, uid) for uid, cents in balances.items() if cents < 0]
+        heapq.heapify(creditors)
+        heapq.heapify(debtors)
+        
+        transfers = []
+        while creditors and debtors:
+            credit, creditor_id = heapq.heappop(creditors)
+            debt, debtor_id = heapq.heappop(debtors)
+            amount = min(-credit, -debt)
+            transfers.append((debtor_id, creditor_id, amount))
+            if -credit > amount:
+                heapq.heappush(creditors, (credit + amount, creditor_id))
+            if -debt > amount:
+                heapq.heappush(debtors, (debt + amount, debtor_id))
+        return transfers
+    
     @staticmethod
     def get_user_splits(db: Session, user_id: int) -> Dict:
         """Get all splits for a user across all groups"""
-        # Splits user owes
-        owes_splits = db.query(ExpenseSplit).filter(
+        # Splits user owes, each joined to its expense and the payer's email
+        owes_rows = db.query(ExpenseSplit, Expense, User.email).join(
+            Expense, ExpenseSplit.expense_id == Expense.id
+        ).outerjoin(
+            User, User.id == Expense.user_id
+        ).filter(
             and_(
                 ExpenseSplit.user_id == user_id,
                 ExpenseSplit.is_settled == False
             )
-        ).all()
+        ).order_by(ExpenseSplit.id).all()
         
         owes_list = []
-        for split in owes_splits:
-            expense = db.query(Expense).filter(Expense.id == split.expense_id).first()
-            if expense:
-                payer = db.query(User).filter(User.id == expense.user_id).first()
-                owes_list.append({
-                    "split_id": split.id,
-                    "expense_id": expense.id,
-                    "amount": split.amount_owed,
-                    "category": expense.category,
-                    "date": expense.date.isoformat(),
-                    "note": expense.note,
-                    "paid_by": payer.email if payer else "Unknown",
-                    "paid_by_id": expense.user_id
-                })
-        
-        # Splits owed to user
-        user_expenses = db.query(Expense).filter(Expense.user_id == user_id).all()
-        expense_ids = [e.id for e in user_expenses]
+        for split, expense, payer_email in owes_rows:
+            owes_list.append({
+                "split_id": split.id,
+                "expense_id": expense.id,
+                "amount": split.amount_owed,
+                "category": expense.category,
+                "date": expense.date.isoformat(),
+                "note": expense.note,
+                "paid_by": payer_email or "Unknown",
+                "paid_by_id": expense.user_id
+            })
         
-        owed_splits = db.query(ExpenseSplit).filter(
+        # Splits owed to user: splits on the user's own expenses, with each debtor's email
+        owed_rows = db.query(ExpenseSplit, Expense, User.email).join(
+            Expense, ExpenseSplit.expense_id == Expense.id
+        ).outerjoin(
+            User, User.id == ExpenseSplit.user_id
+        ).filter(
             and_(
-                ExpenseSplit.expense_id.in_(expense_ids),
+                Expense.user_id == user_id,
                 ExpenseSplit.is_settled == False
             )
-        ).all()
+        ).order_by(ExpenseSplit.id).all()
         
         owed_list = []
-        for split in owed_splits:
-            expense = db.query(Expense).filter(Expense.id == split.expense_id).first()
-            debtor = db.query(User).filter(User.id == split.user_id).first()
-            if expense:
-                owed_list.append({
-                    "split_id": split.id,
-                    "expense_id": expense.id,
-                    "amount": split.amount_owed,
-                    "category": expense.category,
-                    "date": expense.date.isoformat(),
-                    "note": expense.note,
-                    "owed_by": debtor.email if debtor else "Unknown",
-                    "owed_by_id": split.user_id
-                })
+        for split, expense, debtor_email in owed_rows:
+            owed_list.append({
+                "split_id": split.id,
+                "expense_id": expense.id,
+                "amount": split.amount_owed,
+                "category": expense.category,
+                "date": expense.date.isoformat(),
+                "note": expense.note,
+                "owed_by": debtor_email or "Unknown",
+                "owed_by_id": split.user_id
+            })
         
         return {
             "owes": owes_list,
@@ -0,0 +1,210 @@
+"""
+Serialized SQLite Writer
+Routes write jobs through one dedicated connection and commits them in groups.
+
+SQLite allows a single writer at a time. When request threads write through
+their own connections they race for the lock and fail with "database is
+locked". Here every job runs on the writer thread. Each job gets its own
+SAVEPOINT, so a failing job only rolls back itself. Everything queued
+together is committed in one transaction, so throughput follows batch size
+instead of commit count. Readers keep using the normal pool and are never
+blocked in WAL mode.
+
+Every write made while the server runs goes through run_write, run_write_async
+or submit_write. The only writers on their own connections are the offline
+scripts (migrate_database, backfill_*, seed_data, create_test_users). They
+run before the server starts, and busy_timeout covers any overlap.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from database import SQLALCHEMY_DATABASE_URL, IS_SQLITE, SessionLocal, apply_sqlite_pragmas
+from response_cache import commit_ledger_changes, pop_ledger_changes
+from ledger_snapshot import move_staged
+
+MAX_BATCH = int(os.environ.get("SQLITE_WRITER_MAX_BATCH", 64))
+# Optional wait for more jobs before committing a batch (ms)
+LINGER_MS = float(os.environ.get("SQLITE_WRITER_LINGER_MS", 0))
+
+ENABLED = (
+    IS_SQLITE
+    and os.environ.get("SQLITE_WRITER", "1").lower() not in ("0", "false", "off")
+    and SQLALCHEMY_DATABASE_URL != "sqlite://"
+    and ":memory:" not in SQLALCHEMY_DATABASE_URL
+)
+
+
+class SQLiteWriter:
+    """Single background thread that owns the only write connection"""
+
+    def __init__(self, url: str):
+        self._url = url
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+
+    def _create_engine(self):
+        writer_engine = create_engine(
+            self._url,
+            connect_args={"check_same_thread": False},
+            pool_size=1,
+            max_overflow=0
+        )
+
+        # pysqlite's implicit transactions break SAVEPOINT handling; take the
+        # write lock explicitly with BEGIN IMMEDIATE instead
+        @event.listens_for(writer_engine, "connect")
+        def _connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+            apply_sqlite_pragmas(dbapi_connection)
+
+        @event.listens_for(writer_engine, "begin")
+        def _begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        return writer_engine
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, job: Callable[[Session], object]) -> Future:
+        """Queue job(session) for the writer; the future resolves after its batch commits"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def run(self, job: Callable[[Session], object]):
+        """Submit and wait for the result (for sync endpoints)"""
+        return self.submit(job).result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < MAX_BATCH:
+            try:
+                if LINGER_MS:
+                    batch.append(self._queue.get(timeout=LINGER_MS / 1000))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        writer_engine = self._create_engine()
+        with writer_engine.connect() as conn:
+            while True:
+                batch = self._next_batch()
+                try:
+                    self._write_batch(conn, batch)
+                except Exception as e:
+                    # BEGIN IMMEDIATE (e.g. "database is locked" past busy_timeout)
+                    # or the group commit failed: nothing in the batch was written
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _write_batch(self, conn, batch):
+        results = []
+        changed_ledgers = set()
+        batch_info = {}
+
+        with conn.begin():
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # Service code calls db.commit(); with create_savepoint that only
+                # releases the job's savepoint, the batch commits below
+                session = Session(
+                    bind=conn,
+                    join_transaction_mode="create_savepoint",
+                    autoflush=False,
+                    expire_on_commit=False
+                )
+                try:
+                    result = job(session)
+                    changed = pop_ledger_changes(session)
+                    move_staged(session.info, batch_info)
+                except Exception as e:
+                    session.rollback()
+                    results.append((future, None, e))
+                else:
+                    changed_ledgers |= changed
+                    results.append((future, result, None))
+                finally:
+                    session.close()
+
+        # Only now is the batch durable and visible to readers. A failing hook
+        # must not strand callers whose writes are already committed
+        try:
+            commit_ledger_changes(changed_ledgers, batch_info)
+        except Exception as e:
+            print(f"⚠️  Ledger commit hooks failed after a write batch: {e}")
+
+        self.batches += 1
+        self.jobs += len(results)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+writer = SQLiteWriter(SQLALCHEMY_DATABASE_URL) if ENABLED else None
+
+
+def _run_on_session(db: Session, job: Callable[[Session], object]):
+    # Same contract as the writer's per-job savepoint: a failed job leaves
+    # nothing pending, so the next write on this session can't commit it
+    try:
+        return job(db)
+    except Exception:
+        db.rollback()
+        raise
+
+
+def run_write(db: Session, job: Callable[[Session], object]):
+    """Run job(session) on the serialized writer when enabled, otherwise on the request session"""
+    if writer is None:
+        return _run_on_session(db, job)
+    return writer.run(job)
+
+
+async def run_write_async(db: Session, job: Callable[[Session], object]):
+    """run_write for async endpoints: waits on the writer without blocking the event loop"""
+    if writer is None:
+        return _run_on_session(db, job)
+    return await asyncio.wrap_future(writer.submit(job))
+
+
+def submit_write(job: Callable[[Session], object]) -> None:
+    """
+    Fire-and-forget write (e.g. persisting a derived cache row). Queued on the
+    writer when enabled; otherwise run now in its own session so the caller's
+    read session is never committed mid-request. Failures are dropped: the
+    row is recomputed on the next read.
+    """
+    if writer is not None:
+        writer.submit(job)
+        return
+    db = SessionLocal()
+    try:
+        job(db)
+    except Exception:
+        db.rollback()
+    finally:
+        db.close()
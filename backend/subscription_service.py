@@ -6,8 +6,20 @@ Handles FREE/PRO plan management and access control
 from sqlalchemy.orm import Session
 from models import Subscription, User, PlanType, SubscriptionStatus
 from datetime import datetime, timedelta
-from typing import Optional, Dict
-from fastapi import HTTPException, status
+from typing import Callable, Optional, Dict
+from fastapi import Depends, HTTPException, status
+import os
+from auth import invalidate_principal, get_current_user, Principal
+from cache import TTLCache
+from sqlite_writer import run_write
+
+# user_id -> PlanType. Invalidated on every plan change in this process; the TTL
+# bounds how long other workers can serve a stale plan.
+plan_cache = TTLCache(
+    maxsize=int(os.environ.get("PLAN_CACHE_SIZE", 10000)),
+    ttl=int(os.environ.get("PLAN_CACHE_TTL", 60))
+)
+PLAN_CHANGED_KEY = "plan_changed"
 
 
 class SubscriptionService:
@@ -33,6 +45,31 @@ class SubscriptionService:
         "max_goals": 999,  # Unlimited goals
     }
     
+    @staticmethod
+    def invalidate(user_id: int):
+        """Forget cached plan and principal after a subscription change"""
+        plan_cache.pop(user_id)
+        invalidate_principal(user_id)
+    
+    @staticmethod
+    def _plan_changed(db: Session, user_id: int):
+        # Also recorded on the session, so run_plan_write can invalidate again once committed
+        db.info.setdefault(PLAN_CHANGED_KEY, set()).add(user_id)
+        SubscriptionService.invalidate(user_id)
+    
+    @staticmethod
+    def get_plan(db: Session, user_id: int) -> PlanType:
+        """Current plan, served from plan_cache; users without a subscription are FREE"""
+        plan = plan_cache.get(user_id)
+        if plan is None:
+            plan = db.query(Subscription.plan_type).filter(Subscription.user_id == user_id).scalar() or PlanType.FREE
+            plan_cache.set(user_id, plan)
+        return plan
+    
+    @staticmethod
+    def features_for(plan: PlanType) -> Dict:
+        return SubscriptionService.PRO_FEATURES if plan == PlanType.PRO else SubscriptionService.FREE_LIMITS
+    
     @staticmethod
     def create_subscription(db: Session, user_id: int, plan_type: PlanType = PlanType.FREE) -> Subscription:
         """Create subscription for new user"""
@@ -49,6 +86,7 @@ class SubscriptionService:
         db.add(subscription)
         db.commit()
         db.refresh(subscription)
+        SubscriptionService._plan_changed(db, user_id)
         
         return subscription
     
@@ -78,6 +116,7 @@ class SubscriptionService:
         
         db.commit()
         db.refresh(subscription)
+        SubscriptionService._plan_changed(db, user_id)
         
         return subscription
     
@@ -95,45 +134,24 @@ class SubscriptionService:
         
         db.commit()
         db.refresh(subscription)
+        SubscriptionService._plan_changed(db, user_id)
         
         return subscription
     
     @staticmethod
     def check_feature_access(db: Session, user_id: int, feature: str) -> bool:
         """Check if user has access to a feature"""
-        subscription = SubscriptionService.get_subscription(db, user_id)
-        
-        if not subscription or subscription.plan_type == PlanType.FREE:
-            return SubscriptionService.FREE_LIMITS.get(feature, False)
-        
-        return SubscriptionService.PRO_FEATURES.get(feature, True)
+        return PlanAccess(SubscriptionService.get_plan(db, user_id)).allows(feature)
     
     @staticmethod
     def get_plan_limits(db: Session, user_id: int) -> Dict:
         """Get plan limits for user"""
-        subscription = SubscriptionService.get_subscription(db, user_id)
-        
-        if not subscription or subscription.plan_type == PlanType.FREE:
-            return {
-                "plan": "FREE",
-                "limits": SubscriptionService.FREE_LIMITS
-            }
-        
-        return {
-            "plan": "PRO",
-            "limits": SubscriptionService.PRO_FEATURES
-        }
+        return PlanAccess(SubscriptionService.get_plan(db, user_id)).limits()
     
     @staticmethod
     def require_pro(db: Session, user_id: int, feature_name: str = "this feature"):
         """Middleware helper to require PRO plan"""
-        subscription = SubscriptionService.get_subscription(db, user_id)
-        
-        if not subscription or subscription.plan_type != PlanType.PRO:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"PRO plan required to access {feature_name}. Please upgrade your subscription."
-            )
+        PlanAccess(SubscriptionService.get_plan(db, user_id)).require_pro(feature_name)
     
     @staticmethod
     def get_subscription_status(db: Session, user_id: int) -> Dict:
@@ -142,7 +160,7 @@ class SubscriptionService:
         
         if not subscription:
             # Create default FREE subscription
-            subscription = SubscriptionService.create_subscription(db, user_id)
+            subscription = run_write(db, lambda session: SubscriptionService.create_subscription(session, user_id))
         
         return {
             "user_id": user_id,
@@ -150,12 +168,33 @@ class SubscriptionService:
             "status": subscription.status.value,
             "start_date": subscription.start_date.isoformat() if subscription.start_date else None,
             "end_date": subscription.end_date.isoformat() if subscription.end_date else None,
-            "features": SubscriptionService.PRO_FEATURES if subscription.plan_type == PlanType.PRO else SubscriptionService.FREE_LIMITS,
+            "features": SubscriptionService.features_for(subscription.plan_type),
             "stripe_customer_id": subscription.stripe_customer_id,
             "stripe_subscription_id": subscription.stripe_subscription_id
         }
 
 
+def run_plan_write(db: Session, job: Callable[[Session], object]):
+    """
+    run_write for plan changes. On the SQLite writer the service's invalidation
+    runs before the batch commits, so a concurrent request could cache the old
+    plan again; the changed users are invalidated once more after the commit.
+    """
+    changed = set()
+
+    def tracked(session: Session):
+        try:
+            return job(session)
+        finally:
+            changed.update(session.info.pop(PLAN_CHANGED_KEY, ()))
+
+    try:
+        return run_write(db, tracked)
+    finally:
+        for user_id in changed:
+            SubscriptionService.invalidate(user_id)
+
+
 # Dependency for FastAPI routes
 def get_subscription_or_create(db: Session, user_id: int) -> Subscription:
     """Get or create subscription for user"""
@@ -163,3 +202,31 @@ def get_subscription_or_create(db: Session, user_id: int) -> Subscription:
     if not subscription:
         subscription = SubscriptionService.create_subscription(db, user_id)
     return subscription
+
+
+class PlanAccess:
+    """A user's resolved plan; feature checks against it are dict lookups"""
+    
+    def __init__(self, plan: PlanType):
+        self.plan = plan
+        self.features = SubscriptionService.features_for(plan)
+    
+    def allows(self, feature: str) -> bool:
+        if self.plan == PlanType.PRO:
+            return self.features.get(feature, True)
+        return self.features.get(feature, False)
+    
+    def limits(self) -> Dict:
+        return {"plan": self.plan.value.upper(), "limits": self.features}
+    
+    def require_pro(self, feature_name: str = "this feature"):
+        if self.plan != PlanType.PRO:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"PRO plan required to access {feature_name}. Please upgrade your subscription."
+            )
+
+
+def get_plan_access(current_user: Principal = Depends(get_current_user)) -> PlanAccess:
+    """FastAPI dependency: the plan is resolved once per request with the principal"""
+    return PlanAccess(current_user.plan)
@@ -5,7 +5,11 @@ Handles Assets, Liabilities, Net Worth, and Financial Goals
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from models import Asset, Liability, FinancialGoal, Income, Expense
+from models import Asset, Liability, FinancialGoal
+from rollup_service import RollupService, month_key
+from response_cache import mark_ledger_changed
+from income_service import IncomeService
+from aggregate_snapshot import AggregateSnapshot
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from typing import Dict, List, Optional
@@ -26,6 +30,7 @@ class AssetService:
             user_id=user_id
         )
         db.add(asset)
+        mark_ledger_changed(db, user_id)
         db.commit()
         db.refresh(asset)
         return asset
@@ -44,6 +49,7 @@ class AssetService:
             asset.category = category
             asset.date = asset_date
             asset.note = note
+            mark_ledger_changed(db, user_id)
             db.commit()
             db.refresh(asset)
         return asset
@@ -53,17 +59,24 @@ class AssetService:
         asset = db.query(Asset).filter(Asset.id == asset_id, Asset.user_id == user_id).first()
         if asset:
             db.delete(asset)
+            mark_ledger_changed(db, user_id)
             db.commit()
             return True
         return False
     
     @staticmethod
     def get_total_assets(db: Session, user_id: int) -> float:
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot:
+            return snapshot.get_total_assets()
         total = db.query(func.sum(Asset.value)).filter(Asset.user_id == user_id).scalar()
         return float(total) if total else 0.0
     
     @staticmethod
     def get_assets_by_category(db: Session, user_id: int) -> Dict:
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot:
+            return snapshot.assets_by_category
         assets = db.query(
             Asset.category,
             func.sum(Asset.value).label('total')
@@ -89,6 +102,7 @@ class LiabilityService:
             user_id=user_id
         )
         db.add(liability)
+        mark_ledger_changed(db, user_id)
         db.commit()
         db.refresh(liability)
         return liability
@@ -112,6 +126,7 @@ class LiabilityService:
             liability.interest_rate = interest_rate
             liability.date = liability_date
             liability.note = note
+            mark_ledger_changed(db, user_id)
             db.commit()
             db.refresh(liability)
         return liability
@@ -124,17 +139,24 @@ class LiabilityService:
         ).first()
         if liability:
             db.delete(liability)
+            mark_ledger_changed(db, user_id)
             db.commit()
             return True
         return False
     
     @staticmethod
     def get_total_liabilities(db: Session, user_id: int) -> float:
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot:
+            return snapshot.get_total_liabilities()
         total = db.query(func.sum(Liability.amount)).filter(Liability.user_id == user_id).scalar()
         return float(total) if total else 0.0
     
     @staticmethod
     def get_liabilities_by_category(db: Session, user_id: int) -> Dict:
+        snapshot = AggregateSnapshot.active(db, user_id)
+        if snapshot:
+            return snapshot.liabilities_by_category
         liabilities = db.query(
             Liability.category,
             func.sum(Liability.amount).label('total')
@@ -158,15 +180,9 @@ class NetWorthService:
         now = datetime.now()
         month_start = now.replace(day=1)
         
-        monthly_income = db.query(func.sum(Income.amount)).filter(
-            Income.user_id == user_id,
-            Income.date >= month_start.date()
-        ).scalar() or 0
+        monthly_income = IncomeService.get_total_income(db, user_id, month_start.date())
         
-        monthly_expenses = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= month_start.date()
-        ).scalar() or 0
+        monthly_expenses = RollupService.get_total(db, user_id, month_key(month_start))
         
         # Calculate savings rate
         savings_rate = 0
@@ -177,17 +193,12 @@ class NetWorthService:
         last_month_start = month_start - relativedelta(months=1)
         last_month_end = month_start - timedelta(days=1)
         
-        last_month_income = db.query(func.sum(Income.amount)).filter(
-            Income.user_id == user_id,
-            Income.date >= last_month_start.date(),
-            Income.date <= last_month_end.date()
-        ).scalar() or 0
+        last_month_income = IncomeService.get_total_income(
+            db, user_id, last_month_start.date(), last_month_end.date()
+        )
         
-        last_month_expenses = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= last_month_start.date(),
-            Expense.date <= last_month_end.date()
-        ).scalar() or 0
+        last_month = month_key(last_month_start)
+        last_month_expenses = RollupService.get_total(db, user_id, last_month, last_month)
         
         last_month_net = last_month_income - last_month_expenses
         current_month_net = monthly_income - monthly_expenses
@@ -234,6 +245,7 @@ class GoalService:
             user_id=user_id
         )
         db.add(goal)
+        mark_ledger_changed(db, user_id)
         db.commit()
         db.refresh(goal)
         return goal
@@ -259,6 +271,7 @@ class GoalService:
             goal.deadline = deadline
             goal.category = category
             goal.status = status
+            mark_ledger_changed(db, user_id)
             db.commit()
             db.refresh(goal)
         return goal
@@ -271,6 +284,7 @@ class GoalService:
         ).first()
         if goal:
             db.delete(goal)
+            mark_ledger_changed(db, user_id)
             db.commit()
             return True
         return False
@@ -302,15 +316,9 @@ class GoalService:
         month_start = today.replace(day=1)
         last_3_months = month_start - relativedelta(months=3)
         
-        total_income = db.query(func.sum(Income.amount)).filter(
-            Income.user_id == user_id,
-            Income.date >= last_3_months
-        ).scalar() or 0
+        total_income = IncomeService.get_total_income(db, user_id, last_3_months)
         
-        total_expenses = db.query(func.sum(Expense.amount)).filter(
-            Expense.user_id == user_id,
-            Expense.date >= last_3_months
-        ).scalar() or 0
+        total_expenses = RollupService.get_total(db, user_id, month_key(last_3_months))
         
         avg_monthly_savings = (total_income - total_expenses) / 3
         
@@ -21,7 +21,7 @@ export default function AdminDashboard() {
       const [statsRes, analyticsRes, usersRes] = await Promise.all([
         adminAPI.getStats(),
         adminAPI.getAnalytics(),
-        adminAPI.getUsers(0, 50)
+        adminAPI.getUsers(50)
       ]);
 
       setStats(statsRes.data);
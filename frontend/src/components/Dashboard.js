@@ -3,10 +3,8 @@ import { motion } from 'framer-motion';
 import { PieChart, Pie, Cell, BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer, LineChart, Line } from 'recharts';
 import { TrendingUp, TrendingDown, AlertCircle, Sparkles, DollarSign, AlertTriangle, Activity } from 'lucide-react';
 import { analyticsAPI } from '../services/api';
-import axios from 'axios';
 import GlassCard from './ui/GlassCard';
 
-const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 const COLORS = ['#6366f1', '#8b5cf6', '#ec4899', '#f59e0b', '#10b981', '#3b82f6', '#14b8a6'];
 
 export default function Dashboard() {
@@ -22,33 +20,15 @@ export default function Dashboard() {
 
   const loadData = async () => {
     try {
-      const token = localStorage.getItem('token');
+      // One round trip: the backend computes every section from a single data pass
+      const { data } = await analyticsAPI.getDashboard(['summary', 'insights', 'ml_insights']);
+      setSummary(data.summary);
+      setInsights(data.insights?.insights || []);
 
-      // Load core data (required)
-      const [summaryRes, insightsRes] = await Promise.all([
-        analyticsAPI.getSummary(),
-        analyticsAPI.getInsights(),
-      ]);
-      setSummary(summaryRes.data);
-      setInsights(insightsRes.data.insights || []);
-
-      // Load ML data (optional – may fail if not enough history)
-      try {
-        const predictionRes = await axios.get(`${API_BASE_URL}/ml/predict-next-month`, {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        setPrediction(predictionRes.data);
-      } catch (e) {
-        console.warn('ML prediction unavailable:', e.message);
-      }
-
-      try {
-        const anomaliesRes = await axios.get(`${API_BASE_URL}/ml/anomalies`, {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        setAnomalies(anomaliesRes.data);
-      } catch (e) {
-        console.warn('Anomaly detection unavailable:', e.message);
+      // ML sections carry prediction and anomalies (may be empty with little history)
+      if (data.ml_insights) {
+        setPrediction(data.ml_insights.prediction);
+        setAnomalies(data.ml_insights.anomalies);
       }
     } catch (error) {
       console.error('Error loading dashboard:', error);
@@ -9,7 +9,10 @@ import toast from 'react-hot-toast';
 
 export default function ExpenseList({ refresh, onEdit }) {
   const [expenses, setExpenses] = useState([]);
+  const [summary, setSummary] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showImport, setShowImport] = useState(false);
 
   useEffect(() => {
@@ -18,8 +21,10 @@ export default function ExpenseList({ refresh, onEdit }) {
 
   const loadExpenses = async () => {
     try {
-      const res = await expenseAPI.getAll();
+      const [res, summaryRes] = await Promise.all([expenseAPI.getAll(), expenseAPI.getSummary()]);
       setExpenses(res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+      setSummary(summaryRes.data);
     } catch (error) {
       console.error('Error loading expenses:', error);
       toast.error('Failed to load expenses');
@@ -28,6 +33,20 @@ export default function ExpenseList({ refresh, onEdit }) {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const res = await expenseAPI.getAll({ before: nextCursor });
+      setExpenses((current) => [...current, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading expenses:', error);
+      toast.error('Failed to load more expenses');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (id) => {
     if (window.confirm('Are you sure you want to delete this expense?')) {
       try {
@@ -73,7 +92,7 @@ export default function ExpenseList({ refresh, onEdit }) {
           <div className="flex items-center gap-2">
             <div className="w-2 h-2 bg-indigo-400 rounded-full animate-pulse" />
             <h2 className="text-xl font-semibold text-white">Recent Expenses</h2>
-            <span className="ml-2 text-sm text-gray-400">{expenses.length} total</span>
+            <span className="ml-2 text-sm text-gray-400">{summary ? summary.count : expenses.length} total</span>
           </div>
           <Button
             onClick={() => setShowImport(true)}
@@ -93,7 +112,7 @@ export default function ExpenseList({ refresh, onEdit }) {
             initial={{ opacity: 0, y: 20 }}
             animate={{ opacity: 1, y: 0 }}
             exit={{ opacity: 0, x: -100 }}
-            transition={{ delay: index * 0.05 }}
+            transition={{ delay: Math.min(index, 20) * 0.05 }}
           >
             <GlassCard className="hover:border-indigo-500/30 transition-all">
               <div className="flex items-center justify-between gap-4">
@@ -142,6 +161,14 @@ export default function ExpenseList({ refresh, onEdit }) {
         ))}
       </AnimatePresence>
 
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button onClick={loadMore} variant="secondary" loading={loadingMore}>
+            Load more
+          </Button>
+        </div>
+      )}
+
       {/* CSV Import Modal */}
       <CSVImport
         isOpen={showImport}
@@ -10,7 +10,10 @@ const API_BASE_URL = 'http://localhost:8000';
 
 export default function IncomeList({ refresh, onEdit }) {
   const [incomes, setIncomes] = useState([]);
+  const [summary, setSummary] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadIncomes();
@@ -19,10 +22,14 @@ export default function IncomeList({ refresh, onEdit }) {
   const loadIncomes = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API_BASE_URL}/incomes`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
+      const headers = { Authorization: `Bearer ${token}` };
+      const [response, summaryResponse] = await Promise.all([
+        axios.get(`${API_BASE_URL}/incomes`, { headers }),
+        axios.get(`${API_BASE_URL}/incomes/summary`, { headers })
+      ]);
       setIncomes(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      setSummary(summaryResponse.data);
     } catch (error) {
       console.error('Error loading incomes:', error);
       toast.error('Failed to load incomes');
@@ -31,6 +38,24 @@ export default function IncomeList({ refresh, onEdit }) {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get(`${API_BASE_URL}/incomes`, {
+        params: { before: nextCursor },
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setIncomes((current) => [...current, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading incomes:', error);
+      toast.error('Failed to load more incomes');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (id) => {
     if (!window.confirm('Are you sure you want to delete this income?')) {
       return;
@@ -74,7 +99,9 @@ export default function IncomeList({ refresh, onEdit }) {
     );
   }
 
-  const totalIncome = incomes.reduce((sum, income) => sum + income.amount, 0);
+  // /incomes returns one page; the count and total cover every entry
+  const totalIncome = summary ? summary.total : incomes.reduce((sum, income) => sum + income.amount, 0);
+  const entryCount = summary ? summary.count : incomes.length;
 
   return (
     <div className="space-y-4">
@@ -83,7 +110,7 @@ export default function IncomeList({ refresh, onEdit }) {
           <div className="flex items-center gap-2">
             <div className="w-2 h-2 bg-green-400 rounded-full animate-pulse" />
             <h2 className="text-xl font-semibold text-white">Income History</h2>
-            <span className="ml-2 text-sm text-gray-400">{incomes.length} entries</span>
+            <span className="ml-2 text-sm text-gray-400">{entryCount} entries</span>
           </div>
           <div className="text-right">
             <p className="text-sm text-gray-400">Total Income</p>
@@ -100,7 +127,7 @@ export default function IncomeList({ refresh, onEdit }) {
               initial={{ opacity: 0, y: 20 }}
               animate={{ opacity: 1, y: 0 }}
               exit={{ opacity: 0, x: -100 }}
-              transition={{ delay: index * 0.05 }}
+              transition={{ delay: Math.min(index, 20) * 0.05 }}
             >
               <GlassCard className="hover-lift">
                 <div className="flex items-center justify-between">
@@ -153,6 +180,14 @@ export default function IncomeList({ refresh, onEdit }) {
           ))}
         </AnimatePresence>
       </div>
+
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button onClick={loadMore} variant="secondary" loading={loadingMore}>
+            Load more
+          </Button>
+        </div>
+      )}
     </div>
   );
 }
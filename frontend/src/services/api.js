@@ -39,7 +39,9 @@ export const authAPI = {
 };
 
 export const expenseAPI = {
-  getAll: () => api.get('/expenses'),
+  // One newest-first page; pass the previous page's X-Next-Cursor as `before`
+  getAll: (params = {}) => api.get('/expenses', { params }),
+  getSummary: () => api.get('/expenses/summary'),
   create: (data) => api.post('/expenses', data),
   update: (id, data) => api.put(`/expenses/${id}`, data),
   delete: (id) => api.delete(`/expenses/${id}`),
@@ -54,6 +56,7 @@ export const budgetAPI = {
 export const analyticsAPI = {
   getSummary: () => api.get('/analytics/summary'),
   getInsights: () => api.get('/analytics/insights'),
+  getDashboard: (fields) => api.get('/dashboard', { params: fields ? { fields: fields.join(',') } : {} }),
 };
 
 export const categoriesAPI = {
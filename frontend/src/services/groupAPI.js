@@ -29,8 +29,21 @@ export const groupAPI = {
     axios.post(`${API_URL}/groups/join`, { token }, { headers: getAuthHeader() }),
   
   // Group expenses
-  getGroupExpenses: (groupId) => 
-    axios.get(`${API_URL}/groups/${groupId}/expenses`, { headers: getAuthHeader() }),
+  // One newest-first page; pass the previous page's X-Next-Cursor as `before`
+  getGroupExpenses: (groupId, params = {}) => 
+    axios.get(`${API_URL}/groups/${groupId}/expenses`, { params, headers: getAuthHeader() }),
+  
+  // Walks every page; for views that need the whole list rather than one page
+  getAllGroupExpenses: async (groupId) => {
+    const expenses = [];
+    let before;
+    do {
+      const res = await groupAPI.getGroupExpenses(groupId, before ? { before } : {});
+      expenses.push(...res.data.expenses);
+      before = res.headers['x-next-cursor'];
+    } while (before);
+    return expenses;
+  },
   
   // Members
   removeMember: (groupId, memberId) => 
@@ -51,6 +64,9 @@ export const splitAPI = {
   getGroupBalances: (groupId) => 
     axios.get(`${API_URL}/groups/${groupId}/balances`, { headers: getAuthHeader() }),
   
+  getSettlePlan: (groupId) => 
+    axios.get(`${API_URL}/groups/${groupId}/settle-plan`, { headers: getAuthHeader() }),
+  
   getMySplits: () => 
     axios.get(`${API_URL}/splits/my-splits`, { headers: getAuthHeader() }),
 };
@@ -72,8 +88,8 @@ export const subscriptionAPI = {
 
 export const adminAPI = {
   // Admin endpoints
-  getUsers: (skip = 0, limit = 100) => 
-    axios.get(`${API_URL}/admin/users?skip=${skip}&limit=${limit}`, { headers: getAuthHeader() }),
+  getUsers: (limit = 100, params = {}) => 
+    axios.get(`${API_URL}/admin/users`, { params: { limit, ...params }, headers: getAuthHeader() }),
   
   getSubscriptionStats: () => 
     axios.get(`${API_URL}/admin/subscriptions`, { headers: getAuthHeader() }),